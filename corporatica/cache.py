@@ -0,0 +1,124 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+from django.conf import settings
+
+
+def cache_digest(*parts):
+    """Stable SHA-256 of JSON-serialisable ``parts``, used as a cache file name."""
+    payload = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class FileCache:
+    """
+    Directory of derived files with least-recently-used eviction.
+
+    Entries are named after their key and written atomically. Every hit
+    refreshes the file's mtime, so once the directory grows past
+    ``max_bytes`` the oldest entries are removed until it is back under
+    nine tenths of it, leaving room for the next writes.
+
+    The directory is only walked when needed: each process keeps a running
+    total, from its last walk plus the entries written since, and walks
+    again once that total crosses ``max_bytes`` or an eighth of it has been
+    written (which bounds what other processes' writes can add unseen).
+    """
+
+    # Shared by all caches, and not part of the pickled state workers get.
+    lock = threading.Lock()
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.size = None
+        self.written = 0
+
+    def path(self, key, suffix=""):
+        return os.path.join(self.directory, key[:2], f"{key}{suffix}")
+
+    def url(self, path):
+        """Public media URL of a cache entry."""
+        relative = os.path.relpath(path, settings.MEDIA_ROOT)
+        return settings.MEDIA_URL + relative.replace(os.sep, "/")
+
+    def get(self, key, suffix=""):
+        """Path of the entry for ``key``, or None when it is not cached."""
+        path = self.path(key, suffix)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, key, write, suffix="", evict=True):
+        """
+        Creates the entry for ``key`` by calling ``write(path)``; returns its
+        path. Batches of writes can pass ``evict=False`` and evict once after.
+        """
+        path = self.path(key, suffix)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, partial = tempfile.mkstemp(
+            dir=os.path.dirname(path), suffix=f".part{suffix}"
+        )
+        os.close(fd)
+        try:
+            write(partial)
+            os.replace(partial, path)
+        except BaseException:
+            os.remove(partial)
+            raise
+        self.track(path)
+        if evict:
+            self.evict()
+        return path
+
+    def get_or_create(self, key, write, suffix=""):
+        return self.get(key, suffix) or self.put(key, write, suffix)
+
+    def track(self, path):
+        """Counts a new entry (possibly another process's) towards the total."""
+        try:
+            size = os.path.getsize(path)
+        except FileNotFoundError:
+            return
+        with self.lock:
+            if self.size is not None:
+                self.size += size
+            self.written += size
+
+    def evict(self):
+        with self.lock:
+            if (
+                self.size is not None
+                and self.size <= self.max_bytes
+                and self.written < self.max_bytes // 8
+            ):
+                return
+            self.written = 0
+        entries = []
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if ".part" in name:
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        if total > self.max_bytes:
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes * 0.9:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+        with self.lock:
+            self.size = total
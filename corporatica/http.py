@@ -0,0 +1,97 @@
+import os
+import re
+
+from django.http import (
+    FileResponse,
+    HttpResponse,
+    HttpResponseNotModified,
+    StreamingHttpResponse,
+)
+from django.utils.http import parse_etags, quote_etag
+
+BYTE_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def file_response(request, path, content_type, etag):
+    """
+    Serves a file with a strong ``ETag`` (``etag`` quoted), streaming it
+    from disk a block at a time.
+
+    ``path`` may be a callable returning the path, so a GET or HEAD whose
+    ``If-None-Match`` already names the tag is answered 304 without
+    producing the file. GETs with a single ``Range`` (and a matching
+    ``If-Range``, if any) get a 206 with just those bytes, or a 416 when it
+    lies past the end; multiple ranges are answered with the whole file.
+    """
+    etag = quote_etag(etag)
+    safe = request.method in ("GET", "HEAD")
+    if safe and etag_matches(request.META.get("HTTP_IF_NONE_MATCH"), etag):
+        response = HttpResponseNotModified()
+        response["ETag"] = etag
+        return response
+    if callable(path):
+        path = path()
+    size = os.path.getsize(path)
+    byte_range = None
+    if safe and request.META.get("HTTP_IF_RANGE", etag) == etag:
+        byte_range = parse_range(request.META.get("HTTP_RANGE"), size)
+    if byte_range is None:
+        response = FileResponse(open(path, "rb"), content_type=content_type)
+    elif byte_range is False:
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{size}"
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(
+            _read_range(path, start, end - start + 1),
+            status=206,
+            content_type=content_type,
+        )
+        response["Content-Length"] = end - start + 1
+        response["Content-Range"] = f"bytes {start}-{end}/{size}"
+    response["ETag"] = etag
+    response["Accept-Ranges"] = "bytes"
+    return response
+
+
+def etag_matches(header, etag):
+    """Whether an ``If-None-Match`` header names ``etag`` (weak comparison)."""
+    if not header:
+        return False
+    tags = [tag.removeprefix("W/") for tag in parse_etags(header)]
+    return "*" in tags or etag in tags
+
+
+def parse_range(header, size):
+    """
+    ``(first, last)`` byte positions of a single-range ``Range`` header,
+    clamped to a ``size``-byte file; None to send the whole file (no,
+    malformed or multiple ranges) and False if it is unsatisfiable.
+    """
+    match = BYTE_RANGE.match(header.strip()) if header else None
+    if match is None or match.groups() == ("", ""):
+        return None
+    first, last = match.groups()
+    if not first:
+        # "bytes=-500": the last 500 bytes.
+        if int(last) == 0 or size == 0:
+            return False
+        return max(size - int(last), 0), size - 1
+    first = int(first)
+    last = size - 1 if not last else min(int(last), size - 1)
+    if first >= size:
+        return False
+    if last < first:
+        return None
+    return first, last
+
+
+def _read_range(path, start, length, block_size=FileResponse.block_size):
+    with open(path, "rb") as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(block_size, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
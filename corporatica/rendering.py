@@ -0,0 +1,72 @@
+"""
+Chart renderers run inside the render pool (see ``corporatica.workers``).
+
+They only depend on matplotlib, seaborn and pyarrow, take picklable
+arguments and return PNG bytes. Each builds its own ``Figure`` rather than
+going through pyplot, so no global figure state is shared or leaked.
+"""
+import io
+
+import numpy as np
+import seaborn as sns
+from matplotlib.figure import Figure
+
+
+def figure_bytes(figure, format="png"):
+    buffer = io.BytesIO()
+    figure.savefig(buffer, format=format)
+    figure.clear()
+    return buffer.getvalue()
+
+
+def render_chart(spec, figsize=(10, 6)):
+    """
+    Draws a reduced chart spec (see ``tabular.api.charts.chart_spec``):
+    grouped bars, lines, scatter points or histogram steps per series.
+    """
+    figure = Figure(figsize=figsize)
+    axes = figure.subplots()
+    series = spec["series"]
+    width = 0.8 / max(len(series), 1)
+    for i, item in enumerate(series):
+        if spec["type"] == "bar":
+            offset = (i - (len(series) - 1) / 2) * width
+            positions = np.arange(len(item["x"])) + offset
+            axes.bar(positions, item["y"], width=width, label=item["name"])
+        elif spec["type"] == "line":
+            axes.plot(item["x"], item["y"], label=item["name"])
+        elif spec["type"] == "scatter":
+            axes.scatter(item["x"], item["y"], s=8, alpha=0.6, label=item["name"])
+        else:
+            axes.stairs(item["y"], item["x"], fill=True, alpha=0.6, label=item["name"])
+    if spec["type"] == "bar" and series:
+        labels = [str(label) for label in series[0]["x"]]
+        axes.set_xticks(np.arange(len(labels)), labels)
+        if len(labels) > 8:
+            axes.tick_params(axis="x", labelrotation=90)
+    axes.set_xlabel(spec.get("xlabel", ""))
+    axes.set_ylabel(spec.get("ylabel", ""))
+    if len(series) > 1:
+        axes.legend()
+    figure.tight_layout()
+    return figure_bytes(figure)
+
+
+def render_lines(lines, xlim=None, figsize=None):
+    """Line plot of ``(color, values)`` pairs, e.g. per-channel histograms."""
+    figure = Figure(figsize=figsize)
+    axes = figure.subplots()
+    for color, values in lines:
+        axes.plot(values, color=color)
+    if xlim is not None:
+        axes.set_xlim(xlim)
+    return figure_bytes(figure)
+
+
+def render_scatter(x, y, title=None, figsize=None):
+    figure = Figure(figsize=figsize)
+    axes = figure.subplots()
+    sns.scatterplot(x=x, y=y, ax=axes)
+    if title:
+        axes.set_title(title)
+    return figure_bytes(figure)
@@ -164,6 +164,55 @@ import os
 
 MEDIA_URL = "/media/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
+
+# Derived artefacts (columnar sidecars, rendered outputs) that can always be
+# rebuilt from the uploaded originals.
+CACHE_ROOT = os.path.join(MEDIA_ROOT, "cache")
+TABULAR_CACHE_DIR = os.path.join(CACHE_ROOT, "tabular")
+# Upper bound, in bytes, on the data a single tabular pass keeps in memory.
+TABULAR_MEMORY_BUDGET = 64 * 1024 * 1024
+# Exact quartiles for columns that fit in the budget; t-digest estimates otherwise.
+TABULAR_EXACT_QUANTILES = True
+# Rows kept in each dataset's reservoir sample for approximate statistics.
+TABULAR_SAMPLE_SIZE = 10000
+# Most rows (offset + limit) a sorted query may ask for; they are kept in memory.
+TABULAR_SORT_MAX_ROWS = 100_000
+# Total size above which the least recently used dataset profiles are evicted.
+TABULAR_PROFILE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+# Rendered charts, keyed by dataset content and chart parameters.
+CHART_CACHE_DIR = os.path.join(CACHE_ROOT, "charts")
+# Total size above which the least recently used charts are evicted.
+CHART_CACHE_MAX_BYTES = 256 * 1024 * 1024
+# Processes rendering charts outside the request workers (corporatica.workers).
+RENDER_WORKERS = min(4, os.cpu_count() or 1)
+# Renders a worker serves before it is replaced, bounding any slow leak.
+RENDER_MAX_TASKS_PER_CHILD = 200
+# Seconds a request waits for its render before failing.
+RENDER_TIMEOUT = 60
+# Threads for best-effort background work such as warming caches.
+BACKGROUND_WORKERS = 2
+# Resized, cropped and converted images, keyed by source content and operation.
+IMAGE_CACHE_DIR = os.path.join(CACHE_ROOT, "images")
+# Total size above which the least recently used image derivatives are evicted.
+IMAGE_CACHE_MAX_BYTES = 1024 * 1024 * 1024
+# (width, height) boxes every upload is fitted into in the background, keeping
+# its aspect ratio, in each format Accept negotiation may pick.
+IMAGE_PREGENERATE_SIZES = [(128, 128), (256, 256), (512, 512)]
+# Encoder preset (fast-preview, balanced or archival) for requests naming none.
+IMAGE_ENCODER_PRESET = "balanced"
+# Processes for batch image jobs; None sizes the pool to the container's CPU quota.
+IMAGE_WORKERS = None
+# Images a batch worker processes before it is replaced.
+IMAGE_MAX_TASKS_PER_CHILD = 500
+# Deep Zoom tile pyramids of large images, keyed by source content.
+IMAGE_TILE_DIR = os.path.join(CACHE_ROOT, "tiles")
+# Pixel count from which uploads are tiled, so crops and zooms read only tiles.
+IMAGE_TILE_THRESHOLD = 20_000_000
+# Edge length of pyramid tiles in pixels.
+IMAGE_TILE_SIZE = 256
+# Perceptual-hash bits (of 64) within which two images count as near-duplicates.
+IMAGE_DUPLICATE_DISTANCE = 6
+
 SWAGGER_SETTINGS = {
     'SECURITY_DEFINITIONS': {
         'Basic': {
@@ -0,0 +1,69 @@
+import hashlib
+import os
+import re
+import uuid
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+DIGEST = re.compile(r"^[0-9a-f]{64}$")
+
+
+def is_content_addressed(name):
+    """Whether ``name`` has the ``<prefix>/<xx>/<sha256><ext>`` shape."""
+    directory, filename = os.path.split(name)
+    stem = os.path.splitext(filename)[0]
+    return bool(DIGEST.match(stem)) and os.path.basename(directory) == stem[:2]
+
+
+@deconstructible
+class ContentAddressedPath:
+    """
+    ``upload_to`` callable naming files after the instance's ``content_hash``,
+    e.g. ``uploads/4d/4d5e...b85.csv``. Falls back to the original file name
+    when no hash is known; ContentAddressedStorage then hashes the content.
+    """
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+
+    def __call__(self, instance, filename):
+        digest = instance.content_hash
+        if not digest:
+            return f"{self.prefix}/{filename}"
+        extension = os.path.splitext(filename)[1].lower()
+        return f"{self.prefix}/{digest[:2]}/{digest}{extension}"
+
+    def __eq__(self, other):
+        return isinstance(other, ContentAddressedPath) and self.prefix == other.prefix
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    File system storage for content-addressed names: saving under a name
+    that already exists keeps the stored file instead of writing a suffixed
+    copy, so identical uploads share one blob. Files saved under a plain
+    name (no ``content_hash`` was known) are hashed here and stored under
+    their digest, so two different files never share a name.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        return name
+
+    def _save(self, name, content):
+        if not is_content_addressed(name):
+            digest = hashlib.sha256()
+            for chunk in content.chunks():
+                digest.update(chunk)
+            digest = digest.hexdigest()
+            directory, filename = os.path.split(name)
+            extension = os.path.splitext(filename)[1].lower()
+            name = os.path.join(directory, digest[:2], f"{digest}{extension}")
+        if self.exists(name):
+            return name
+        # Write under a unique name first; concurrent uploads of the same
+        # bytes then race harmlessly on the final rename.
+        partial = super()._save(f"{name}.{uuid.uuid4().hex}.part", content)
+        os.replace(self.path(partial), self.path(name))
+        return name
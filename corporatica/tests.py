@@ -0,0 +1,83 @@
+import hashlib
+import os
+import shutil
+import tempfile
+from types import SimpleNamespace
+from unittest import mock
+
+from django.core.files.base import ContentFile
+from django.test import SimpleTestCase
+
+from .storage import ContentAddressedPath, ContentAddressedStorage, is_content_addressed
+from .uploadhandler import HashingUploadHandler
+
+
+def upload(content, name="data.csv"):
+    """``content`` as it comes out of HashingUploadHandler."""
+    handler = HashingUploadHandler()
+    handler.new_file("file", name, "text/csv", len(content))
+    handler.receive_data_chunk(content, 0)
+    return handler.file_complete(len(content))
+
+
+class ContentAddressedStorageTests(SimpleTestCase):
+    def setUp(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location, ignore_errors=True)
+        self.storage = ContentAddressedStorage(location=location)
+        self.upload_to = ContentAddressedPath("uploads")
+
+    def save(self, file, content_hash=""):
+        instance = SimpleNamespace(content_hash=content_hash)
+        return self.storage.save(self.upload_to(instance, file.name), file)
+
+    def stored(self):
+        return sorted(
+            os.path.relpath(os.path.join(directory, name), self.storage.location)
+            for directory, _, names in os.walk(self.storage.location)
+            for name in names
+        )
+
+    def test_identical_uploads_share_one_file(self):
+        first, second = upload(b"id\n1\n", "a.CSV"), upload(b"id\n1\n", "b.csv")
+        self.assertEqual(first.content_hash, hashlib.sha256(b"id\n1\n").hexdigest())
+        self.assertEqual(first.content_hash, second.content_hash)
+        name = self.save(first, first.content_hash)
+        self.assertEqual(
+            name, f"uploads/{first.content_hash[:2]}/{first.content_hash}.csv"
+        )
+        self.assertEqual(self.save(second, second.content_hash), name)
+        self.assertEqual(self.stored(), [name])
+        with self.storage.open(name) as f:
+            self.assertEqual(f.read(), b"id\n1\n")
+
+    def test_writes_through_a_partial_file(self):
+        content = b"id\n1\n2\n"
+        digest = hashlib.sha256(content).hexdigest()
+        with mock.patch("corporatica.storage.os.replace", wraps=os.replace) as replace:
+            name = self.save(ContentFile(content, "data.csv"), digest)
+        (partial, target), _ = replace.call_args
+        self.assertTrue(partial.startswith(self.storage.path(name) + "."))
+        self.assertTrue(partial.endswith(".part"))
+        self.assertEqual(target, self.storage.path(name))
+        self.assertEqual(self.stored(), [name])
+
+    def test_unhashed_saves_are_hashed(self):
+        # Without a content_hash both files are offered as uploads/data.csv.
+        first = self.save(ContentFile(b"id\n1\n", "data.csv"))
+        second = self.save(ContentFile(b"id\n2\n", "data.csv"))
+        self.assertNotEqual(first, second)
+        for name, content in [(first, b"id\n1\n"), (second, b"id\n2\n")]:
+            digest = hashlib.sha256(content).hexdigest()
+            self.assertEqual(name, f"uploads/{digest[:2]}/{digest}.csv")
+            with self.storage.open(name) as f:
+                self.assertEqual(f.read(), content)
+        self.assertEqual(self.save(ContentFile(b"id\n1\n", "copy.csv")), first)
+        self.assertEqual(self.stored(), sorted([first, second]))
+
+    def test_is_content_addressed(self):
+        digest = hashlib.sha256(b"").hexdigest()
+        self.assertTrue(is_content_addressed(f"uploads/{digest[:2]}/{digest}.csv"))
+        self.assertFalse(is_content_addressed("uploads/data.csv"))
+        self.assertFalse(is_content_addressed(f"uploads/{digest}.csv"))
+        self.assertFalse(is_content_addressed(f"uploads/00/{digest}.csv"))
@@ -0,0 +1,35 @@
+import hashlib
+
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+
+
+class HashingUploadHandler(TemporaryFileUploadHandler):
+    """
+    Streams uploads to a temporary file and computes their SHA-256 on the
+    way through, exposed as ``content_hash`` on the completed file.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.hasher = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.hasher.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        file.content_hash = self.hasher.hexdigest()
+        return file
+
+
+class UploadHandlerMixin:
+    """Makes a DRF view parse uploaded files with ``upload_handler_classes``."""
+
+    upload_handler_classes = [HashingUploadHandler]
+
+    def initialize_request(self, request, *args, **kwargs):
+        request.upload_handlers = [
+            handler(request) for handler in self.upload_handler_classes
+        ]
+        return super().initialize_request(request, *args, **kwargs)
@@ -14,6 +14,8 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
+from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import path, include
 from rest_framework import routers
@@ -43,4 +45,4 @@ urlpatterns = [
         "redoc/", schema_view.with_ui("redoc", cache_timeout=0), name="schema-redoc-ui"
     ),
     # Add your other URL patterns here
-]
+] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -0,0 +1,115 @@
+import math
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+
+_pools = {}
+_lock = threading.Lock()
+
+
+def available_cpus():
+    """
+    CPUs this process can use: its affinity mask, capped by the cgroup CPU
+    quota a container runs under (rounded down, at least one).
+    """
+    try:
+        count = len(os.sched_getaffinity(0))
+    except AttributeError:
+        count = os.cpu_count() or 1
+    quota = _cgroup_cpu_quota()
+    if quota is not None:
+        count = min(count, max(1, math.floor(quota)))
+    return count
+
+
+def _cgroup_cpu_quota():
+    # cgroup v2 reads "<quota> <period>" or "max <period>"; v1 splits them.
+    sources = [
+        ("/sys/fs/cgroup/cpu.max", None),
+        (
+            "/sys/fs/cgroup/cpu/cpu.cfs_quota_us",
+            "/sys/fs/cgroup/cpu/cpu.cfs_period_us",
+        ),
+    ]
+    for quota_path, period_path in sources:
+        try:
+            with open(quota_path) as f:
+                fields = f.read().split()
+            if period_path:
+                with open(period_path) as f:
+                    fields.append(f.read().strip())
+        except OSError:
+            continue
+        if fields[0] in ("max", "-1"):
+            return None
+        return int(fields[0]) / int(fields[1])
+    return None
+
+
+def process_pool(name, max_workers, max_tasks_per_child=None):
+    """
+    Shared process pool registered under ``name``, started on first use.
+
+    Workers are spawned rather than forked so they never inherit the
+    request worker's threads, open connections or pyplot state.
+    """
+    with _lock:
+        pool = _pools.get(name)
+        if pool is None:
+            pool = _pools[name] = ProcessPoolExecutor(
+                max_workers=max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                max_tasks_per_child=max_tasks_per_child,
+            )
+        return pool
+
+
+def thread_pool(name, max_workers):
+    """Shared thread pool registered under ``name``, started on first use."""
+    with _lock:
+        pool = _pools.get(name)
+        if pool is None:
+            pool = _pools[name] = ThreadPoolExecutor(
+                max_workers=max_workers, thread_name_prefix=name
+            )
+        return pool
+
+
+def discard_pool(name, pool):
+    with _lock:
+        if _pools.get(name) is pool:
+            del _pools[name]
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def render(function, *args, **kwargs):
+    """
+    Runs a renderer from ``corporatica.rendering`` in the render pool and
+    returns the bytes it produced. A pool whose worker crashed is replaced
+    and the job retried once.
+    """
+    for attempt in range(2):
+        pool = process_pool(
+            "render", settings.RENDER_WORKERS, settings.RENDER_MAX_TASKS_PER_CHILD
+        )
+        try:
+            future = pool.submit(function, *args, **kwargs)
+            return future.result(timeout=settings.RENDER_TIMEOUT)
+        except BrokenProcessPool:
+            discard_pool("render", pool)
+            if attempt:
+                raise
+
+
+def background(function, *args, **kwargs):
+    """
+    Queues best-effort work, such as warming a cache, on the background
+    thread pool and returns its future. Nothing waits for it, so failures
+    are only visible on the future.
+    """
+    pool = thread_pool("background", settings.BACKGROUND_WORKERS)
+    return pool.submit(function, *args, **kwargs)
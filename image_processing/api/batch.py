@@ -0,0 +1,146 @@
+import functools
+import io
+import json
+import shutil
+import zipfile
+from concurrent.futures import as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+
+from corporatica.cache import cache_digest
+from corporatica.workers import available_cpus, discard_pool, process_pool
+
+from .derivatives import (
+    cache_key,
+    canonical_pipeline,
+    derivative_cache,
+    derivative_key,
+    extension,
+    image_tiles,
+)
+from .utils import run_pipeline, write_histogram_plot
+
+
+def image_pool():
+    """
+    Process pool for batch image jobs, sized to the CPUs the container may
+    use unless ``IMAGE_WORKERS`` says otherwise.
+    """
+    return process_pool(
+        "images",
+        settings.IMAGE_WORKERS or available_cpus(),
+        settings.IMAGE_MAX_TASKS_PER_CHILD,
+    )
+
+
+def transform_jobs(images, operations, format="PNG", quality=None, preset=None):
+    """Jobs running one pipeline over each of ``images``; see run_jobs."""
+    spec = canonical_pipeline(operations, format, quality, preset)
+    suffix = extension(spec["format"])
+    jobs = []
+    for image in images:
+        tiles = image_tiles(image)
+        jobs.append(
+            (
+                f"{image.id}{suffix}",
+                derivative_key(image, spec, tiles),
+                functools.partial(run_pipeline, image.image.path, spec, tiles=tiles),
+                suffix,
+            )
+        )
+    return jobs
+
+
+def histogram_jobs(images):
+    """Jobs plotting the colour histogram of each of ``images``."""
+    return [
+        (
+            f"{image.id}_histogram.png",
+            cache_digest(cache_key(image), "histogram"),
+            functools.partial(
+                write_histogram_plot, image.image.path, tiles=image_tiles(image)
+            ),
+            ".png",
+        )
+        for image in images
+    ]
+
+
+def run_jobs(jobs):
+    """
+    Produces the derivative files of ``jobs`` -- ``(name, cache key,
+    write(path), suffix)`` tuples -- and yields ``(name, path, error)`` as
+    each one is ready.
+
+    Every missing file is queued on the image pool, one image per task, so
+    a batch scales with the available cores; cached files are yielded
+    while the workers run. The workers' files are counted towards the
+    cache size and it is evicted once at the end;
+    abandoning the generator cancels the jobs not yet started.
+    """
+    pool = image_pool()
+    cached, futures = [], {}
+    try:
+        for name, key, write, suffix in jobs:
+            path = derivative_cache.get(key, suffix)
+            if path is not None:
+                cached.append((name, path, None))
+                continue
+            future = pool.submit(derivative_cache.put, key, write, suffix, False)
+            futures[future] = name
+        yield from cached
+        for future in as_completed(futures):
+            try:
+                path = future.result()
+                derivative_cache.track(path)
+                yield futures[future], path, None
+            except BrokenProcessPool as e:
+                discard_pool("images", pool)
+                yield futures[future], None, e
+            except Exception as e:
+                yield futures[future], None, e
+    finally:
+        for future in futures:
+            future.cancel()
+        derivative_cache.evict()
+
+
+class _Sink:
+    """Write-only buffer; zipfile streams to it as to an unseekable file."""
+
+    def __init__(self):
+        self.buffer = io.BytesIO()
+
+    def write(self, data):
+        return self.buffer.write(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = self.buffer.getvalue()
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        return data
+
+
+def stream_zip(results):
+    """
+    Streams ``(name, path, error)`` results as an uncompressed ZIP archive,
+    one entry at a time; images are already compressed. Failures are listed
+    in a final ``errors.json`` entry.
+    """
+    sink = _Sink()
+    errors = {}
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_STORED) as archive:
+        for name, path, error in results:
+            if error is not None:
+                errors[name] = str(error) or type(error).__name__
+                continue
+            with open(path, "rb") as source, archive.open(name, "w") as entry:
+                shutil.copyfileobj(source, entry)
+            yield sink.drain()
+        if errors:
+            archive.writestr("errors.json", json.dumps(errors, indent=2))
+    yield sink.drain()
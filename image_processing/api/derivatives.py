@@ -0,0 +1,206 @@
+import functools
+import os
+
+from django.conf import settings
+from PIL import Image
+
+from corporatica.cache import FileCache, cache_digest
+from corporatica.workers import background
+
+from .tiles import Pyramid, build_pyramid
+from .utils import (
+    ENCODER_PRESETS,
+    OPERATIONS,
+    has_transparency,
+    open_image,
+    run_pipeline,
+)
+
+derivative_cache = FileCache(settings.IMAGE_CACHE_DIR, settings.IMAGE_CACHE_MAX_BYTES)
+# Formats Accept negotiation chooses from, smallest output first.
+NEGOTIATED_FORMATS = ("AVIF", "WEBP", "JPEG", "PNG")
+
+
+def cache_key(image):
+    """
+    Identifies an image's pixels: its content hash, so identical uploads
+    share derivatives, or its id for images stored before hashing.
+    """
+    return image.content_hash or f"id-{image.id}"
+
+
+def tile_directory(image):
+    return os.path.join(settings.IMAGE_TILE_DIR, cache_key(image))
+
+
+def image_tiles(image):
+    """The directory of the image's tile pyramid, or None if it has none."""
+    directory = tile_directory(image)
+    return directory if Pyramid.open(directory) is not None else None
+
+
+def ensure_tiles(image, force=False):
+    """
+    Builds the tile pyramid of an image of at least ``IMAGE_TILE_THRESHOLD``
+    pixels (of any image with ``force``) unless it exists; returns its
+    directory, or None for a small image.
+    """
+    directory = image_tiles(image)
+    if directory is None:
+        width, height = open_image(image.image.path).size
+        if force or width * height >= settings.IMAGE_TILE_THRESHOLD:
+            directory = tile_directory(image)
+            build_pyramid(image.image.path, directory, settings.IMAGE_TILE_SIZE)
+    return directory
+
+
+def extension(format):
+    """File extension for a Pillow format name; ValueError if it cannot be written."""
+    format = format.upper()
+    extensions = [e for e, f in Image.registered_extensions().items() if f == format]
+    if not extensions or format not in Image.SAVE:
+        raise ValueError(f"Unsupported image format: {format}")
+    preferred = f".{format.lower()}"
+    return preferred if preferred in extensions else extensions[0]
+
+
+def content_type(format):
+    return Image.MIME.get(format.upper(), f"image/{format.lower()}")
+
+
+def canonical_pipeline(operations, format="PNG", quality=None, preset=None):
+    """
+    Validates a list of operations such as ``{"op": "resize", "width": 200,
+    "height": 100}`` and returns the canonical spec: ``[name, params]``
+    steps with integer parameters, and the output format, quality and
+    encoder preset (``IMAGE_ENCODER_PRESET`` by default). A ``convert``
+    operation only sets the output format (quality, preset), so equivalent
+    requests share one cache entry.
+    """
+    steps = []
+    for operation in operations:
+        operation = dict(operation)
+        name = operation.pop("op", None)
+        if name == "convert":
+            format = operation.pop("format", format)
+            quality = operation.pop("quality", quality)
+            preset = operation.pop("preset", preset)
+        elif name in OPERATIONS:
+            names = OPERATIONS[name][1]
+            missing = [key for key in names if key not in operation]
+            if missing:
+                raise ValueError(f"{name} needs {', '.join(missing)}")
+            steps.append([name, {key: int(operation.pop(key)) for key in names}])
+        else:
+            raise ValueError(
+                f"Unknown operation {name!r}; use convert, {', '.join(OPERATIONS)}"
+            )
+        if operation:
+            raise ValueError(f"Unknown {name} parameter: {next(iter(operation))}")
+    format = format.upper()
+    extension(format)
+    if quality is not None:
+        quality = int(quality)
+        if not 1 <= quality <= 100:
+            raise ValueError("quality must be between 1 and 100")
+    preset = preset or settings.IMAGE_ENCODER_PRESET
+    if preset not in ENCODER_PRESETS:
+        raise ValueError(f"preset must be one of {', '.join(ENCODER_PRESETS)}")
+    return {
+        "operations": steps,
+        "format": format,
+        "quality": quality,
+        "preset": preset,
+    }
+
+
+def negotiable_formats(transparent=False):
+    """
+    The NEGOTIATED_FORMATS Pillow can write, without JPEG for a
+    ``transparent`` image, smallest output first.
+    """
+    return [
+        format
+        for format in NEGOTIATED_FORMATS
+        if format in Image.SAVE and not (format == "JPEG" and transparent)
+    ]
+
+
+def negotiate_format(accept, transparent=False, default="PNG"):
+    """
+    The smallest output format an ``Accept`` header names with a non-zero
+    q: AVIF (where Pillow can write it), WebP, JPEG unless the image is
+    ``transparent``, then PNG. Wildcards do not count, so clients that
+    name no image type keep ``default``.
+    """
+    accepted = {}
+    for item in (accept or "").split(","):
+        media_type, *params = [part.strip() for part in item.split(";")]
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[media_type.lower()] = q
+    for format in negotiable_formats(transparent):
+        if accepted.get(content_type(format), 0) > 0:
+            return format
+    return default
+
+
+def derivative(image, operations=(), format="PNG", quality=None, preset=None):
+    """
+    Path of ``image`` transformed by ``operations`` (see canonical_pipeline)
+    and encoded as ``format``; see derivative_path.
+    """
+    spec = canonical_pipeline(operations, format, quality, preset)
+    return derivative_path(image, spec, image_tiles(image))
+
+
+def derivative_path(image, spec, tiles=None):
+    """
+    Path of ``image`` processed by a canonical pipeline ``spec``, taken from
+    the derivative cache when the same pipeline ran before. Otherwise the
+    original is decoded once, every step is applied in memory and the
+    result encoded once, into a file that later requests are served from
+    directly. With the image's tile pyramid in ``tiles`` (see image_tiles)
+    a leading crop or resize reads only the tiles it needs.
+    """
+    return derivative_cache.get_or_create(
+        derivative_key(image, spec, tiles),
+        functools.partial(run_pipeline, image.image.path, spec, tiles=tiles),
+        extension(spec["format"]),
+    )
+
+
+def derivative_key(image, spec, tiles=None):
+    """
+    Cache key of a derivative, also its strong ETag: the same source pixels,
+    read from the same source and processed by the same spec, always
+    encode to the same bytes. Output read from a tile pyramid differs
+    slightly from output decoded from the original, so it is keyed apart.
+    """
+    if tiles:
+        return cache_digest(cache_key(image), spec, "tiles")
+    return cache_digest(cache_key(image), spec)
+
+
+def pregenerate(image):
+    """
+    Queues the thumbnails of a new upload: a fit within each of the
+    ``IMAGE_PREGENERATE_SIZES`` in every format negotiate_format may pick
+    for it, so content negotiation is served from the cache. Call it after
+    ensure_tiles, so the keys match those of later requests.
+    """
+    formats = negotiable_formats(has_transparency(image.image.path))
+    for width, height in settings.IMAGE_PREGENERATE_SIZES:
+        for format in formats:
+            background(
+                derivative,
+                image,
+                [{"op": "fit", "width": width, "height": height}],
+                format,
+            )
@@ -0,0 +1,92 @@
+from django.db import connections
+
+from corporatica.cache import cache_digest
+from corporatica.rendering import render_lines
+from corporatica.workers import render
+
+from ..models import UploadedImage
+from .derivatives import (
+    cache_key,
+    derivative_cache,
+    ensure_tiles,
+    image_tiles,
+    pregenerate,
+)
+from .utils import generate_color_histogram
+
+
+def ensure_histogram(image):
+    """
+    Returns the image's stored histogram, computing and saving it on first
+    use; an identical upload's histogram is copied instead.
+    """
+    if image.histogram is None:
+        twin = None
+        if image.content_hash:
+            twin = (
+                UploadedImage.objects.filter(
+                    content_hash=image.content_hash, histogram__isnull=False
+                )
+                .values_list("histogram", flat=True)
+                .first()
+            )
+        image.histogram = twin or {
+            channel: counts.tolist()
+            for channel, counts in generate_color_histogram(
+                image.image.path, tiles=image_tiles(image)
+            )
+        }
+        UploadedImage.objects.filter(pk=image.pk).update(histogram=image.histogram)
+    return image.histogram
+
+
+def prepare_upload(image):
+    """
+    Tiles a new upload if it is large, computes its histogram (from the
+    tiles, if any) and queues its thumbnails, on a background thread.
+    Thumbnails wait for the tiles so they are cached under the keys later
+    requests look up.
+    """
+    try:
+        ensure_tiles(image)
+        ensure_histogram(image)
+        pregenerate(image)
+    finally:
+        # Background threads do not get the request cycle's cleanup.
+        connections.close_all()
+
+
+def region_histogram(image, box):
+    """
+    Histogram of the ``box`` (left, top, right, bottom) of an image, read
+    from the tiles it overlaps when the image is tiled.
+    """
+    return {
+        channel: counts.tolist()
+        for channel, counts in generate_color_histogram(
+            image.image.path, box, image_tiles(image)
+        )
+    }
+
+
+def histogram_plot(image, box=None):
+    """
+    Path of the PNG plot of the image's stored histogram, or of the
+    histogram of ``box``, rendered once.
+    """
+
+    def write(path):
+        histogram = (
+            ensure_histogram(image) if box is None else region_histogram(image, box)
+        )
+        with open(path, "wb") as f:
+            f.write(render(render_lines, list(histogram.items()), xlim=(0, 256)))
+
+    return derivative_cache.get_or_create(histogram_key(image, box), write, ".png")
+
+
+def histogram_key(image, box=None):
+    """Cache key, and ETag, of a histogram plot."""
+    if box is None:
+        return cache_digest(cache_key(image), "histogram")
+    return cache_digest(cache_key(image), "histogram", list(box))
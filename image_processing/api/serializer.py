@@ -6,4 +6,5 @@ from ..models import UploadedImage
 class UploadedImageSerializer(serializers.ModelSerializer):
     class Meta:
         model = UploadedImage
-        fields = ["id", "image"]
+        fields = ["id", "image", "content_hash", "perceptual_hash"]
+        read_only_fields = ["content_hash", "perceptual_hash"]
@@ -0,0 +1,146 @@
+import threading
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from ..models import UploadedImage
+from .utils import perceptual_hash
+
+
+def hamming(a, b):
+    """Number of differing bits between two hashes given as integers."""
+    return (a ^ b).bit_count()
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree of integer hashes under the Hamming distance.
+
+    Each child hangs off its parent at its distance from it, so by the
+    triangle inequality a search within ``radius`` of a hash at distance
+    ``d`` from a node only descends into children at ``d - radius`` to
+    ``d + radius``; near-duplicate lookups visit a small part of the tree.
+    """
+
+    def __init__(self):
+        self.root = None
+        self.size = 0
+
+    def add(self, value, item):
+        """Adds ``item`` under the hash ``value``; equal hashes share a node."""
+        self.size += 1
+        if self.root is None:
+            self.root = (value, [item], {})
+            return
+        node = self.root
+        while True:
+            distance = hamming(value, node[0])
+            if distance == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = (value, [item], {})
+                return
+            node = child
+
+    def search(self, value, radius):
+        """``(distance, item)`` pairs within ``radius`` bits of ``value``."""
+        found = []
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node = stack.pop()
+            distance = hamming(value, node[0])
+            if distance <= radius:
+                found.extend((distance, item) for item in node[1])
+            for edge, child in node[2].items():
+                if distance - radius <= edge <= distance + radius:
+                    stack.append(child)
+        return found
+
+
+class HashIndex:
+    """
+    In-memory BK-tree of the stored images' perceptual hashes.
+
+    Each process keeps its own tree. Before a search it adds the images
+    stored since (by id, which also covers bulk inserts and other
+    processes); edits and deletions seen through model signals make it
+    rebuild from the database instead. Images deleted by other processes
+    may linger until then, so callers re-check ids against the database.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tree = BKTree()
+        self.last_id = 0
+        self.stale = True
+
+    def invalidate(self):
+        """Rebuilds the tree before the next search."""
+        self.stale = True
+
+    def search(self, value, radius):
+        """``(distance, image id)`` pairs within ``radius`` bits, nearest first."""
+        with self.lock:
+            self._sync()
+            found = self.tree.search(int(value, 16), radius)
+        return sorted(found)
+
+    def _sync(self):
+        hashed = UploadedImage.objects.exclude(perceptual_hash="")
+        if self.stale:
+            self.tree, self.last_id, self.stale = BKTree(), 0, False
+        self._add(hashed.filter(id__gt=self.last_id))
+
+    def _add(self, images):
+        rows = images.order_by("id").values_list("id", "perceptual_hash")
+        for image_id, value in rows:
+            self.tree.add(int(value, 16), image_id)
+            self.last_id = image_id
+
+
+hash_index = HashIndex()
+
+
+@receiver(post_save, sender=UploadedImage)
+def _image_saved(sender, instance, created, **kwargs):
+    # New images are picked up by id; an edited one may have a new hash.
+    if not created:
+        hash_index.invalidate()
+
+
+@receiver(post_delete, sender=UploadedImage)
+def _image_deleted(sender, instance, **kwargs):
+    hash_index.invalidate()
+
+
+def ensure_perceptual_hash(image):
+    """Returns the image's perceptual hash, computing and saving it on first use."""
+    if not image.perceptual_hash:
+        image.perceptual_hash = perceptual_hash(image.image.path)
+        UploadedImage.objects.filter(pk=image.pk).update(
+            perceptual_hash=image.perceptual_hash
+        )
+        # An older image may now sit below the index's last id.
+        hash_index.invalidate()
+    return image.perceptual_hash
+
+
+def similar_images(value, max_distance, exclude=()):
+    """
+    Stored images whose perceptual hash is within ``max_distance`` bits of
+    ``value``, as ``(distance, image)`` pairs, nearest first.
+    """
+    found = [
+        (distance, image_id)
+        for distance, image_id in hash_index.search(value, max_distance)
+        if image_id not in exclude
+    ]
+    # The tree may still hold images deleted since it last caught up.
+    images = UploadedImage.objects.in_bulk([image_id for _, image_id in found])
+    return [
+        (distance, images[image_id])
+        for distance, image_id in found
+        if image_id in images
+    ]
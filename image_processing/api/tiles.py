@@ -0,0 +1,174 @@
+import json
+import math
+import os
+import shutil
+import tempfile
+
+import numpy as np
+from PIL import Image
+
+# Modes tiles are stored in; anything else is converted to RGB first.
+TILE_MODES = ("L", "LA", "RGB", "RGBA")
+DESCRIPTOR = "pyramid.json"
+
+
+def tile_image(image):
+    """
+    Converts ``image`` to a mode tiles are stored in: L for grayscale
+    (16-bit scaled down), RGBA for palette images with transparency and
+    RGB for the rest.
+    """
+    if image.mode in TILE_MODES:
+        return image
+    if image.mode.startswith("I;16"):
+        return Image.fromarray((np.asarray(image) >> 8).astype(np.uint8))
+    if image.getbands()[0] in ("1", "L", "I", "F"):
+        return image.convert("L")
+    if image.mode == "P" and "transparency" in image.info:
+        return image.convert("RGBA")
+    return image.convert("RGBA" if "A" in image.getbands() else "RGB")
+
+
+def build_pyramid(image_path, directory, tile_size=256):
+    """
+    Cuts an image into a Deep Zoom pyramid of lossless PNG tiles in
+    ``directory``: ``<level>/<column>_<row>.png``, level 0 being 1x1 and the
+    last level full size, each level half the size of the next (rounded
+    up). The image is decoded once and each level is box-reduced from the
+    one above. The directory appears atomically, descriptor included.
+    """
+    image = tile_image(Image.open(image_path))
+    width, height = image.size
+    pyramid = Pyramid(directory, width, height, tile_size)
+    parent = os.path.dirname(directory)
+    os.makedirs(parent, exist_ok=True)
+    tmp_path = tempfile.mkdtemp(dir=parent, suffix=".tmp")
+    try:
+        for level in range(pyramid.max_level, -1, -1):
+            size = pyramid.level_size(level)
+            if image.size != size:
+                image = image.reduce(2)
+                if image.size != size:
+                    image = image.resize(size, Image.Resampling.BOX)
+            os.makedirs(os.path.join(tmp_path, str(level)))
+            columns, rows = pyramid.tile_count(level)
+            for column in range(columns):
+                for row in range(rows):
+                    left, top = column * tile_size, row * tile_size
+                    right = min(left + tile_size, size[0])
+                    bottom = min(top + tile_size, size[1])
+                    image.crop((left, top, right, bottom)).save(
+                        os.path.join(tmp_path, str(level), f"{column}_{row}.png"),
+                        compress_level=1,
+                    )
+        with open(os.path.join(tmp_path, DESCRIPTOR), "w") as f:
+            json.dump({"width": width, "height": height, "tile_size": tile_size}, f)
+    except BaseException:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+    try:
+        os.rename(tmp_path, directory)
+    except OSError:
+        # Another worker built the same pyramid first.
+        shutil.rmtree(tmp_path, ignore_errors=True)
+    return pyramid
+
+
+class Pyramid:
+    """
+    A Deep Zoom tile pyramid on disk. Regions are assembled from the tiles
+    they overlap, at any level, so reading one never decodes more than the
+    region plus a tile's margin.
+    """
+
+    def __init__(self, directory, width, height, tile_size):
+        self.directory = directory
+        self.width = width
+        self.height = height
+        self.tile_size = tile_size
+        self.max_level = math.ceil(math.log2(max(width, height, 1)))
+
+    @classmethod
+    def open(cls, directory):
+        """The pyramid in ``directory``, or None if none was built."""
+        try:
+            with open(os.path.join(directory, DESCRIPTOR)) as f:
+                return cls(directory, **json.load(f))
+        except FileNotFoundError:
+            return None
+
+    def scale(self, level):
+        return 2 ** (self.max_level - level)
+
+    def level_size(self, level):
+        scale = self.scale(level)
+        return math.ceil(self.width / scale), math.ceil(self.height / scale)
+
+    def tile_count(self, level):
+        width, height = self.level_size(level)
+        return math.ceil(width / self.tile_size), math.ceil(height / self.tile_size)
+
+    def tile_path(self, level, column, row):
+        return os.path.join(self.directory, str(level), f"{column}_{row}.png")
+
+    def level_for(self, box, size):
+        """
+        Coarsest level at which the full-size ``box`` still spans at least
+        ``size`` pixels in both directions.
+        """
+        width, height = box[2] - box[0], box[3] - box[1]
+        for level in range(self.max_level + 1):
+            scale = self.scale(level)
+            if width / scale >= size[0] and height / scale >= size[1]:
+                return level
+        return self.max_level
+
+    def parts(self, box=None, level=None):
+        """
+        Yields ``(left, top, part)`` for the parts of the tiles covering the
+        full-size ``box`` (the whole image by default) at ``level``, clipped
+        to the image, one tile at a time.
+        """
+        level = self.max_level if level is None else level
+        left, top, right, bottom = self._scale_box(box, level)
+        columns, rows = self.tile_count(level)
+        size = self.tile_size
+        for column in range(
+            max(left // size, 0), min((right - 1) // size + 1, columns)
+        ):
+            for row in range(max(top // size, 0), min((bottom - 1) // size + 1, rows)):
+                x, y = column * size, row * size
+                with Image.open(self.tile_path(level, column, row)) as tile:
+                    crop = (
+                        max(left - x, 0),
+                        max(top - y, 0),
+                        min(right - x, tile.width),
+                        min(bottom - y, tile.height),
+                    )
+                    yield x + crop[0], y + crop[1], tile.crop(crop)
+
+    def region(self, box, level=None):
+        """
+        The full-size ``box`` (left, top, right, bottom) read at ``level``
+        (full size by default) and scaled to it. Like Image.crop, areas
+        outside the image are left black.
+        """
+        level = self.max_level if level is None else level
+        left, top, right, bottom = self._scale_box(box, level)
+        region = None
+        for x, y, part in self.parts(box, level):
+            if region is None:
+                region = Image.new(part.mode, (right - left, bottom - top))
+            region.paste(part, (x - left, y - top))
+        if region is None:
+            region = Image.new("RGB", (right - left, bottom - top))
+        return region
+
+    def _scale_box(self, box, level):
+        if box is None:
+            return (0, 0, *self.level_size(level))
+        scale = self.scale(level)
+        left, top = math.floor(box[0] / scale), math.floor(box[1] / scale)
+        right = max(math.ceil(box[2] / scale), left + 1)
+        bottom = max(math.ceil(box[3] / scale), top + 1)
+        return left, top, right, bottom
@@ -6,7 +6,21 @@ urlpatterns = [
     path("upload_image", UploadedImageView.as_view(), name="upload_image"),
     path("batch_upload", BatchUploadView.as_view(), name="batch_upload"),
     path("color_histogram", ColorHistogramView.as_view(), name="color_histogram"),
+    path("similar_images", SimilarImagesView.as_view(), name="similar_images"),
     path("resize_image", ResizeImageView.as_view(), name="resize_image"),
     path("crop_image", CropImageView.as_view(), name="crop_image"),
     path("convert_image", ConvertImageView.as_view(), name="convert_image"),
+    path("pipeline", PipelineImageView.as_view(), name="image_pipeline"),
+    path("batch_transform", BatchTransformView.as_view(), name="batch_transform"),
+    path("batch_histogram", BatchHistogramView.as_view(), name="batch_histogram"),
+    path(
+        "deep_zoom/<int:image_id>.dzi",
+        DeepZoomDescriptorView.as_view(),
+        name="deep_zoom",
+    ),
+    path(
+        "deep_zoom/<int:image_id>_files/<int:level>/<int:column>_<int:row>.png",
+        DeepZoomTileView.as_view(),
+        name="deep_zoom_tile",
+    ),
 ]
@@ -1,50 +1,269 @@
 # image_processing/utils.py
 from PIL import Image
 import numpy as np
-from matplotlib import pyplot as plt
-import io
+from corporatica.rendering import render_lines
 
+from .tiles import Pyramid
 
-def generate_color_histogram(image_path):
-    image = Image.open(image_path)
-    colors = ("red", "green", "blue")
-    channels = image.split()
-    histogram_data = []
 
-    for channel, color in zip(channels, colors):
-        histogram, _ = np.histogram(channel, bins=256, range=(0, 256))
-        histogram_data.append((color, histogram))
+# Bands, named after their plot colours, of the modes histograms are taken in.
+HISTOGRAM_CHANNELS = {"L": ("gray",), "RGB": ("red", "green", "blue")}
+# Rows counted per np.bincount call, bounding the temporary index array.
+HISTOGRAM_BLOCK_ROWS = 256
 
-    return histogram_data
 
+def histogram_image(image):
+    """
+    Converts ``image`` to L (grayscale, 16-bit scaled down) or RGB (palette,
+    CMYK, YCbCr, ...) for histograms. Returns it with its alpha band, or None.
+    """
+    if image.mode == "P":
+        image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+    alpha = image.getchannel("A") if "A" in image.getbands() else None
+    if image.mode.startswith("I;16"):
+        image = Image.fromarray((np.asarray(image) >> 8).astype(np.uint8))
+    elif image.getbands()[0] in ("1", "L", "I", "F"):
+        image = image.convert("L")
+    elif image.mode != "RGB":
+        image = image.convert("RGB")
+    return image, alpha
 
-def save_histogram_plot(histogram_data):
-    plt.figure()
-    for color, hist in histogram_data:
-        plt.plot(hist, color=color)
-    plt.xlim([0, 256])
-    buf = io.BytesIO()
-    plt.savefig(buf, format="png")
-    buf.seek(0)
-    return buf
+
+def generate_color_histogram(image_path, box=None, tiles=None):
+    """
+    256-bin histograms of an image, or of the ``box`` (left, top, right,
+    bottom) within it, as ``(channel, counts)`` pairs: ``gray`` for
+    grayscale images, ``red``, ``green`` and ``blue`` for the rest. Fully
+    transparent pixels and pixels outside the image are not counted.
+
+    Each band is offset into its own 256-value range, so all of them are
+    counted by one np.bincount over a view of the decoded pixels, a block
+    of rows at a time. With a tile pyramid in ``tiles`` the pixels are read
+    one tile at a time, only from the tiles the box overlaps.
+    """
+    pyramid = Pyramid.open(tiles) if tiles else None
+    if pyramid is not None:
+        parts = (part for _, _, part in pyramid.parts(box))
+    else:
+        image = open_image(image_path)
+        if box is not None:
+            width, height = image.size
+            left, top = max(box[0], 0), max(box[1], 0)
+            image = image.crop((left, top, min(box[2], width), min(box[3], height)))
+        parts = [image]
+    channels, counts = None, None
+    for part in parts:
+        image, alpha = histogram_image(part)
+        if counts is None:
+            channels = HISTOGRAM_CHANNELS[image.mode]
+            counts = np.zeros(256 * len(channels), dtype=np.int64)
+        count_pixels(image, alpha, counts)
+    if counts is None:
+        channels = HISTOGRAM_CHANNELS["RGB"]
+        counts = np.zeros(256 * len(channels), dtype=np.int64)
+    return list(zip(channels, counts.reshape(len(channels), 256)))
+
+
+def count_pixels(image, alpha, counts):
+    """Adds the band values of an L or RGB image to ``counts``, a block at a time."""
+    bands = len(image.getbands())
+    pixels = np.asarray(image).reshape(image.height, image.width, bands)
+    opaque = None if alpha is None else np.asarray(alpha) > 0
+    offsets = np.arange(bands, dtype=np.uint16) * 256
+    for top in range(0, image.height, HISTOGRAM_BLOCK_ROWS):
+        block = pixels[top : top + HISTOGRAM_BLOCK_ROWS]
+        if opaque is not None:
+            block = block[opaque[top : top + HISTOGRAM_BLOCK_ROWS]]
+        indices = block.reshape(-1, bands) + offsets
+        counts += np.bincount(indices.ravel(), minlength=counts.size)
+
+
+def write_histogram_plot(image_path, path, tiles=None):
+    """Renders the colour histogram plot of an image into ``path``, in-process."""
+    histogram = generate_color_histogram(image_path, tiles=tiles)
+    with open(path, "wb") as f:
+        f.write(render_lines(histogram, xlim=(0, 256)))
 
 
 # image_processing/utils.py (continuation)
-def resize_image(image_path, width, height):
-    image = Image.open(image_path)
-    resized_image = image.resize((width, height))
+# How much larger than the target an image is kept before its final,
+# filtered resize; Pillow's own thumbnail() default.
+REDUCING_GAP = 2.0
+# Modes each format can store; other images are converted to RGB first.
+ENCODABLE_MODES = {"JPEG": ("RGB", "L", "CMYK")}
+# Encoder options by preset and format, trading encode time against size
+# and fidelity. On a 1024px photo: fast-preview encodes JPEG in ~8 ms and
+# PNG in ~170 ms; archival keeps full chroma and lossless WebP/PNG at
+# several hundred ms to seconds.
+ENCODER_PRESETS = {
+    "fast-preview": {
+        "JPEG": {"quality": 75},
+        "WEBP": {"quality": 75, "method": 0},
+        "PNG": {"compress_level": 1},
+    },
+    "balanced": {
+        "JPEG": {"quality": 82, "optimize": True, "progressive": True},
+        "WEBP": {"quality": 80, "method": 4},
+        "PNG": {"compress_level": 6},
+    },
+    "archival": {
+        "JPEG": {
+            "quality": 95,
+            "optimize": True,
+            "progressive": True,
+            "subsampling": 0,
+        },
+        "WEBP": {"lossless": True, "quality": 50, "method": 4},
+        "PNG": {"compress_level": 9},
+    },
+}
+
+
+def open_image(image):
+    """Opens ``image`` if it is a path; an opened image is returned as is."""
+    return image if isinstance(image, Image.Image) else Image.open(image)
+
+
+def resize_image(image, width, height):
+    """
+    Resizes an image (a path or an opened image) to exactly ``width`` x
+    ``height``.
+
+    When shrinking, JPEGs not yet decoded are decoded at a reduced DCT scale
+    (``draft``) and other images are first reduced by whole factors with box
+    averaging (``reducing_gap``), each down to no less than REDUCING_GAP
+    times the target, so only the last step runs the full Lanczos filter.
+    Enlarging uses bicubic interpolation.
+    """
+    image = open_image(image)
+    shrinking = width < image.width or height < image.height
+    if shrinking and image.format == "JPEG":
+        image.draft(None, (int(width * REDUCING_GAP), int(height * REDUCING_GAP)))
+    if width <= image.width and height <= image.height:
+        resample, reducing_gap = Image.Resampling.LANCZOS, REDUCING_GAP
+    else:
+        resample, reducing_gap = Image.Resampling.BICUBIC, None
+    resized_image = image.resize(
+        (width, height), resample=resample, reducing_gap=reducing_gap
+    )
     return resized_image
 
 
-def crop_image(image_path, left, top, right, bottom):
-    image = Image.open(image_path)
+def fit_size(size, width, height):
+    """
+    The largest size with the aspect ratio of ``size`` that fits within
+    ``width`` x ``height``, never larger than ``size`` itself.
+    """
+    scale = min(width / size[0], height / size[1], 1)
+    return max(round(size[0] * scale), 1), max(round(size[1] * scale), 1)
+
+
+def fit_image(image, width, height):
+    """
+    Shrinks an image (a path or an opened image) to fit within ``width`` x
+    ``height``, keeping its aspect ratio; see resize_image. Images already
+    inside the box are returned as they are.
+    """
+    image = open_image(image)
+    size = fit_size(image.size, width, height)
+    return image if size == image.size else resize_image(image, *size)
+
+
+def crop_image(image, left, top, right, bottom):
+    image = open_image(image)
     cropped_image = image.crop((left, top, right, bottom))
     return cropped_image
 
 
-def convert_image_format(image_path, format="JPEG"):
-    image = Image.open(image_path)
-    buffer = io.BytesIO()
-    image.save(buffer, format=format)
-    buffer.seek(0)
-    return buffer
+def encode_image(image, target, format="PNG", quality=None, preset=None):
+    """
+    Encodes ``image`` as ``format`` into ``target`` (a path or a file) with
+    the encoder options of an ENCODER_PRESETS ``preset``, if given;
+    ``quality`` overrides the preset's for the formats that take it.
+    """
+    modes = ENCODABLE_MODES.get(format)
+    if modes and image.mode not in modes:
+        image = image.convert("RGB")
+    options = dict(ENCODER_PRESETS[preset].get(format, {})) if preset else {}
+    if quality is not None:
+        options["quality"] = quality
+    image.save(target, format=format, **options)
+
+
+def has_transparency(image):
+    """Whether an image (a path or an opened image) has alpha or transparency."""
+    image = open_image(image)
+    return image.has_transparency_data
+
+
+# Pipeline operations by name, with the integer parameters each one takes.
+OPERATIONS = {
+    "resize": (resize_image, ("width", "height")),
+    "fit": (fit_image, ("width", "height")),
+    "crop": (crop_image, ("left", "top", "right", "bottom")),
+}
+
+
+def run_pipeline(image_path, spec, target, tiles=None):
+    """
+    Applies a canonical pipeline ``spec`` (see derivatives.canonical_pipeline)
+    to an image and encodes the result into ``target``. The image is opened
+    lazily, so a leading resize can still draft the decode; with a tile
+    pyramid in ``tiles``, only what the leading crop or resize needs is read.
+    """
+    image, steps = open_source(image_path, spec["operations"], tiles)
+    for name, params in steps:
+        image = OPERATIONS[name][0](image, **params)
+    encode_image(image, target, spec["format"], spec["quality"], spec["preset"])
+
+
+def open_source(image_path, steps, tiles=None):
+    """
+    Opens the image a pipeline starts from and returns it with the steps
+    left to run. From a tile pyramid, a leading crop is read from the
+    tiles it overlaps, and a leading resize or fit (after the crop, if
+    any) from the coarsest level still REDUCING_GAP times the target size.
+    """
+    pyramid = Pyramid.open(tiles) if tiles else None
+    if pyramid is None or not steps or steps[0][0] not in OPERATIONS:
+        return open_image(image_path), steps
+    box = (0, 0, pyramid.width, pyramid.height)
+    if steps[0][0] == "crop":
+        params = steps[0][1]
+        box = (params["left"], params["top"], params["right"], params["bottom"])
+        steps = steps[1:]
+    level = None
+    if steps and steps[0][0] == "fit":
+        # The box's size is known here, so the fit becomes a plain resize.
+        size = fit_size((box[2] - box[0], box[3] - box[1]), **steps[0][1])
+        steps = [["resize", {"width": size[0], "height": size[1]}], *steps[1:]]
+    if steps and steps[0][0] == "resize":
+        size = (steps[0][1]["width"], steps[0][1]["height"])
+        level = pyramid.level_for(box, [n * REDUCING_GAP for n in size])
+    return pyramid.region(box, level), steps
+
+
+# Width and height of the grayscale thumbnail a difference hash compares;
+# one column more than the bits per row.
+DHASH_SIZE = (9, 8)
+
+
+def perceptual_hash(image):
+    """
+    64-bit difference hash (dHash) of an image (a path, file or opened
+    image) as 16 hex digits. The image is shrunk to 9x8 grayscale and each
+    bit says whether a pixel is brighter than its right neighbour, so
+    re-encoded, resized or lightly edited copies differ in few bits. JPEGs
+    are drafted down on decode.
+    """
+    image = open_image(image)
+    draft_size = tuple(int(n * REDUCING_GAP) for n in DHASH_SIZE)
+    image.draft("L", draft_size)
+    if image.mode.startswith("I;16"):
+        image = Image.fromarray((np.asarray(image) >> 8).astype(np.uint8))
+    image = image.convert("L").resize(
+        DHASH_SIZE, Image.Resampling.LANCZOS, reducing_gap=REDUCING_GAP
+    )
+    pixels = np.asarray(image, dtype=np.int16)
+    bits = np.packbits(pixels[:, 1:] > pixels[:, :-1])
+    return bits.tobytes().hex()
@@ -5,16 +5,47 @@ from ..models import UploadedImage
 from .serializer import UploadedImageSerializer
 from PIL import Image
 import os
-import io
-from .utils import generate_color_histogram, save_histogram_plot
-from django.http import FileResponse
-from .utils import resize_image, crop_image, convert_image_format
+import json
+from .histograms import ensure_histogram, histogram_key, histogram_plot, prepare_upload, region_histogram
+from django.http import HttpResponse, StreamingHttpResponse
+from .batch import histogram_jobs, run_jobs, stream_zip, transform_jobs
+from .derivatives import (
+    cache_key,
+    canonical_pipeline,
+    content_type,
+    derivative_key,
+    derivative_path,
+    ensure_tiles,
+    image_tiles,
+    negotiate_format,
+)
+from corporatica.cache import cache_digest
+from corporatica.http import file_response
+import functools
+from .similarity import BKTree, ensure_perceptual_hash, similar_images
+from .tiles import Pyramid
+from .utils import ENCODER_PRESETS, has_transparency, perceptual_hash
+from django.utils.cache import patch_vary_headers
+from django.conf import settings
+from corporatica.workers import background
 from rest_framework import generics
 from rest_framework.permissions import IsAuthenticated
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
+from corporatica.uploadhandler import UploadHandlerMixin
 
-class UploadedImageView(generics.CreateAPIView):
+class ImageResponseMixin:
+    """
+    For views answering with image files: an Accept header naming only
+    image types is for negotiate_format, so DRF must not refuse it with a
+    406; JSON errors are rendered regardless.
+    """
+
+    def perform_content_negotiation(self, request, force=False):
+        return super().perform_content_negotiation(request, force=True)
+
+
+class UploadedImageView(UploadHandlerMixin, generics.CreateAPIView):
     permission_classes = [IsAuthenticated]
     serializer_class = UploadedImageSerializer
     @swagger_auto_schema(
@@ -49,12 +80,16 @@ class UploadedImageView(generics.CreateAPIView):
     def create(self, request, *args, **kwargs):
         serializer = UploadedImageSerializer(data=request.data)
         if serializer.is_valid():
-            serializer.save()
+            file = request.FILES["image"]
+            image = serializer.save(
+                content_hash=file.content_hash, perceptual_hash=perceptual_hash(file)
+            )
+            background(prepare_upload, image)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class BatchUploadView(generics.CreateAPIView):
+class BatchUploadView(UploadHandlerMixin, generics.CreateAPIView):
     permission_classes = [IsAuthenticated]
     serializer_class = UploadedImageSerializer
     @swagger_auto_schema(
@@ -67,16 +102,26 @@ class BatchUploadView(generics.CreateAPIView):
                     items=openapi.Items(type=openapi.TYPE_STRING, format=openapi.FORMAT_BINARY),
                     description='List of images to upload'
                 ),
+                'reject_duplicates': openapi.Schema(
+                    type=openapi.TYPE_BOOLEAN,
+                    description='Skip images within IMAGE_DUPLICATE_DISTANCE bits of a stored image or an earlier one in the batch (perceptual hash)'
+                ),
             },
             required=['images']
         ),
         responses={
             201: openapi.Response(
-                description='Images uploaded successfully',
+                description='Images uploaded successfully; with reject_duplicates, {"images": [...], "rejected": [...]}',
                 schema=openapi.Schema(
                     type=openapi.TYPE_ARRAY,
                     items=openapi.Items(type=openapi.TYPE_OBJECT, properties=UploadedImageSerializer().fields)
-                )
+                ),
+                examples={
+                    'application/json': {
+                        'images': [{'id': 12, 'image': '/media/images/ab/cd/abcd.jpeg', 'content_hash': 'abcd', 'perceptual_hash': 'f0e4c2d0b0a89c8c'}],
+                        'rejected': [{'name': 'render_copy.jpeg', 'duplicate_of': 7, 'distance': 0}]
+                    }
+                }
             ),
             400: openapi.Response(
                 description='Invalid input',
@@ -91,26 +136,145 @@ class BatchUploadView(generics.CreateAPIView):
     )
     def create(self, request, *args, **kwargs):
         files = request.FILES.getlist("images")
-        images = []
+        reject = str(request.data.get("reject_duplicates", "")).lower() in ("1", "true", "yes")
+        distance = settings.IMAGE_DUPLICATE_DISTANCE
+        # Accepted images of this batch, so it cannot duplicate itself either.
+        batch = BKTree()
+        hashes = []
         for file in files:
-            image = UploadedImage(image=file)
-            image.save()
-            images.append(UploadedImageSerializer(image).data)
-        return Response(images, status=status.HTTP_201_CREATED)
+            try:
+                hashes.append(perceptual_hash(file))
+            except OSError:
+                return Response(
+                    {"error": f"Not an image: {file.name}"},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+        images, rejected = [], []
+        for file, value in zip(files, hashes):
+            image = UploadedImage(content_hash=file.content_hash, perceptual_hash=value)
+            if reject:
+                matches = [
+                    *similar_images(image.perceptual_hash, distance),
+                    *batch.search(int(image.perceptual_hash, 16), distance),
+                ]
+                if matches:
+                    rejected.append((file.name, *min(matches, key=lambda match: match[0])))
+                    continue
+                batch.add(int(image.perceptual_hash, 16), image)
+            image.image.save(file.name, file, save=False)
+            images.append(image)
+        # One INSERT for the whole batch once the files are stored.
+        images = UploadedImage.objects.bulk_create(images)
+        for image in images:
+            background(prepare_upload, image)
+        data = UploadedImageSerializer(images, many=True).data
+        if reject:
+            data = {
+                "images": data,
+                "rejected": [
+                    {"name": name, "duplicate_of": original.id, "distance": d}
+                    for name, d, original in rejected
+                ],
+            }
+        return Response(data, status=status.HTTP_201_CREATED)
 
 
-class ColorHistogramView(generics.ListAPIView):
+class SimilarImagesView(generics.ListAPIView):
     permission_classes = [IsAuthenticated]
     serializer_class = UploadedImageSerializer
     @swagger_auto_schema(
         tags=["Image Processing"],
+        operation_description="Stored images whose perceptual hash is within max_distance bits of the image's, nearest first.",
         manual_parameters=[
-            openapi.Parameter('image_id', openapi.IN_QUERY, description="ID of the image", type=openapi.TYPE_INTEGER)
+            openapi.Parameter('image_id', openapi.IN_QUERY, description="ID of the image", type=openapi.TYPE_INTEGER),
+            openapi.Parameter('max_distance', openapi.IN_QUERY, description="Differing bits allowed, 0 to 64 (default IMAGE_DUPLICATE_DISTANCE)", type=openapi.TYPE_INTEGER)
         ],
         responses={
             200: openapi.Response(
-                description='Color histogram generated successfully',
-                schema=openapi.Schema(type=openapi.TYPE_FILE)
+                description='Similar images',
+                examples={
+                    'application/json': {
+                        'image_id': 7,
+                        'perceptual_hash': 'f0e4c2d0b0a89c8c',
+                        'similar': [{'id': 9, 'image': '/media/images/ab/cd/abcd.jpeg', 'distance': 2}]
+                    }
+                }
+            ),
+            404: openapi.Response(
+                description='Image not found',
+                examples={
+                    'application/json': {
+                        'error': 'Image not found'
+                    }
+                }
+            )
+        }
+    )
+    def list(self, request, *args, **kwargs):
+        try:
+            max_distance = int(request.query_params.get("max_distance", settings.IMAGE_DUPLICATE_DISTANCE))
+            if not 0 <= max_distance <= 64:
+                raise ValueError("max_distance must be between 0 and 64")
+            image = UploadedImage.objects.get(id=request.query_params.get("image_id"))
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except UploadedImage.DoesNotExist:
+            return Response(
+                {"error": "Image not found"}, status=status.HTTP_404_NOT_FOUND
+            )
+        value = ensure_perceptual_hash(image)
+        similar = similar_images(value, max_distance, exclude={image.id})
+        return Response(
+            {
+                "image_id": image.id,
+                "perceptual_hash": value,
+                "similar": [
+                    {**UploadedImageSerializer(match).data, "distance": distance}
+                    for distance, match in similar
+                ],
+            }
+        )
+
+
+REGION_PARAMS = ("left", "top", "right", "bottom")
+
+
+def parse_region(params):
+    """The (left, top, right, bottom) box given in ``params``, or None."""
+    given = [name for name in REGION_PARAMS if params.get(name) not in (None, "")]
+    if not given:
+        return None
+    if len(given) < len(REGION_PARAMS):
+        raise ValueError("A region needs left, top, right and bottom")
+    left, top, right, bottom = (int(params[name]) for name in REGION_PARAMS)
+    if right <= left or bottom <= top:
+        raise ValueError("A region needs right > left and bottom > top")
+    return left, top, right, bottom
+
+
+class ColorHistogramView(ImageResponseMixin, generics.ListAPIView):
+    permission_classes = [IsAuthenticated]
+    serializer_class = UploadedImageSerializer
+    @swagger_auto_schema(
+        tags=["Image Processing"],
+        manual_parameters=[
+            openapi.Parameter('image_id', openapi.IN_QUERY, description="ID of the image", type=openapi.TYPE_INTEGER),
+            openapi.Parameter('output', openapi.IN_QUERY, description="png (default) for the plot or json for the raw counts", type=openapi.TYPE_STRING, enum=['png', 'json']),
+            *[
+                openapi.Parameter(name, openapi.IN_QUERY, description=f"{name.capitalize()} of a region to count instead of the whole image; give all four", type=openapi.TYPE_INTEGER)
+                for name in REGION_PARAMS
+            ],
+        ],
+        responses={
+            200: openapi.Response(
+                description='Color histogram plot, or 256 counts per channel as JSON',
+                schema=openapi.Schema(type=openapi.TYPE_FILE),
+                examples={
+                    'application/json': {
+                        'image_id': 1,
+                        'channels': {'red': [12, 0, 3], 'green': [4, 9, 1], 'blue': [7, 2, 5]}
+                    }
+                }
             ),
             404: openapi.Response(
                 description='Image not found',
@@ -123,18 +287,85 @@ class ColorHistogramView(generics.ListAPIView):
         }
     )
     def list(self, request, *args, **kwargs):
+        output = request.query_params.get("output", "png")
+        if output not in ("png", "json"):
+            return Response(
+                {"error": "output must be png or json"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
         try:
+            box = parse_region(request.query_params)
             image = UploadedImage.objects.get(id=request.query_params.get("image_id"))
-            histogram_data = generate_color_histogram(image.image.path)
-            histogram_plot = save_histogram_plot(histogram_data)
-            return FileResponse(histogram_plot, content_type="image/png")
+            if output == "json":
+                channels = ensure_histogram(image) if box is None else region_histogram(image, box)
+                return Response({"image_id": image.id, "channels": channels})
+            return file_response(
+                request,
+                functools.partial(histogram_plot, image, box),
+                "image/png",
+                histogram_key(image, box),
+            )
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
         except UploadedImage.DoesNotExist:
             return Response(
                 {"error": "Image not found"}, status=status.HTTP_404_NOT_FOUND
             )
 
 
-class ResizeImageView(generics.CreateAPIView):
+def request_params(request):
+    """
+    The query string of a GET (which CDNs and browsers can cache), else the
+    body. DRF keeps ``format`` in query strings for itself, so there the
+    output format is given as ``output``.
+    """
+    if request.method not in ("GET", "HEAD"):
+        return request.data
+    params = request.query_params.dict()
+    if "output" in params:
+        params["format"] = params.pop("output")
+    return params
+
+
+def derivative_response(
+    request, image, operations=(), format=None, quality=None, preset=None, default="PNG"
+):
+    """
+    Serves a derivative (see derivatives.derivative) from the cache file,
+    tagged with its cache key as a strong ETag. The tag is known before the
+    file is, so a matching If-None-Match is answered 304 without touching
+    the cache; Range requests get partial content.
+
+    Without a ``format`` the smallest one the Accept header names is used
+    (see negotiate_format), falling back to ``default``.
+    """
+    negotiated = not format
+    if negotiated:
+        format = negotiate_format(
+            request.headers.get("Accept"), has_transparency(image.image.path), default
+        )
+    spec = canonical_pipeline(operations, format, quality, preset)
+    # One look at the pyramid, so the tag always names the bytes served.
+    tiles = image_tiles(image)
+    response = file_response(
+        request,
+        functools.partial(derivative_path, image, spec, tiles),
+        content_type(spec["format"]),
+        derivative_key(image, spec, tiles),
+    )
+    if negotiated:
+        patch_vary_headers(response, ["Accept"])
+    return response
+
+
+CONDITIONAL_RESPONSES = {
+    206: openapi.Response(description='Requested byte range', schema=openapi.Schema(type=openapi.TYPE_FILE)),
+    304: openapi.Response(description='Not modified; If-None-Match names the current ETag'),
+    416: openapi.Response(description='Range not satisfiable'),
+}
+
+
+class ResizeImageView(ImageResponseMixin, generics.CreateAPIView):
     permission_classes = [IsAuthenticated]
     serializer_class = UploadedImageSerializer
 
@@ -146,6 +377,10 @@ class ResizeImageView(generics.CreateAPIView):
                 'image_id': openapi.Schema(type=openapi.TYPE_INTEGER, description='ID of the image to resize'),
                 'width': openapi.Schema(type=openapi.TYPE_INTEGER, description='New width of the image'),
                 'height': openapi.Schema(type=openapi.TYPE_INTEGER, description='New height of the image'),
+                'fit': openapi.Schema(type=openapi.TYPE_BOOLEAN, description='Shrink to fit within width x height, keeping the aspect ratio', default=False),
+                'format': openapi.Schema(type=openapi.TYPE_STRING, description='Output format; by default the smallest the Accept header names, else PNG'),
+                'quality': openapi.Schema(type=openapi.TYPE_INTEGER, description='Encoder quality (1-100) for lossy formats, overriding the preset'),
+                'preset': openapi.Schema(type=openapi.TYPE_STRING, description='Encoder preset (default IMAGE_ENCODER_PRESET)', enum=list(ENCODER_PRESETS)),
             },
             required=['image_id', 'width', 'height']
         ),
@@ -165,22 +400,60 @@ class ResizeImageView(generics.CreateAPIView):
         }
     )
     def create(self, request, *args, **kwargs):
-        width = int(request.data.get("width"))
-        height = int(request.data.get("height"))
+        params = request_params(request)
+        fit = str(params.get("fit", "")).lower() in ("1", "true", "yes")
         try:
-            image = UploadedImage.objects.get(id=request.data.get("image_id"))
-            resized_image = resize_image(image.image.path, width, height)
-            buffer = io.BytesIO()
-            resized_image.save(buffer, format="PNG")
-            buffer.seek(0)
-            return FileResponse(buffer, content_type="image/png")
+            width = int(params.get("width"))
+            height = int(params.get("height"))
+            image = UploadedImage.objects.get(id=params.get("image_id"))
+            return derivative_response(
+                request,
+                image,
+                [{"op": "fit" if fit else "resize", "width": width, "height": height}],
+                params.get("format"),
+                params.get("quality"),
+                params.get("preset"),
+            )
         except UploadedImage.DoesNotExist:
             return Response(
                 {"error": "Image not found"}, status=status.HTTP_404_NOT_FOUND
             )
+        except (TypeError, ValueError) as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
+    @swagger_auto_schema(
+        tags=["Image Processing"],
+        operation_description="Resize an image; the GET form of POST resize_image, cacheable and conditional.",
+        manual_parameters=[
+            openapi.Parameter('image_id', openapi.IN_QUERY, description="ID of the image to resize", type=openapi.TYPE_INTEGER),
+            openapi.Parameter('width', openapi.IN_QUERY, description="New width of the image", type=openapi.TYPE_INTEGER),
+            openapi.Parameter('height', openapi.IN_QUERY, description="New height of the image", type=openapi.TYPE_INTEGER),
+            openapi.Parameter('fit', openapi.IN_QUERY, description="Shrink to fit within width x height, keeping the aspect ratio", type=openapi.TYPE_BOOLEAN, default=False),
+            openapi.Parameter('output', openapi.IN_QUERY, description="Output format; by default the smallest the Accept header names, else PNG", type=openapi.TYPE_STRING),
+            openapi.Parameter('quality', openapi.IN_QUERY, description="Encoder quality (1-100) for lossy formats, overriding the preset", type=openapi.TYPE_INTEGER),
+            openapi.Parameter('preset', openapi.IN_QUERY, description="Encoder preset (default IMAGE_ENCODER_PRESET)", type=openapi.TYPE_STRING, enum=list(ENCODER_PRESETS)),
+        ],
+        responses={
+            200: openapi.Response(
+                description='Image resized successfully',
+                schema=openapi.Schema(type=openapi.TYPE_FILE)
+            ),
+            **CONDITIONAL_RESPONSES,
+            404: openapi.Response(
+                description='Image not found',
+                examples={
+                    'application/json': {
+                        'error': 'Image not found'
+                    }
+                }
+            )
+        }
+    )
+    def get(self, request, *args, **kwargs):
+        return self.create(request, *args, **kwargs)
 
-class CropImageView(generics.CreateAPIView):
+
+class CropImageView(ImageResponseMixin, generics.CreateAPIView):
     permission_classes = [IsAuthenticated]
     serializer_class = UploadedImageSerializer
 
@@ -194,6 +467,9 @@ class CropImageView(generics.CreateAPIView):
                 'top': openapi.Schema(type=openapi.TYPE_INTEGER, description='Top coordinate for cropping'),
                 'right': openapi.Schema(type=openapi.TYPE_INTEGER, description='Right coordinate for cropping'),
                 'bottom': openapi.Schema(type=openapi.TYPE_INTEGER, description='Bottom coordinate for cropping'),
+                'format': openapi.Schema(type=openapi.TYPE_STRING, description='Output format; by default the smallest the Accept header names, else PNG'),
+                'quality': openapi.Schema(type=openapi.TYPE_INTEGER, description='Encoder quality (1-100) for lossy formats, overriding the preset'),
+                'preset': openapi.Schema(type=openapi.TYPE_STRING, description='Encoder preset (default IMAGE_ENCODER_PRESET)', enum=list(ENCODER_PRESETS)),
             },
             required=['image_id', 'left', 'top', 'right', 'bottom']
         ),
@@ -213,24 +489,70 @@ class CropImageView(generics.CreateAPIView):
         }
     )
     def create(self, request, *args, **kwargs):
-        left = int(request.data.get("left"))
-        top = int(request.data.get("top"))
-        right = int(request.data.get("right"))
-        bottom = int(request.data.get("bottom"))
+        params = request_params(request)
         try:
-            image = UploadedImage.objects.get(id=request.data.get("image_id"))
-            cropped_image = crop_image(image.image.path, left, top, right, bottom)
-            buffer = io.BytesIO()
-            cropped_image.save(buffer, format="PNG")
-            buffer.seek(0)
-            return FileResponse(buffer, content_type="image/png")
+            left = int(params.get("left"))
+            top = int(params.get("top"))
+            right = int(params.get("right"))
+            bottom = int(params.get("bottom"))
+            image = UploadedImage.objects.get(id=params.get("image_id"))
+            return derivative_response(
+                request,
+                image,
+                [
+                    {
+                        "op": "crop",
+                        "left": left,
+                        "top": top,
+                        "right": right,
+                        "bottom": bottom,
+                    }
+                ],
+                params.get("format"),
+                params.get("quality"),
+                params.get("preset"),
+            )
         except UploadedImage.DoesNotExist:
             return Response(
                 {"error": "Image not found"}, status=status.HTTP_404_NOT_FOUND
             )
+        except (TypeError, ValueError) as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    @swagger_auto_schema(
+        tags=["Image Processing"],
+        operation_description="Crop an image; the GET form of POST crop_image, cacheable and conditional.",
+        manual_parameters=[
+            openapi.Parameter('image_id', openapi.IN_QUERY, description="ID of the image to crop", type=openapi.TYPE_INTEGER),
+            openapi.Parameter('left', openapi.IN_QUERY, description="Left coordinate for cropping", type=openapi.TYPE_INTEGER),
+            openapi.Parameter('top', openapi.IN_QUERY, description="Top coordinate for cropping", type=openapi.TYPE_INTEGER),
+            openapi.Parameter('right', openapi.IN_QUERY, description="Right coordinate for cropping", type=openapi.TYPE_INTEGER),
+            openapi.Parameter('bottom', openapi.IN_QUERY, description="Bottom coordinate for cropping", type=openapi.TYPE_INTEGER),
+            openapi.Parameter('output', openapi.IN_QUERY, description="Output format; by default the smallest the Accept header names, else PNG", type=openapi.TYPE_STRING),
+            openapi.Parameter('quality', openapi.IN_QUERY, description="Encoder quality (1-100) for lossy formats, overriding the preset", type=openapi.TYPE_INTEGER),
+            openapi.Parameter('preset', openapi.IN_QUERY, description="Encoder preset (default IMAGE_ENCODER_PRESET)", type=openapi.TYPE_STRING, enum=list(ENCODER_PRESETS)),
+        ],
+        responses={
+            200: openapi.Response(
+                description='Image cropped successfully',
+                schema=openapi.Schema(type=openapi.TYPE_FILE)
+            ),
+            **CONDITIONAL_RESPONSES,
+            404: openapi.Response(
+                description='Image not found',
+                examples={
+                    'application/json': {
+                        'error': 'Image not found'
+                    }
+                }
+            )
+        }
+    )
+    def get(self, request, *args, **kwargs):
+        return self.create(request, *args, **kwargs)
 
 
-class ConvertImageView(generics.CreateAPIView):
+class ConvertImageView(ImageResponseMixin, generics.CreateAPIView):
     permission_classes = [IsAuthenticated]
     serializer_class = UploadedImageSerializer
 
@@ -240,7 +562,9 @@ class ConvertImageView(generics.CreateAPIView):
             type=openapi.TYPE_OBJECT,
             properties={
                 'image_id': openapi.Schema(type=openapi.TYPE_INTEGER, description='ID of the image to convert'),
-                'format': openapi.Schema(type=openapi.TYPE_STRING, description='Format to convert the image to', default='JPEG'),
+                'format': openapi.Schema(type=openapi.TYPE_STRING, description='Format to convert the image to; by default the smallest the Accept header names, else JPEG'),
+                'quality': openapi.Schema(type=openapi.TYPE_INTEGER, description='Encoder quality (1-100) for lossy formats, overriding the preset'),
+                'preset': openapi.Schema(type=openapi.TYPE_STRING, description='Encoder preset (default IMAGE_ENCODER_PRESET)', enum=list(ENCODER_PRESETS)),
             },
             required=['image_id']
         ),
@@ -260,12 +584,364 @@ class ConvertImageView(generics.CreateAPIView):
         }
     )
     def create(self, request, *args, **kwargs):
-        format = request.data.get("format", "JPEG").upper()
+        params = request_params(request)
         try:
-            image = UploadedImage.objects.get(id=request.data.get("image_id"))
-            buffer = convert_image_format(image.image.path, format)
-            return FileResponse(buffer, content_type=f"image/{format.lower()}")
+            image = UploadedImage.objects.get(id=params.get("image_id"))
+            return derivative_response(
+                request,
+                image,
+                format=params.get("format"),
+                quality=params.get("quality"),
+                preset=params.get("preset"),
+                default="JPEG",
+            )
         except UploadedImage.DoesNotExist:
             return Response(
                 {"error": "Image not found"}, status=status.HTTP_404_NOT_FOUND
-            )
\ No newline at end of file
+            )
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    @swagger_auto_schema(
+        tags=["Image Processing"],
+        operation_description="Convert an image; the GET form of POST convert_image, cacheable and conditional.",
+        manual_parameters=[
+            openapi.Parameter('image_id', openapi.IN_QUERY, description="ID of the image to convert", type=openapi.TYPE_INTEGER),
+            openapi.Parameter('output', openapi.IN_QUERY, description="Format to convert the image to; by default the smallest the Accept header names, else JPEG", type=openapi.TYPE_STRING),
+            openapi.Parameter('quality', openapi.IN_QUERY, description="Encoder quality (1-100) for lossy formats, overriding the preset", type=openapi.TYPE_INTEGER),
+            openapi.Parameter('preset', openapi.IN_QUERY, description="Encoder preset (default IMAGE_ENCODER_PRESET)", type=openapi.TYPE_STRING, enum=list(ENCODER_PRESETS)),
+        ],
+        responses={
+            200: openapi.Response(
+                description='Image converted successfully',
+                schema=openapi.Schema(type=openapi.TYPE_FILE)
+            ),
+            **CONDITIONAL_RESPONSES,
+            404: openapi.Response(
+                description='Image not found',
+                examples={
+                    'application/json': {
+                        'error': 'Image not found'
+                    }
+                }
+            )
+        }
+    )
+    def get(self, request, *args, **kwargs):
+        return self.create(request, *args, **kwargs)
+
+
+class PipelineImageView(ImageResponseMixin, generics.CreateAPIView):
+    permission_classes = [IsAuthenticated]
+    serializer_class = UploadedImageSerializer
+
+    @swagger_auto_schema(
+        tags=["Image Processing"],
+        operation_description=(
+            "Apply an ordered list of operations to an image with a single decode "
+            "and a single encode. Results are cached by their canonical spec."
+        ),
+        request_body=openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            properties={
+                'image_id': openapi.Schema(type=openapi.TYPE_INTEGER, description='ID of the image'),
+                'operations': openapi.Schema(
+                    type=openapi.TYPE_ARRAY,
+                    items=openapi.Schema(type=openapi.TYPE_OBJECT),
+                    description=(
+                        'Steps in order, e.g. [{"op": "crop", "left": 0, "top": 0, '
+                        '"right": 800, "bottom": 600}, {"op": "resize", "width": 400, '
+                        '"height": 300}, {"op": "convert", "format": "WEBP", "quality": 80}]; '
+                        '"fit" takes width and height like resize but keeps the aspect ratio'
+                    ),
+                ),
+                'format': openapi.Schema(type=openapi.TYPE_STRING, description='Output format; by default the smallest the Accept header names, else PNG'),
+                'quality': openapi.Schema(type=openapi.TYPE_INTEGER, description='Encoder quality (1-100) for lossy formats, overriding the preset'),
+                'preset': openapi.Schema(type=openapi.TYPE_STRING, description='Encoder preset (default IMAGE_ENCODER_PRESET)', enum=list(ENCODER_PRESETS)),
+            },
+            required=['image_id', 'operations']
+        ),
+        responses={
+            200: openapi.Response(
+                description='Transformed image',
+                schema=openapi.Schema(type=openapi.TYPE_FILE)
+            ),
+            400: openapi.Response(
+                description='Invalid operations',
+                examples={
+                    'application/json': {
+                        'error': "Unknown operation 'rotate'; use convert, resize, fit, crop"
+                    }
+                }
+            ),
+            404: openapi.Response(
+                description='Image not found',
+                examples={
+                    'application/json': {
+                        'error': 'Image not found'
+                    }
+                }
+            )
+        }
+    )
+    def create(self, request, *args, **kwargs):
+        params = request_params(request)
+        operations = params.get("operations") or []
+        try:
+            if isinstance(operations, str):
+                operations = json.loads(operations)
+            image = UploadedImage.objects.get(id=params.get("image_id"))
+            return derivative_response(
+                request,
+                image,
+                operations,
+                params.get("format"),
+                params.get("quality"),
+                params.get("preset"),
+            )
+        except UploadedImage.DoesNotExist:
+            return Response(
+                {"error": "Image not found"}, status=status.HTTP_404_NOT_FOUND
+            )
+        except (TypeError, ValueError) as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    @swagger_auto_schema(
+        tags=["Image Processing"],
+        operation_description="Run a pipeline; the GET form of POST pipeline, cacheable and conditional.",
+        manual_parameters=[
+            openapi.Parameter('image_id', openapi.IN_QUERY, description="ID of the image", type=openapi.TYPE_INTEGER),
+            openapi.Parameter('operations', openapi.IN_QUERY, description="Steps as a JSON array, as in the POST body", type=openapi.TYPE_STRING),
+            openapi.Parameter('output', openapi.IN_QUERY, description="Output format; by default the smallest the Accept header names, else PNG", type=openapi.TYPE_STRING),
+            openapi.Parameter('quality', openapi.IN_QUERY, description="Encoder quality (1-100) for lossy formats, overriding the preset", type=openapi.TYPE_INTEGER),
+            openapi.Parameter('preset', openapi.IN_QUERY, description="Encoder preset (default IMAGE_ENCODER_PRESET)", type=openapi.TYPE_STRING, enum=list(ENCODER_PRESETS)),
+        ],
+        responses={
+            200: openapi.Response(
+                description='Transformed image',
+                schema=openapi.Schema(type=openapi.TYPE_FILE)
+            ),
+            **CONDITIONAL_RESPONSES,
+            404: openapi.Response(
+                description='Image not found',
+                examples={
+                    'application/json': {
+                        'error': 'Image not found'
+                    }
+                }
+            )
+        }
+    )
+    def get(self, request, *args, **kwargs):
+        return self.create(request, *args, **kwargs)
+
+
+def parse_ids(value):
+    """Image ids given as a list, a JSON array or comma-separated strings."""
+    if isinstance(value, str):
+        if value.lstrip().startswith("["):
+            return parse_ids(json.loads(value))
+        return [int(item) for item in value.split(",") if item.strip()]
+    return [i for item in value or [] for i in (parse_ids(item) if isinstance(item, str) else [int(item)])]
+
+
+def get_images(data):
+    """The images named by ``image_ids``, in order; DoesNotExist if any is missing."""
+    ids = parse_ids(data.getlist("image_ids") if hasattr(data, "getlist") else data.get("image_ids"))
+    if not ids:
+        raise ValueError("image_ids is required")
+    found = UploadedImage.objects.in_bulk(ids)
+    missing = [i for i in ids if i not in found]
+    if missing:
+        raise UploadedImage.DoesNotExist(f"Image not found: {missing[0]}")
+    return [found[i] for i in ids]
+
+
+def zip_response(jobs, filename):
+    response = StreamingHttpResponse(
+        stream_zip(run_jobs(jobs)), content_type="application/zip"
+    )
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
+
+
+class BatchTransformView(generics.CreateAPIView):
+    permission_classes = [IsAuthenticated]
+    serializer_class = UploadedImageSerializer
+
+    @swagger_auto_schema(
+        tags=["Image Processing"],
+        operation_description=(
+            "Apply one pipeline of operations (as for the pipeline endpoint) to "
+            "many images in parallel worker processes. Returns a streamed ZIP "
+            "with one <image id>.<extension> entry per image."
+        ),
+        request_body=openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            properties={
+                'image_ids': openapi.Schema(
+                    type=openapi.TYPE_ARRAY,
+                    items=openapi.Schema(type=openapi.TYPE_INTEGER),
+                    description='IDs of the images to process'
+                ),
+                'operations': openapi.Schema(
+                    type=openapi.TYPE_ARRAY,
+                    items=openapi.Schema(type=openapi.TYPE_OBJECT),
+                    description='Steps in order, e.g. [{"op": "resize", "width": 200, "height": 200}]',
+                ),
+                'format': openapi.Schema(type=openapi.TYPE_STRING, description='Output format', default='PNG'),
+                'quality': openapi.Schema(type=openapi.TYPE_INTEGER, description='Encoder quality (1-100) for lossy formats'),
+                'preset': openapi.Schema(type=openapi.TYPE_STRING, description='Encoder preset (default IMAGE_ENCODER_PRESET)', enum=list(ENCODER_PRESETS)),
+            },
+            required=['image_ids', 'operations']
+        ),
+        responses={
+            200: openapi.Response(
+                description='ZIP archive of the results; failures are listed in errors.json',
+                schema=openapi.Schema(type=openapi.TYPE_FILE)
+            ),
+            400: openapi.Response(
+                description='Invalid operations',
+                examples={'application/json': {'error': 'resize needs height'}}
+            ),
+            404: openapi.Response(
+                description='Image not found',
+                examples={'application/json': {'error': 'Image not found: 7'}}
+            )
+        }
+    )
+    def create(self, request, *args, **kwargs):
+        operations = request.data.get("operations") or []
+        try:
+            if isinstance(operations, str):
+                operations = json.loads(operations)
+            jobs = transform_jobs(
+                get_images(request.data),
+                operations,
+                request.data.get("format", "PNG"),
+                request.data.get("quality"),
+                request.data.get("preset"),
+            )
+        except UploadedImage.DoesNotExist as e:
+            return Response({"error": str(e)}, status=status.HTTP_404_NOT_FOUND)
+        except (TypeError, ValueError) as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return zip_response(jobs, "images.zip")
+
+
+class BatchHistogramView(generics.CreateAPIView):
+    permission_classes = [IsAuthenticated]
+    serializer_class = UploadedImageSerializer
+
+    @swagger_auto_schema(
+        tags=["Image Processing"],
+        operation_description=(
+            "Plot the colour histograms of many images in parallel worker "
+            "processes. Returns a streamed ZIP of <image id>_histogram.png entries."
+        ),
+        request_body=openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            properties={
+                'image_ids': openapi.Schema(
+                    type=openapi.TYPE_ARRAY,
+                    items=openapi.Schema(type=openapi.TYPE_INTEGER),
+                    description='IDs of the images'
+                ),
+            },
+            required=['image_ids']
+        ),
+        responses={
+            200: openapi.Response(
+                description='ZIP archive of histogram plots',
+                schema=openapi.Schema(type=openapi.TYPE_FILE)
+            ),
+            404: openapi.Response(
+                description='Image not found',
+                examples={'application/json': {'error': 'Image not found: 7'}}
+            )
+        }
+    )
+    def create(self, request, *args, **kwargs):
+        try:
+            jobs = histogram_jobs(get_images(request.data))
+        except UploadedImage.DoesNotExist as e:
+            return Response({"error": str(e)}, status=status.HTTP_404_NOT_FOUND)
+        except (TypeError, ValueError) as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return zip_response(jobs, "histograms.zip")
+
+
+class DeepZoomDescriptorView(generics.RetrieveAPIView):
+    permission_classes = [IsAuthenticated]
+    serializer_class = UploadedImageSerializer
+
+    @swagger_auto_schema(
+        tags=["Image Processing"],
+        operation_description=(
+            "Deep Zoom (DZI) descriptor of an image's tile pyramid, for viewers "
+            "such as OpenSeadragon. Tiles are served from "
+            "deep_zoom/<image_id>_files/<level>/<column>_<row>.png. Large images "
+            "are tiled at upload; others are tiled on first request."
+        ),
+        responses={
+            200: openapi.Response(
+                description='DZI XML descriptor',
+                examples={
+                    'application/xml': '<Image TileSize="256" Overlap="0" Format="png" '
+                    'xmlns="http://schemas.microsoft.com/deepzoom/2008"><Size Width="40000" Height="30000"/></Image>'
+                }
+            ),
+            404: openapi.Response(
+                description='Image not found',
+                examples={'application/json': {'error': 'Image not found'}}
+            )
+        }
+    )
+    def retrieve(self, request, image_id, *args, **kwargs):
+        try:
+            image = UploadedImage.objects.get(id=image_id)
+        except UploadedImage.DoesNotExist:
+            return Response({"error": "Image not found"}, status=status.HTTP_404_NOT_FOUND)
+        pyramid = Pyramid.open(ensure_tiles(image, force=True))
+        return HttpResponse(
+            f'<?xml version="1.0" encoding="UTF-8"?>\n'
+            f'<Image xmlns="http://schemas.microsoft.com/deepzoom/2008" '
+            f'TileSize="{pyramid.tile_size}" Overlap="0" Format="png">'
+            f'<Size Width="{pyramid.width}" Height="{pyramid.height}"/></Image>',
+            content_type="application/xml",
+        )
+
+
+class DeepZoomTileView(ImageResponseMixin, generics.RetrieveAPIView):
+    permission_classes = [IsAuthenticated]
+    serializer_class = UploadedImageSerializer
+
+    @swagger_auto_schema(
+        tags=["Image Processing"],
+        operation_description="One PNG tile of an image's Deep Zoom pyramid; see deep_zoom/<image_id>.dzi.",
+        responses={
+            200: openapi.Response(
+                description='PNG tile',
+                schema=openapi.Schema(type=openapi.TYPE_FILE)
+            ),
+            404: openapi.Response(
+                description='Image or tile not found',
+                examples={'application/json': {'error': 'Tile not found'}}
+            )
+        }
+    )
+    def retrieve(self, request, image_id, level, column, row, *args, **kwargs):
+        try:
+            image = UploadedImage.objects.get(id=image_id)
+        except UploadedImage.DoesNotExist:
+            return Response({"error": "Image not found"}, status=status.HTTP_404_NOT_FOUND)
+        pyramid = Pyramid.open(ensure_tiles(image, force=True))
+        try:
+            return file_response(
+                request,
+                pyramid.tile_path(level, column, row),
+                "image/png",
+                cache_digest(cache_key(image), "tile", pyramid.tile_size, level, column, row),
+            )
+        except FileNotFoundError:
+            return Response({"error": "Tile not found"}, status=status.HTTP_404_NOT_FOUND)
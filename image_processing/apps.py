@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class ImageProcessingConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "image_processing"
+
+    def ready(self):
+        # Keeps the perceptual hash index in step with saves and deletes.
+        from .api import similarity  # noqa: F401
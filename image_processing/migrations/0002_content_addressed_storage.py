@@ -0,0 +1,27 @@
+# Generated by Django 4.2 on 2026-10-18 06:08
+
+import corporatica.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("image_processing", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="uploadedimage",
+            name="content_hash",
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.AlterField(
+            model_name="uploadedimage",
+            name="image",
+            field=models.ImageField(
+                storage=corporatica.storage.ContentAddressedStorage(),
+                upload_to=corporatica.storage.ContentAddressedPath("images"),
+            ),
+        ),
+    ]
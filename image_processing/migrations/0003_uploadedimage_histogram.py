@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-18 06:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("image_processing", "0002_content_addressed_storage"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="uploadedimage",
+            name="histogram",
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
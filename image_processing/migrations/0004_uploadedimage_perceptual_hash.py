@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-18 06:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("image_processing", "0003_uploadedimage_histogram"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="uploadedimage",
+            name="perceptual_hash",
+            field=models.CharField(blank=True, max_length=16),
+        ),
+    ]
@@ -0,0 +1,39 @@
+import numpy as np
+from django.db import migrations
+from PIL import Image
+
+
+def perceptual_hash(path):
+    # A frozen copy of the dHash in image_processing.api.utils at the time of
+    # this migration, so it keeps running whatever happens to that module.
+    image = Image.open(path)
+    image.draft("L", (18, 16))
+    if image.mode.startswith("I;16"):
+        image = Image.fromarray((np.asarray(image) >> 8).astype(np.uint8))
+    image = image.convert("L").resize(
+        (9, 8), Image.Resampling.LANCZOS, reducing_gap=2.0
+    )
+    pixels = np.asarray(image, dtype=np.int16)
+    return np.packbits(pixels[:, 1:] > pixels[:, :-1]).tobytes().hex()
+
+
+def backfill_perceptual_hash(apps, schema_editor):
+    UploadedImage = apps.get_model("image_processing", "UploadedImage")
+    for image in UploadedImage.objects.filter(perceptual_hash="").iterator():
+        try:
+            value = perceptual_hash(image.image.path)
+        except (OSError, ValueError):
+            # Missing or unreadable files are hashed on first query instead.
+            continue
+        UploadedImage.objects.filter(pk=image.pk).update(perceptual_hash=value)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("image_processing", "0004_uploadedimage_perceptual_hash"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_perceptual_hash, migrations.RunPython.noop),
+    ]
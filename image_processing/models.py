@@ -1,10 +1,26 @@
 # image_processing/models.py
 from django.db import models
+from corporatica.storage import ContentAddressedPath, ContentAddressedStorage
 from user.models import TimestampedModel
 
 
 class UploadedImage(TimestampedModel):
-    image = models.ImageField(upload_to="images/")
+    """
+    An uploaded image, stored under the SHA-256 of its bytes (``content_hash``)
+    so re-uploads of the same file share one blob and its derivatives.
+
+    :perceptual_hash: 64-bit difference hash (dHash) of the pixels as 16 hex
+        digits; near-identical images differ in few bits.
+    :histogram: 256-bin counts per channel, ``{"red": [...], "green": [...],
+        "blue": [...]}`` or ``{"gray": [...]}``; computed after upload.
+    """
+
+    image = models.ImageField(
+        upload_to=ContentAddressedPath("images"), storage=ContentAddressedStorage()
+    )
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True)
+    perceptual_hash = models.CharField(max_length=16, blank=True)
+    histogram = models.JSONField(null=True, blank=True)
 
     def __str__(self):
         return f"Image {self.id}: {self.image.name}"
@@ -1,3 +1,164 @@
-from django.test import TestCase
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from PIL import Image
+from rest_framework.test import APIRequestFactory, force_authenticate
+from user.models import User
+
+from .api.derivatives import canonical_pipeline, derivative_cache, derivative_key
+from .api.views import CropImageView, ResizeImageView
+from .models import UploadedImage
+
+
+def png_bytes(size=(64, 48)):
+    buffer = io.BytesIO()
+    # Noise, so derivatives are large enough to take ranges of.
+    Image.effect_noise(size, 64).convert("RGB").save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+class ImageTestCase(TestCase):
+    """Stores images and their derivatives in a throwaway media directory."""
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        media_settings = override_settings(
+            MEDIA_ROOT=media,
+            IMAGE_TILE_DIR=os.path.join(media, "cache", "tiles"),
+        )
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        cache = mock.patch.object(
+            derivative_cache, "directory", os.path.join(media, "cache", "images")
+        )
+        cache.start()
+        self.addCleanup(cache.stop)
+        self.user = User.objects.create(username="editor")
+        self.factory = APIRequestFactory()
+
+    def call(self, view, method, data=None, **headers):
+        request = getattr(self.factory, method)("/api/images/", data, **headers)
+        force_authenticate(request, user=self.user)
+        return view.as_view()(request)
+
+    def store(self, content, name="image.png"):
+        return UploadedImage.objects.create(
+            image=SimpleUploadedFile(name, content),
+            content_hash=hashlib.sha256(content).hexdigest(),
+        )
+
+
+class ConditionalResponseTests(ImageTestCase):
+    def setUp(self):
+        super().setUp()
+        self.image = self.store(png_bytes())
+        self.params = {"image_id": self.image.id, "width": 32, "height": 24}
+
+    def resize(self, **headers):
+        return self.call(ResizeImageView, "get", self.params, **headers)
+
+    def full(self):
+        response = self.resize()
+        self.assertEqual(response.status_code, 200)
+        return response["ETag"], b"".join(response.streaming_content)
+
+    def test_whole_file(self):
+        response = self.resize()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        self.assertEqual(response["Content-Type"], "image/png")
+        content = b"".join(response.streaming_content)
+        self.assertEqual(Image.open(io.BytesIO(content)).size, (32, 24))
+        key = derivative_key(
+            self.image,
+            canonical_pipeline([{"op": "resize", "width": 32, "height": 24}]),
+        )
+        self.assertEqual(response["ETag"], f'"{key}"')
+
+    def test_if_none_match(self):
+        etag, _ = self.full()
+        for header in (etag, f"W/{etag}", f'"other", {etag}', "*"):
+            response = self.resize(HTTP_IF_NONE_MATCH=header)
+            self.assertEqual(response.status_code, 304, header)
+            self.assertEqual(response["ETag"], etag)
+            self.assertEqual(response.content, b"")
+        self.assertEqual(self.resize(HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+
+    def test_not_modified_without_rendering(self):
+        spec = canonical_pipeline([{"op": "resize", "width": 32, "height": 24}])
+        key = derivative_key(self.image, spec)
+        response = self.resize(HTTP_IF_NONE_MATCH=f'"{key}"')
+        self.assertEqual(response.status_code, 304)
+        self.assertIsNone(derivative_cache.get(key, ".png"))
+
+    def test_range(self):
+        etag, content = self.full()
+        for header, start, end in [
+            ("bytes=0-99", 0, 99),
+            ("bytes=100-", 100, len(content) - 1),
+            ("bytes=-50", len(content) - 50, len(content) - 1),
+            (f"bytes=10-{len(content) + 100}", 10, len(content) - 1),
+        ]:
+            response = self.resize(HTTP_RANGE=header)
+            self.assertEqual(response.status_code, 206, header)
+            self.assertEqual(
+                response["Content-Range"], f"bytes {start}-{end}/{len(content)}"
+            )
+            self.assertEqual(int(response["Content-Length"]), end - start + 1)
+            self.assertEqual(
+                b"".join(response.streaming_content), content[start : end + 1]
+            )
+            self.assertEqual(response["ETag"], etag)
+
+    def test_if_range(self):
+        etag, content = self.full()
+        response = self.resize(HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE=etag)
+        self.assertEqual(response.status_code, 206)
+        # A stale tag gets the whole file rather than bytes of another one.
+        response = self.resize(HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response.streaming_content), content)
+
+    def test_unsatisfiable_range(self):
+        _, content = self.full()
+        for header in (f"bytes={len(content)}-", "bytes=-0"):
+            response = self.resize(HTTP_RANGE=header)
+            self.assertEqual(response.status_code, 416, header)
+            self.assertEqual(response["Content-Range"], f"bytes */{len(content)}")
+
+    def test_multiple_or_malformed_ranges(self):
+        _, content = self.full()
+        for header in ("bytes=0-9,20-29", "bytes=-", "bytes=9-0", "items=0-9"):
+            response = self.resize(HTTP_RANGE=header)
+            self.assertEqual(response.status_code, 200, header)
+            self.assertEqual(b"".join(response.streaming_content), content)
+
+
+class ParameterTests(ImageTestCase):
+    def test_missing_or_invalid_numbers_are_rejected(self):
+        image = self.store(png_bytes())
+        for view, params in [
+            (ResizeImageView, {"image_id": image.id}),
+            (ResizeImageView, {"image_id": image.id, "width": "wide", "height": 10}),
+            (CropImageView, {"image_id": image.id, "left": 0, "top": 0}),
+            (
+                CropImageView,
+                {"image_id": image.id, "left": "x", "top": 0, "right": 5, "bottom": 5},
+            ),
+            (ResizeImageView, {"image_id": "first", "width": 10, "height": 10}),
+        ]:
+            for method in ("get", "post"):
+                response = self.call(view, method, params)
+                self.assertEqual(response.status_code, 400, (method, params))
+                self.assertIn("error", response.data)
+
+    def test_unknown_image(self):
+        params = {"image_id": 404, "left": 0, "top": 0, "right": 5, "bottom": 5}
+        self.assertEqual(self.call(CropImageView, "get", params).status_code, 404)
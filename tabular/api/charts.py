@@ -0,0 +1,304 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from corporatica.cache import FileCache, cache_digest
+from corporatica.rendering import render_chart as draw_chart
+from corporatica.workers import render
+from django.conf import settings
+
+from .sketches import Reservoir
+from .utils import cache_key, is_numeric, iter_batches, sidecar_schema, to_python
+
+CHART_TYPES = ["bar", "line", "scatter", "histogram"]
+CHART_DATA_FORMATS = {"json": ".json", "arrow": ".arrow"}
+# Aggregations that can be combined across record batches, with the partial
+# aggregates each one needs.
+AGGREGATIONS = {
+    "mean": ["sum", "count"],
+    "sum": ["sum"],
+    "count": ["count"],
+    "min": ["min"],
+    "max": ["max"],
+}
+COMBINE = {"sum": "sum", "count": "sum", "min": "min", "max": "max"}
+
+chart_cache = FileCache(settings.CHART_CACHE_DIR, settings.CHART_CACHE_MAX_BYTES)
+
+
+def lttb(x, y, threshold):
+    """
+    Largest-Triangle-Three-Buckets downsampling of the series (``x``, ``y``)
+    to ``threshold`` points. Each bucket keeps the point spanning the largest
+    triangle with the previously kept point and the next bucket's average,
+    so peaks and troughs survive the reduction.
+    """
+    n = len(x)
+    if n <= threshold:
+        return x, y
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    kept = np.empty(threshold, dtype=np.int64)
+    kept[0], kept[-1] = 0, n - 1
+    previous = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        following = slice(end, edges[i + 2] if i + 2 < len(edges) else n)
+        mean_x, mean_y = x[following].mean(), y[following].mean()
+        area = np.abs(
+            (x[previous] - mean_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (mean_y - y[previous])
+        )
+        previous = kept[i + 1] = start + int(area.argmax())
+    return x[kept], y[kept]
+
+
+def chart_spec(
+    dataset, chart_type="bar", x=None, y=None, agg="mean", bins=30, max_points=1000
+):
+    """
+    Reduced data for a chart of ``dataset``, aggregated over the sidecar one
+    record batch at a time so only what is drawn reaches the renderer:
+
+    * ``bar``: ``agg`` of each ``y`` column, grouped by ``x`` when given
+      (the ``max_points`` largest groups are kept);
+    * ``line``: each ``y`` against ``x`` in row order, LTTB-downsampled to
+      ``max_points`` points;
+    * ``scatter``: a uniform sample of ``max_points`` (``x``, ``y``) pairs;
+    * ``histogram``: counts of each ``y`` column (or ``x``) in ``bins`` bins.
+
+    ``y`` defaults to every numeric column. Returns a dict with the chart
+    ``type``, axis labels and ``series`` of ``{"name", "x", "y"}`` arrays.
+    """
+    if chart_type not in CHART_TYPES:
+        raise ValueError(f"chart_type must be one of {', '.join(CHART_TYPES)}")
+    if agg not in AGGREGATIONS:
+        raise ValueError(f"agg must be one of {', '.join(AGGREGATIONS)}")
+    if bins < 1 or max_points < 3:
+        raise ValueError("bins must be at least 1 and max_points at least 3")
+    fields = {field.name: field for field in sidecar_schema(dataset)}
+    unknown = [c for c in [x, *(y or [])] if c is not None and c not in fields]
+    if unknown:
+        raise ValueError(f"Unknown columns: {', '.join(unknown)}")
+    if chart_type == "histogram" and x is not None and not y:
+        x, y = None, [x]
+    if not y:
+        y = [c for c, field in fields.items() if is_numeric(field) and c != x]
+        if not y:
+            raise ValueError("The dataset has no numeric columns to plot")
+    if not (chart_type == "bar" and agg == "count"):
+        non_numeric = [c for c in y if not is_numeric(fields[c])]
+        if non_numeric:
+            raise ValueError(f"Columns are not numeric: {', '.join(non_numeric)}")
+    if chart_type in ("line", "scatter"):
+        if x is None:
+            raise ValueError(f"A {chart_type} chart needs an x column")
+        if not (is_numeric(fields[x]) or pa.types.is_timestamp(fields[x].type)):
+            raise ValueError(f"Column {x} is neither numeric nor a date")
+
+    if chart_type == "bar":
+        series = _bar_series(dataset, x, y, agg, max_points)
+        ylabel = agg
+    elif chart_type == "line":
+        series = _line_series(dataset, x, y, max_points)
+        ylabel = ", ".join(y)
+    elif chart_type == "scatter":
+        series = _scatter_series(dataset, x, y, max_points)
+        ylabel = ", ".join(y)
+    else:
+        series = _histogram_series(dataset, y, bins)
+        ylabel = "count"
+    return {"type": chart_type, "xlabel": x or "", "ylabel": ylabel, "series": series}
+
+
+def _columns(*columns):
+    return list(dict.fromkeys(c for c in columns if c is not None))
+
+
+def _axis_values(series):
+    """Column values as floats (dates as nanoseconds), with NaN for missing."""
+    if pd.api.types.is_datetime64_any_dtype(series):
+        values = series.to_numpy(dtype="datetime64[ns]").astype(np.int64)
+        values = values.astype(float)
+        values[series.isna().to_numpy()] = np.nan
+        return values
+    return series.to_numpy(dtype=float, na_value=np.nan)
+
+
+def _bar_series(dataset, x, y, agg, max_points):
+    parts = AGGREGATIONS[agg]
+    partials = []
+    for frame in iter_batches(dataset, _columns(x, *y)):
+        keys = frame[x] if x is not None else pd.Series(0, index=frame.index)
+        grouped = frame[y].groupby(keys, sort=False)
+        partials.append(
+            pd.concat({part: getattr(grouped, part)() for part in parts}, axis=1)
+        )
+    if not partials:
+        return []
+    partials = pd.concat(partials)
+    totals = {
+        part: partials[part].groupby(level=0).agg(COMBINE[part]) for part in parts
+    }
+    values = totals["sum"] / totals["count"] if agg == "mean" else totals[agg]
+    values = values.astype(float)
+    if x is None:
+        return [{"name": agg, "x": list(y), "y": values.iloc[0].to_numpy()}]
+    if len(values) > max_points:
+        values = values.loc[values[y[0]].nlargest(max_points).index]
+    values = values.sort_index()
+    return [
+        {"name": column, "x": values.index.to_numpy(), "y": values[column].to_numpy()}
+        for column in y
+    ]
+
+
+def _line_series(dataset, x, y, max_points):
+    chunks = {column: [] for column in y}
+    for frame in iter_batches(dataset, _columns(x, *y)):
+        xs = _axis_values(frame[x])
+        for column in y:
+            ys = _axis_values(frame[column])
+            keep = ~(np.isnan(xs) | np.isnan(ys))
+            chunks[column].append(lttb(xs[keep], ys[keep], max_points))
+    dates = pd.api.types.is_datetime64_any_dtype(frame[x]) if chunks[y[0]] else False
+    series = []
+    for column, points in chunks.items():
+        xs = np.concatenate([p[0] for p in points]) if points else np.empty(0)
+        ys = np.concatenate([p[1] for p in points]) if points else np.empty(0)
+        xs, ys = lttb(xs, ys, max_points)
+        if dates:
+            xs = xs.astype(np.int64).astype("datetime64[ns]")
+        series.append({"name": column, "x": xs, "y": ys})
+    return series
+
+
+def _scatter_series(dataset, x, y, max_points):
+    # A fixed seed keeps the cached chart for a dataset stable.
+    reservoirs = {column: Reservoir(max_points, seed=0) for column in y}
+    for frame in iter_batches(dataset, _columns(x, *y)):
+        for column, reservoir in reservoirs.items():
+            reservoir.update(frame[_columns(x, column)].dropna())
+    series = []
+    for column, reservoir in reservoirs.items():
+        sample = reservoir.sample
+        if sample is None:
+            sample = pd.DataFrame({x: [], column: []})
+        series.append(
+            {
+                "name": column,
+                "x": sample[x].to_numpy(),
+                "y": sample[column].to_numpy(dtype=float, na_value=np.nan),
+            }
+        )
+    return series
+
+
+def _histogram_series(dataset, y, bins):
+    low = pd.Series(np.inf, index=y)
+    high = pd.Series(-np.inf, index=y)
+    for frame in iter_batches(dataset, y):
+        low = np.fmin(low, frame.min())
+        high = np.fmax(high, frame.max())
+    counts = {column: np.zeros(bins, dtype=np.int64) for column in y}
+    edges = {
+        column: np.linspace(low[column], high[column], bins + 1)
+        if np.isfinite(low[column])
+        else np.linspace(0.0, 1.0, bins + 1)
+        for column in y
+    }
+    for frame in iter_batches(dataset, y):
+        for column in y:
+            values = _axis_values(frame[column])
+            values = values[~np.isnan(values)]
+            counts[column] += np.histogram(values, bins=edges[column])[0]
+    return [{"name": column, "x": edges[column], "y": counts[column]} for column in y]
+
+
+def render_chart(dataset, **params):
+    """
+    Path of the PNG for ``chart_spec(dataset, **params)``, rendered once in
+    the render pool and then served from the chart cache for every dataset
+    with the same bytes.
+    """
+    key = cache_digest("chart", cache_key(dataset), params)
+    return chart_cache.get_or_create(
+        key, lambda path: _draw(dataset, params, path), suffix=".png"
+    )
+
+
+def _draw(dataset, params, path):
+    png = render(draw_chart, chart_spec(dataset, **params))
+    with open(path, "wb") as output:
+        output.write(png)
+
+
+def chart_data(dataset, output="json", **params):
+    """
+    Path of ``chart_spec(dataset, **params)`` serialised as compact JSON or
+    an Arrow IPC stream, so clients can draw the chart themselves. Cached
+    alongside the rendered charts.
+    """
+    if output not in CHART_DATA_FORMATS:
+        raise ValueError(f"output must be one of {', '.join(CHART_DATA_FORMATS)}")
+    key = cache_digest("chart-data", cache_key(dataset), params)
+    write = _write_json if output == "json" else _write_arrow
+    return chart_cache.get_or_create(
+        key,
+        lambda path: write(chart_spec(dataset, **params), path),
+        suffix=CHART_DATA_FORMATS[output],
+    )
+
+
+def _json_values(values):
+    values = np.asarray(values)
+    if np.issubdtype(values.dtype, np.datetime64):
+        strings = np.datetime_as_string(values, unit="ms")
+        return [None if value == "NaT" else value for value in strings.tolist()]
+    return [to_python(value) for value in values.tolist()]
+
+
+def _write_json(spec, path):
+    document = dict(
+        spec,
+        series=[
+            {
+                "name": item["name"],
+                "x": _json_values(item["x"]),
+                "y": _json_values(item["y"]),
+            }
+            for item in spec["series"]
+        ],
+    )
+    with open(path, "w") as output:
+        json.dump(document, output, separators=(",", ":"))
+
+
+def _write_arrow(spec, path):
+    """
+    Writes the series in long form -- one row per point with ``series``,
+    ``x`` and ``y`` columns; histograms carry bin edges as ``x``/``x_end``.
+    Chart type and axis labels go in the schema metadata.
+    """
+    columns = {"series": [], "x": [], "y": []}
+    if spec["type"] == "histogram":
+        columns["x_end"] = []
+    for item in spec["series"]:
+        x = np.asarray(item["x"])
+        if spec["type"] == "histogram":
+            columns["x_end"].append(x[1:])
+            x = x[:-1]
+        columns["series"].append(np.full(len(item["y"]), item["name"], dtype=object))
+        columns["x"].append(x)
+        columns["y"].append(np.asarray(item["y"]))
+    table = pa.table(
+        {
+            name: pa.array(np.concatenate(parts) if parts else [], from_pandas=True)
+            for name, parts in columns.items()
+        }
+    ).replace_schema_metadata(
+        {"type": spec["type"], "xlabel": spec["xlabel"], "ylabel": spec["ylabel"]}
+    )
+    with pa.OSFile(path, "wb") as sink:
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
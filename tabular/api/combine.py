@@ -0,0 +1,138 @@
+import hashlib
+import os
+import tempfile
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from django.conf import settings
+from django.core.files import File
+
+from ..models import DataSet
+from .utils import prepare_dataset, read_sidecar, sidecar_schema
+
+# API names for pyarrow's hash join types.
+JOIN_TYPES = {
+    "inner": "inner",
+    "left": "left outer",
+    "right": "right outer",
+    "outer": "full outer",
+}
+COMBINE_MODES = ["union", *JOIN_TYPES]
+GROUP_AGGREGATIONS = ["sum", "mean", "min", "max", "count", "count_distinct", "stddev"]
+# Column added to unions naming the dataset each row came from.
+SOURCE_COLUMN = "dataset_id"
+
+
+def parse_aggregation(value):
+    """Splits ``"column:function"`` (the function defaults to sum)."""
+    column, _, function = value.rpartition(":")
+    if not column:
+        column, function = value, "sum"
+    if function not in GROUP_AGGREGATIONS:
+        raise ValueError(
+            f"Unknown aggregation {function!r}; use one of "
+            + ", ".join(GROUP_AGGREGATIONS)
+        )
+    return column, function
+
+
+def combine_datasets(datasets, how="union", on=(), group_by=(), aggregations=()):
+    """
+    Unions or joins the memory-mapped sidecars of ``datasets`` and optionally
+    groups the result, all in Arrow's vectorised engine; returns a table.
+
+    A union stacks the rows, adding a ``dataset_id`` column and widening
+    column types where they differ (integers and floats, say). A join
+    matches rows on the ``on`` columns with a hash join, one dataset after
+    the other; clashing columns from the right take a ``_<dataset id>``
+    suffix. ``aggregations`` are ``"column:function"`` strings applied per
+    ``group_by`` key, or over all rows without one; only the columns they
+    need are read.
+    """
+    if len(datasets) < 2:
+        raise ValueError("Combine at least two datasets")
+    on, group_by = list(on), list(group_by)
+    aggregations = [parse_aggregation(value) for value in aggregations]
+    needed = None
+    if group_by or aggregations:
+        needed = set(on + group_by + [column for column, _ in aggregations])
+
+    if how == "union":
+        table = pa.concat_tables(
+            [_read(dataset, needed, source=True) for dataset in datasets],
+            promote_options="permissive",
+        )
+    elif how in JOIN_TYPES:
+        if not on:
+            raise ValueError("A join needs at least one 'on' column")
+        if needed is not None:
+            # "Cost_7" needs Cost from dataset 7 and from the left to clash.
+            suffixes = [f"_{dataset.id}" for dataset in datasets[1:]]
+            needed |= {
+                name[: -len(suffix)]
+                for name in needed
+                for suffix in suffixes
+                if name.endswith(suffix)
+            }
+        table = _read(datasets[0], needed)
+        for dataset in datasets[1:]:
+            table = table.join(
+                _read(dataset, needed),
+                keys=on,
+                join_type=JOIN_TYPES[how],
+                right_suffix=f"_{dataset.id}",
+            )
+    else:
+        raise ValueError(f"how must be one of {', '.join(COMBINE_MODES)}")
+
+    if needed is None:
+        return table
+    missing = sorted(
+        set(group_by + [column for column, _ in aggregations]) - set(table.column_names)
+    )
+    if missing:
+        raise ValueError(f"Unknown column: {missing[0]}")
+    table = table.group_by(group_by).aggregate(aggregations)
+    # Keys come last in pyarrow's output; put them first, in order.
+    names = group_by + [name for name in table.column_names if name not in group_by]
+    table = table.select(names)
+    return (
+        table.sort_by([(key, "ascending") for key in group_by]) if group_by else table
+    )
+
+
+def _read(dataset, needed, source=False):
+    names = sidecar_schema(dataset).names
+    if needed is not None:
+        names = [name for name in names if name in needed]
+    table = read_sidecar(dataset, names)
+    if source and SOURCE_COLUMN not in names:
+        table = table.append_column(
+            SOURCE_COLUMN, pa.repeat(pa.scalar(dataset.id, pa.int64()), table.num_rows)
+        )
+    return table
+
+
+def save_table(table, name):
+    """
+    Stores ``table`` as a Parquet file and returns a new, prepared DataSet
+    for it, so a combined result can be analysed like any upload.
+    """
+    os.makedirs(settings.TABULAR_CACHE_DIR, exist_ok=True)
+    with tempfile.NamedTemporaryFile(
+        dir=settings.TABULAR_CACHE_DIR, suffix=".parquet"
+    ) as f:
+        pq.write_table(table, f.name)
+        digest = hashlib.sha256()
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+        dataset = DataSet(
+            name=name,
+            format="parquet",
+            content_hash=digest.hexdigest(),
+            version=digest.hexdigest(),
+        )
+        dataset.file.save(f"{name}.parquet", File(f), save=False)
+    dataset.save()
+    prepare_dataset(dataset)
+    return dataset
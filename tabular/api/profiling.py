@@ -0,0 +1,170 @@
+import json
+import os
+
+import numpy as np
+from corporatica.cache import FileCache, cache_digest
+from django.conf import settings
+
+from .sketches import HyperLogLog, TDigest
+from .utils import (
+    STORED_FREQUENCIES,
+    cache_key,
+    compute_statistics,
+    is_numeric,
+    iter_batches,
+    sidecar_schema,
+    to_python,
+)
+
+profile_cache = FileCache(
+    os.path.join(settings.TABULAR_CACHE_DIR, "profiles"),
+    settings.TABULAR_PROFILE_CACHE_MAX_BYTES,
+)
+
+
+class Comoments:
+    """
+    Pairwise sums for correlations over chunks with missing values: for
+    every pair of columns, the count, sums and sums of squares over the rows
+    where both are present, and the sum of products. Values are shifted by a
+    per-column ``centre`` first to keep the sums well conditioned.
+    """
+
+    def __init__(self, centre):
+        size = len(centre)
+        self.centre = np.asarray(centre, dtype=float)
+        self.n = np.zeros((size, size))
+        self.sums = np.zeros((size, size))
+        self.squares = np.zeros((size, size))
+        self.products = np.zeros((size, size))
+
+    def update(self, values):
+        present = ~np.isnan(values)
+        x = np.where(present, values - self.centre, 0.0)
+        mask = present.astype(float)
+        self.n += mask.T @ mask
+        self.sums += x.T @ mask
+        self.squares += (x * x).T @ mask
+        self.products += x.T @ x
+
+    def correlation(self):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            n = self.n
+            covariance = self.products - self.sums * self.sums.T / n
+            variance = self.squares - self.sums**2 / n
+            r = covariance / np.sqrt(variance * variance.T)
+        return np.clip(r, -1.0, 1.0)
+
+
+def profile_dataset(dataset, bins=20, top_k=10):
+    """
+    Path of a JSON profile of the dataset, computed in one pass over the
+    sidecar and cached per dataset version and parameters.
+
+    Per column it reports counts, a HyperLogLog distinct-count estimate, the
+    ``top_k`` most frequent values (from the stored statistics) and, for
+    numeric columns, a ``bins``-bin histogram between the stored extremes
+    (a single bin if they are equal). Across columns it reports how often each pair is missing together and
+    the Pearson and Spearman correlations of numeric columns over pairwise
+    complete rows; Spearman ranks are estimated from the stored t-digests.
+    """
+    if bins < 1 or not 1 <= top_k <= STORED_FREQUENCIES:
+        raise ValueError(
+            f"bins must be at least 1 and top_k between 1 and {STORED_FREQUENCIES}"
+        )
+    key = cache_digest("profile", cache_key(dataset), bins, top_k)
+    return profile_cache.get_or_create(
+        key,
+        lambda path: _write_profile(dataset, bins, top_k, path),
+        suffix=".json",
+    )
+
+
+def _write_profile(dataset, bins, top_k, path):
+    with open(path, "w") as output:
+        json.dump(build_profile(dataset, bins, top_k), output, separators=(",", ":"))
+
+
+def build_profile(dataset, bins=20, top_k=10):
+    stored = {stats.column: stats for stats in dataset.column_statistics.all()}
+    # Statistics stored before value frequencies were kept are recomputed.
+    if not stored or any(stats.frequencies is None for stats in stored.values()):
+        stored = {stats.column: stats for stats in compute_statistics(dataset)}
+    schema = sidecar_schema(dataset)
+    columns = schema.names
+    numeric = [
+        field.name for field in schema if is_numeric(field) and stored[field.name].count
+    ]
+    edges = {column: histogram_edges(stored[column], bins) for column in numeric}
+    digests = {column: TDigest.from_dict(stored[column].sketch) for column in numeric}
+    counts = {
+        column: np.zeros(len(edges[column]) - 1, dtype=np.int64) for column in numeric
+    }
+    distinct = {column: HyperLogLog() for column in columns}
+    nulls = np.zeros((len(columns), len(columns)))
+    pearson = Comoments([stored[column].mean for column in numeric])
+    spearman = Comoments([0.5] * len(numeric))
+
+    for frame in iter_batches(dataset):
+        missing = frame.isna().to_numpy(dtype=float)
+        nulls += missing.T @ missing
+        for column in columns:
+            distinct[column].update(frame[column])
+        if not numeric:
+            continue
+        values = frame[numeric].to_numpy(dtype=float, na_value=np.nan)
+        pearson.update(values)
+        ranks = np.column_stack(
+            [digests[column].cdf(values[:, i]) for i, column in enumerate(numeric)]
+        )
+        ranks[np.isnan(values)] = np.nan
+        spearman.update(ranks)
+        for i, column in enumerate(numeric):
+            present = values[:, i][~np.isnan(values[:, i])]
+            counts[column] += np.histogram(present, bins=edges[column])[0]
+
+    first = stored[columns[0]] if columns else None
+    report = {
+        "version": cache_key(dataset),
+        "row_count": first.count + first.null_count if first else 0,
+        "columns": {},
+    }
+    for column in columns:
+        stats = stored[column]
+        entry = {
+            "dtype": stats.dtype,
+            "count": stats.count,
+            "null_count": stats.null_count,
+            "distinct": round(distinct[column].estimate),
+            "top_values": [
+                {"value": value, "count": count}
+                for value, count in (stats.frequencies or [])[:top_k]
+            ],
+        }
+        if column in counts:
+            entry["histogram"] = {
+                "edges": edges[column].tolist(),
+                "counts": counts[column].tolist(),
+            }
+        report["columns"][column] = entry
+    report["nulls"] = {"columns": columns, "matrix": nulls.astype(int).tolist()}
+    report["correlation"] = {
+        "columns": numeric,
+        "pearson": _matrix(pearson.correlation()),
+        "spearman": _matrix(spearman.correlation()),
+    }
+    return report
+
+
+def histogram_edges(stats, bins):
+    """
+    Edges of ``bins`` equal bins between a column's stored extremes; a
+    constant column gets a single bin holding every value.
+    """
+    if stats.min == stats.max:
+        return np.array([stats.min, stats.max])
+    return np.linspace(stats.min, stats.max, bins + 1)
+
+
+def _matrix(values):
+    return [[to_python(value) for value in row] for row in values.tolist()]
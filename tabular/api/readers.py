@@ -0,0 +1,257 @@
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from django.conf import settings
+
+# pandas engines for the spreadsheet formats.
+EXCEL_ENGINES = {"xlsx": "openpyxl", "xls": "xlrd", "ods": "odf"}
+FORMATS = ["csv", "jsonl", "json", "parquet", *EXCEL_ENGINES]
+STREAMED_FORMATS = ("parquet", "jsonl")
+ODS_MIMETYPE = b"application/vnd.oasis.opendocument.spreadsheet"
+
+# numpy dtype kinds for the column types inferred at upload.
+SCHEMA_KINDS = {"integer": "i", "float": "f", "boolean": "b", "datetime": "M"}
+TYPE_NAMES = {"i": "integer", "f": "float", "b": "boolean", "M": "datetime"}
+CSV_DTYPES = {"i": "float64", "f": "float64", "b": "boolean", "M": str, "O": str}
+ARROW_TYPES = {
+    "i": pa.int64(),
+    "f": pa.float64(),
+    "b": pa.bool_(),
+    "M": pa.timestamp("ns"),
+    "O": pa.string(),
+}
+
+
+def detect_format(name, head):
+    """
+    Format of an uploaded file from its first bytes -- the Parquet, OLE2
+    (xls) and zip (xlsx, ods) signatures -- falling back to its extension
+    and a leading ``{`` or ``[`` for JSON; anything else is read as CSV.
+    """
+    if head.startswith(b"PAR1"):
+        return "parquet"
+    if head.startswith(b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"):
+        return "xls"
+    if head.startswith(b"PK\x03\x04"):
+        # ODF packages store their mimetype uncompressed as the first entry.
+        return "ods" if ODS_MIMETYPE in head[:128] else "xlsx"
+    extension = os.path.splitext(name or "")[1].lower().lstrip(".")
+    text = head.lstrip(b"\xef\xbb\xbf \t\r\n")
+    if extension in ("jsonl", "ndjson") or text.startswith(b"{"):
+        return "jsonl"
+    if extension == "json" or text.startswith(b"["):
+        return "json"
+    return "csv"
+
+
+def chunk_rows(path):
+    """Rows per parsed chunk so that one chunk stays well inside the memory budget."""
+    with open(path, "rb") as f:
+        head = f.read(1 << 16)
+    row_bytes = max(len(head) / max(head.count(b"\n"), 1), 1)
+    # A parsed DataFrame takes several times the size of its CSV text.
+    return max(int(settings.TABULAR_MEMORY_BUDGET / (row_bytes * 8)), 1000)
+
+
+def batch_rows(columns):
+    """Rows per batch of an already typed table, at roughly 8 bytes a value."""
+    return max(int(settings.TABULAR_MEMORY_BUDGET / (64 * max(columns, 1))), 1000)
+
+
+def merge_kind(previous, kind):
+    if kind is None:
+        return previous
+    if previous is None or previous == kind:
+        return kind
+    if {previous, kind} == {"i", "f"}:
+        return "f"
+    return "O"
+
+
+def schema_kinds(schema):
+    return {c["name"]: SCHEMA_KINDS.get(c["type"], "O") for c in schema}
+
+
+def schema_columns(kinds):
+    """The ``schema`` list stored on a dataset for a mapping of column kinds."""
+    return [{"name": c, "type": TYPE_NAMES.get(k, "string")} for c, k in kinds.items()]
+
+
+def read_csv_kwargs(plan):
+    """pd.read_csv arguments that apply a parse plan."""
+    return {
+        "sep": plan["delimiter"],
+        "skiprows": plan["skiprows"],
+        "decimal": plan["decimal"] or ".",
+        "thousands": plan["thousands"],
+    }
+
+
+def infer_csv_kinds(path, plan):
+    """Scans the CSV chunk by chunk and returns one numpy dtype kind per column."""
+    options = read_csv_kwargs(plan)
+    kinds = dict.fromkeys(pd.read_csv(path, nrows=0, **options).columns)
+    for chunk in pd.read_csv(path, chunksize=chunk_rows(path), **options):
+        for column, dtype in chunk.dtypes.items():
+            kinds[column] = merge_kind(kinds[column], dtype.kind)
+    return {column: kind or "O" for column, kind in kinds.items()}
+
+
+def arrow_kind(type):
+    """Sidecar column kind for an Arrow type, or None for the null type."""
+    if pa.types.is_null(type):
+        return None
+    if pa.types.is_integer(type):
+        return "i"
+    if pa.types.is_floating(type) or pa.types.is_decimal(type):
+        return "f"
+    if pa.types.is_boolean(type):
+        return "b"
+    if pa.types.is_timestamp(type) or pa.types.is_date(type):
+        return "M"
+    return "O"
+
+
+def read_tables(source, fmt):
+    """
+    Yields the contents of a non-CSV file as Arrow tables, one chunk at a
+    time for Parquet and JSON lines. Spreadsheets and JSON arrays can only
+    be parsed whole.
+    """
+    if fmt == "parquet":
+        parquet = pq.ParquetFile(source)
+        columns = parquet_columns(parquet)
+        rows = batch_rows(len(columns))
+        for batch in parquet.iter_batches(batch_size=rows, columns=columns):
+            yield pa.Table.from_batches([batch])
+    elif fmt == "jsonl":
+        with pd.read_json(source, lines=True, chunksize=chunk_rows(source)) as reader:
+            for frame in reader:
+                yield _from_pandas(_parse_dates(frame))
+    elif fmt == "json":
+        yield _from_pandas(_parse_dates(pd.read_json(source)))
+    else:
+        yield _from_pandas(pd.read_excel(source, engine=EXCEL_ENGINES[fmt]))
+
+
+def parquet_columns(parquet):
+    """Columns of a Parquet file, without an index pandas may have stored."""
+    index = (parquet.schema_arrow.pandas_metadata or {}).get("index_columns", [])
+    return [name for name in parquet.schema_arrow.names if name not in index]
+
+
+def _parse_dates(frame):
+    """
+    Converts text columns holding only ISO 8601 dates; pandas does so for
+    JSON only when the column name looks like a date.
+    """
+    for column in frame.columns[frame.dtypes == object]:
+        values = frame[column].dropna()
+        if values.empty or not isinstance(values.iloc[0], str):
+            continue
+        parsed = pd.to_datetime(values, format="ISO8601", errors="coerce")
+        if parsed.notna().all():
+            frame[column] = parsed.reindex(frame.index)
+    return frame
+
+
+def _from_pandas(frame):
+    frame.columns = [str(column) for column in frame.columns]
+    for column in frame.columns[frame.dtypes == object]:
+        try:
+            pa.array(frame[column], from_pandas=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            # Mixed cells, e.g. numbers and text in one spreadsheet column.
+            values = frame[column]
+            frame[column] = values.where(values.isna(), values.astype(str))
+    return pa.Table.from_pandas(frame, preserve_index=False)
+
+
+def _cast(column, type):
+    if column.type == type:
+        return column
+    try:
+        return pc.cast(column, type)
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+        if type != pa.string():
+            raise
+        # Nested values (lists, structs) are kept as their text.
+        return pa.array(
+            [None if v is None else str(v) for v in column.to_pylist()], type
+        )
+
+
+def write_part(source, fmt, plan, kinds, path):
+    """
+    Converts one source file into an Arrow IPC file with the columns
+    ``kinds`` and returns them. When ``kinds`` is None they are inferred:
+    from the upload's CSV types, or by merging the Arrow types of every
+    chunk, normalised to the sidecar's integer, float, boolean, timestamp
+    and string columns.
+    """
+    if fmt == "csv":
+        kinds = kinds or infer_csv_kinds(source, plan)
+        _write_csv_part(source, plan, kinds, path)
+        return kinds
+    # Streamed formats are read twice when their types must be inferred;
+    # the others are parsed whole anyway, so parse them once.
+    parsed = None if fmt in STREAMED_FORMATS else list(read_tables(source, fmt))
+
+    def tables():
+        return read_tables(source, fmt) if parsed is None else parsed
+
+    if kinds is None:
+        if fmt == "parquet":
+            parquet = pq.ParquetFile(source)
+            fields = [[parquet.schema_arrow.field(c) for c in parquet_columns(parquet)]]
+        else:
+            fields = [table.schema for table in tables()]
+        kinds = {}
+        for field in (field for schema in fields for field in schema):
+            kinds[field.name] = merge_kind(
+                kinds.get(field.name), arrow_kind(field.type)
+            )
+        kinds = {column: kind or "O" for column, kind in kinds.items()}
+    schema = pa.schema([(str(c), ARROW_TYPES[k]) for c, k in kinds.items()])
+    with pa.ipc.new_file(path, schema) as writer:
+        for table in tables():
+            columns = [
+                (
+                    _cast(table[field.name], field.type)
+                    if field.name in table.column_names
+                    else pa.nulls(table.num_rows, field.type)
+                )
+                for field in schema
+            ]
+            writer.write_table(
+                pa.Table.from_arrays(columns, schema=schema),
+                max_chunksize=batch_rows(len(schema)),
+            )
+    return kinds
+
+
+def _write_csv_part(source, plan, kinds, path):
+    schema = pa.schema([(str(c), ARROW_TYPES[k]) for c, k in kinds.items()])
+    dtypes = {column: CSV_DTYPES[kind] for column, kind in kinds.items()}
+    with pa.ipc.new_file(path, schema) as writer:
+        for chunk in pd.read_csv(
+            source, dtype=dtypes, chunksize=chunk_rows(source), **read_csv_kwargs(plan)
+        ):
+            for column, kind in kinds.items():
+                # Integers are parsed as floats so thousands separators and
+                # gaps are handled, then narrowed back.
+                if kind == "i":
+                    chunk[column] = chunk[column].astype("Int64")
+                elif kind == "M":
+                    chunk[column] = pd.to_datetime(
+                        chunk[column],
+                        format=plan["date_formats"].get(column),
+                        errors="coerce",
+                    )
+            chunk.columns = schema.names
+            writer.write_table(
+                pa.Table.from_pandas(chunk, schema=schema, preserve_index=False)
+            )
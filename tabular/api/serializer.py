@@ -5,4 +5,20 @@ from ..models import DataSet
 class DataSetSerializer(serializers.ModelSerializer):
     class Meta:
         model = DataSet
-        fields = ["id", "name", "file"]
+        fields = [
+            "id",
+            "name",
+            "file",
+            "format",
+            "content_hash",
+            "version",
+            "row_count",
+            "schema",
+        ]
+        read_only_fields = [
+            "format",
+            "content_hash",
+            "version",
+            "row_count",
+            "schema",
+        ]
@@ -0,0 +1,223 @@
+import math
+
+import numpy as np
+import pandas as pd
+
+
+class TDigest:
+    """
+    Merging t-digest (Dunning & Ertl) for streaming quantile estimates.
+
+    Points are clustered along the k1 scale function, so clusters stay small
+    near the tails and the rank error of a quantile estimate is roughly
+    proportional to q * (1 - q) / compression. Digests built over separate
+    chunks can be merged without loss beyond that bound.
+    """
+
+    def __init__(self, compression=200, means=(), weights=(), min=None, max=None):
+        self.compression = compression
+        self.means = np.asarray(means, dtype=float)
+        self.weights = np.asarray(weights, dtype=float)
+        self.min = min
+        self.max = max
+
+    @property
+    def count(self):
+        return float(self.weights.sum())
+
+    def update(self, values):
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        if values.size:
+            self._absorb(values, np.ones_like(values), values.min(), values.max())
+
+    def merge(self, other):
+        if other.weights.size:
+            self._absorb(other.means, other.weights, other.min, other.max)
+
+    def _absorb(self, means, weights, low, high):
+        self.min = low if self.min is None else min(self.min, low)
+        self.max = high if self.max is None else max(self.max, high)
+        means = np.concatenate([self.means, means])
+        weights = np.concatenate([self.weights, weights])
+        order = np.argsort(means, kind="stable")
+        means, weights = means[order], weights[order]
+        total = weights.sum()
+        centre = (np.cumsum(weights) - weights / 2) / total
+        k = self.compression / (2 * math.pi) * np.arcsin(2 * centre - 1)
+        cluster = np.floor(k - k.min()).astype(np.int64)
+        sizes = np.bincount(cluster, weights=weights)
+        sums = np.bincount(cluster, weights=weights * means)
+        used = sizes > 0
+        self.weights = sizes[used]
+        self.means = sums[used] / self.weights
+
+    def quantile(self, q):
+        """Estimates the value at quantile ``q`` (a float or sequence of floats)."""
+        if not self.weights.size:
+            return np.full(np.shape(q), np.nan) if np.ndim(q) else math.nan
+        total = self.weights.sum()
+        centres = np.cumsum(self.weights) - self.weights / 2
+        ranks = np.concatenate([[0.0], centres, [total]])
+        values = np.concatenate([[self.min], self.means, [self.max]])
+        return np.interp(np.asarray(q, dtype=float) * total, ranks, values)
+
+    def cdf(self, values):
+        """Estimates the fraction of points at or below each of ``values``."""
+        if not self.weights.size:
+            return np.full(np.shape(values), np.nan)
+        total = self.weights.sum()
+        centres = np.cumsum(self.weights) - self.weights / 2
+        ranks = np.concatenate([[0.0], centres, [total]])
+        points = np.concatenate([[self.min], self.means, [self.max]])
+        return np.interp(np.asarray(values, dtype=float), points, ranks) / total
+
+    def to_dict(self):
+        return {
+            "compression": self.compression,
+            "means": self.means.tolist(),
+            "weights": self.weights.tolist(),
+            "min": self.min,
+            "max": self.max,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+
+class ColumnSummary:
+    """
+    Mergeable partial aggregates for one column, fed one chunk at a time.
+
+    Value frequencies are kept for at most ``capacity`` distinct values
+    (lowest counts are dropped first), so the mode is exact whenever the
+    column has fewer distinct values than that.
+    """
+
+    def __init__(self, numeric, capacity=10000, compression=200):
+        self.numeric = numeric
+        self.capacity = capacity
+        self.dtype = None
+        self.count = 0
+        self.null_count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.frequencies = pd.Series(dtype="int64")
+        self.digest = TDigest(compression) if numeric else None
+
+    def update(self, series):
+        self.dtype = str(series.dtype)
+        values = series.dropna()
+        self.count += len(values)
+        self.null_count += len(series) - len(values)
+        if values.empty:
+            return
+        self.frequencies = self.frequencies.add(
+            values.value_counts(sort=False), fill_value=0
+        ).astype("int64")
+        if len(self.frequencies) > self.capacity:
+            self.frequencies = self.frequencies.nlargest(self.capacity)
+        if self.numeric:
+            array = values.to_numpy(dtype=float)
+            self.total += float(array.sum())
+            low, high = float(array.min()), float(array.max())
+            self.min = low if self.min is None else min(self.min, low)
+            self.max = high if self.max is None else max(self.max, high)
+            self.digest.update(array)
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.numeric and self.count else None
+
+    @property
+    def mode(self):
+        if self.frequencies.empty:
+            return None
+        top = self.frequencies[self.frequencies == self.frequencies.max()]
+        return top.index.min()
+
+
+class Reservoir:
+    """
+    Uniform random sample of at most ``capacity`` rows over a stream of
+    DataFrame chunks (Vitter's Algorithm R, vectorised per chunk).
+    """
+
+    def __init__(self, capacity, seed=None):
+        self.capacity = capacity
+        self.seen = 0
+        self.sample = None
+        self.rng = np.random.default_rng(seed)
+
+    def update(self, frame):
+        if self.sample is None:
+            self.sample = frame.iloc[:0]
+        free = self.capacity - len(self.sample)
+        if free > 0:
+            head = frame.iloc[:free]
+            self.sample = pd.concat([self.sample, head], ignore_index=True)
+            self.seen += len(head)
+            frame = frame.iloc[free:]
+        if frame.empty:
+            return
+        # Stream row t replaces slot j ~ U[0, t] whenever j < capacity.
+        positions = self.seen + np.arange(len(frame))
+        slots = self.rng.integers(0, positions + 1)
+        rows = np.flatnonzero(slots < self.capacity)
+        slots = slots[rows]
+        # When several rows land in one slot the last one wins.
+        slots, last = np.unique(slots[::-1], return_index=True)
+        rows = rows[::-1][last]
+        kept = np.ones(len(self.sample), dtype=bool)
+        kept[slots] = False
+        self.sample = pd.concat(
+            [self.sample[kept], frame.iloc[rows]], ignore_index=True
+        )
+        self.seen += len(frame)
+
+
+class HyperLogLog:
+    """
+    HyperLogLog distinct-count estimator (Flajolet et al.) with ``2 ** precision``
+    registers; the standard error is about ``1.04 / sqrt(2 ** precision)``,
+    0.8% at the default precision. Values are hashed with pandas' stable
+    64-bit hash, so sketches of separate chunks can be merged.
+    """
+
+    def __init__(self, precision=14):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    def update(self, series):
+        values = series.dropna()
+        if values.empty:
+            return
+        hashes = pd.util.hash_pandas_object(values, index=False).to_numpy()
+        width = 64 - self.precision
+        index = (hashes >> np.uint64(width)).astype(np.int64)
+        rest = hashes & np.uint64((1 << width) - 1)
+        # Rank = position of the leftmost one bit in the remaining bits.
+        length = np.zeros(len(rest), dtype=np.int64)
+        for shift in (32, 16, 8, 4, 2, 1):
+            high = rest >= np.uint64(1 << shift)
+            length[high] += shift
+            rest[high] >>= np.uint64(shift)
+        length += (rest > 0).astype(np.int64)
+        ranks = (width - length + 1).astype(np.uint8)
+        np.maximum.at(self.registers, index, ranks)
+
+    def merge(self, other):
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    @property
+    def estimate(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(int)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * m and zeros:
+            # Linear counting is more accurate for small cardinalities.
+            return m * math.log(m / zeros)
+        return float(raw)
@@ -0,0 +1,248 @@
+import codecs
+import copy
+import csv
+import io
+import logging
+
+import pandas as pd
+from corporatica.uploadhandler import HashingUploadHandler
+from pandas.tseries.api import guess_datetime_format
+
+from .readers import detect_format
+
+logger = logging.getLogger(__name__)
+
+# Records examined when looking for the delimiter and header row.
+HEADER_SCAN_RECORDS = 100
+# Decoded text buffered before a block of records is profiled.
+PROFILE_BLOCK_CHARS = 4 * 1024 * 1024
+DELIMITERS = [",", ";", "\t", "|"]
+THOUSANDS_COMMA = r"[+-]?\d{1,3}(,\d{3})+(\.\d+)?"
+DECIMAL_COMMA = r"[+-]?\d{1,3}(\.\d{3})*,\d+"
+
+
+def split_complete_records(text):
+    """Splits text at the last newline that is not inside a quoted field."""
+    end = text.rfind("\n")
+    while end >= 0 and text.count('"', 0, end) % 2:
+        end = text.rfind("\n", 0, end)
+    return text[: end + 1], text[end + 1 :]
+
+
+def detect_delimiter(lines):
+    """Candidate delimiter that splits most non-blank ``lines`` into the most fields."""
+    lines = [line for line in lines if line.strip()]
+    best, best_width = ",", 1
+    for delimiter in DELIMITERS:
+        widths = pd.Series([len(r) for r in csv.reader(lines, delimiter=delimiter)])
+        if widths.empty:
+            continue
+        width = widths.mode().max()
+        if width > best_width and (widths == width).mean() >= 0.5:
+            best, best_width = delimiter, width
+    return best
+
+
+def detect_number_format(frame, delimiter):
+    """Returns the (decimal, thousands) separators used by numbers in ``frame``."""
+    values = pd.concat([frame[column].dropna().str.strip() for column in frame])
+    if delimiter != "," and values.str.fullmatch(DECIMAL_COMMA).any():
+        if not values.str.fullmatch(r"[+-]?\d*\.\d+").any():
+            return ",", "."
+    if values.str.fullmatch(THOUSANDS_COMMA).any():
+        return ".", ","
+    return ".", None
+
+
+def infer_type(values, plan, date_format=None):
+    """
+    Narrowest type name that fits every (non-missing) string in ``values``,
+    plus the date format when that type is ``datetime``.
+    """
+    if values.empty:
+        return "empty", None
+    values = values.str.strip()
+    numbers = values
+    if plan["thousands"]:
+        numbers = numbers.str.replace(plan["thousands"], "", regex=False)
+    if plan["decimal"] != ".":
+        numbers = numbers.str.replace(plan["decimal"], ".", regex=False)
+    if numbers.str.fullmatch(r"[+-]?\d+").all():
+        return "integer", None
+    if pd.to_numeric(numbers, errors="coerce").notna().all():
+        return "float", None
+    if values.str.lower().isin(["true", "false"]).all():
+        return "boolean", None
+    for candidate in (date_format, guess_datetime_format(values.iloc[0])):
+        if candidate and (
+            pd.to_datetime(values, format=candidate, errors="coerce").notna().all()
+        ):
+            return "datetime", candidate
+    return "string", None
+
+
+def merge_types(previous, current):
+    if previous == current or current == "empty":
+        return previous
+    if previous == "empty":
+        return current
+    if {previous, current} == {"integer", "float"}:
+        return "float"
+    return "string"
+
+
+class CSVProfiler:
+    """
+    Learns the layout of a CSV from the chunks of an upload as they arrive.
+
+    The first block yields the parse plan: the delimiter, the preamble lines
+    before the table (report titles, invoice fields, ...) and the key/value
+    metadata they carry, the header row -- the first record as wide as the
+    typical record in the second half of the block -- and the decimal and
+    thousands separators.
+    Column types and date formats are then inferred over every data row,
+    block by block, and widened as later blocks require. A known ``plan``
+    can be passed in to skip detection; its ``skiprows`` then locates the
+    header.
+    """
+
+    def __init__(self, plan=None, columns=None):
+        self.decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+        self.pending = ""
+        self.plan = copy.deepcopy(plan)
+        self.columns = columns
+        self.types = dict.fromkeys(columns or [], "empty")
+        self.row_count = 0
+
+    def feed(self, data):
+        self.pending += self.decoder.decode(data)
+        if len(self.pending) >= PROFILE_BLOCK_CHARS:
+            block, self.pending = split_complete_records(self.pending)
+            self._profile(block)
+
+    def finish(self):
+        block = self.pending + self.decoder.decode(b"", final=True)
+        self.pending = ""
+        if block and not block.endswith("\n"):
+            block += "\n"
+        self._profile(block)
+        return {
+            "parse_plan": self.plan,
+            "row_count": self.row_count,
+            "schema": [
+                {"name": column, "type": self.types[column]}
+                for column in self.columns or []
+            ],
+        }
+
+    def _profile(self, block):
+        if not block.strip():
+            return
+        if self.columns is None:
+            block = self._read_header(block)
+            if not block.strip():
+                return
+        frame = pd.read_csv(
+            io.StringIO(block),
+            sep=self.plan["delimiter"],
+            header=None,
+            names=self.columns,
+            dtype=str,
+            on_bad_lines="skip",
+        )
+        if self.plan["decimal"] is None:
+            decimal, thousands = detect_number_format(frame, self.plan["delimiter"])
+            self.plan.update(decimal=decimal, thousands=thousands)
+        self.row_count += len(frame)
+        date_formats = self.plan["date_formats"]
+        for column in self.columns:
+            if self.types[column] == "string":
+                continue
+            kind, date_format = infer_type(
+                frame[column].dropna(), self.plan, date_formats.get(column)
+            )
+            self.types[column] = merge_types(self.types[column], kind)
+            if self.types[column] == "datetime" and date_format:
+                date_formats[column] = date_format
+            elif self.types[column] != "datetime":
+                date_formats.pop(column, None)
+
+    def _read_header(self, block):
+        lines = block.splitlines(keepends=True)
+        head = lines[:HEADER_SCAN_RECORDS]
+        delimiter = self.plan["delimiter"] if self.plan else detect_delimiter(head)
+        records = list(csv.reader(head, delimiter=delimiter))
+        widths = [
+            max((i + 1 for i, field in enumerate(r) if field.strip()), default=0)
+            for r in records
+        ]
+        body = pd.Series(widths[len(widths) // 2 :])
+        body = body[body > 0]
+        threshold = body.mode().max() if not body.empty else 1
+        header_row = next(
+            (i for i, width in enumerate(widths) if width and width >= threshold), 0
+        )
+        if self.plan is not None:
+            header_row = self.plan["skiprows"]
+        else:
+            self.plan = {
+                "delimiter": delimiter,
+                "skiprows": header_row,
+                "decimal": None,
+                "thousands": None,
+                "date_formats": {},
+                "metadata": {
+                    r[0].strip(): next((f.strip() for f in r[1:] if f.strip()), "")
+                    for r in records[:header_row]
+                    if r and r[0].strip()
+                },
+            }
+        header = "".join(lines[header_row : header_row + 1])
+        # Let pandas name the columns so names match every later read_csv.
+        self.columns = list(
+            pd.read_csv(io.StringIO(header), sep=delimiter, nrows=0).columns
+        )
+        self.types = dict.fromkeys(self.columns, "empty")
+        return "".join(lines[header_row + 1 :])
+
+
+class DataSetUploadHandler(HashingUploadHandler):
+    """
+    Writes an uploaded dataset to a temporary file while hashing and
+    profiling each chunk on the way through, so the upload is read once.
+
+    Besides ``content_hash``, the completed file carries a ``profile`` dict
+    with the format detected from the first chunk and, for CSV files, the
+    parse plan, row count and inferred schema; only the format is set when
+    the contents could not be read as CSV. Other formats are typed when
+    they are converted for the sidecar.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.format = None
+        self.profiler = None
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.format is None:
+            self.format = detect_format(self.file_name, raw_data[:1024])
+            if self.format == "csv":
+                self.profiler = CSVProfiler()
+        if self.profiler is not None:
+            try:
+                self.profiler.feed(raw_data)
+            except Exception:
+                # The upload is still stored; it is typed when first read.
+                logger.exception("Could not profile upload %s", self.file_name)
+                self.profiler = None
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        file.profile = {"format": self.format or "csv"}
+        if self.profiler is not None:
+            try:
+                file.profile.update(self.profiler.finish())
+            except Exception:
+                logger.exception("Could not profile upload %s", self.file_name)
+        return file
@@ -7,9 +7,14 @@ urlpatterns = [
     path("upload_file", UploadFileView.as_view(), name="upload_file"),
     path("get_file", GetDatasetView.as_view(), name="data_sets"),
     path("update_file", UpdateDatasetView.as_view(), name="data_set_detail"),
+    path("append_file", AppendDatasetView.as_view(), name="data_set_append"),
     path("delete_file", DeleteDatasetView.as_view(), name="data_set_delete"),
     path("statistics", CalculateStatisticsView.as_view(), name="calculate_statistics"),
     path("chart", PlotChartView.as_view(), name="chart"),
+    path("chart_data", ChartDataView.as_view(), name="chart_data"),
+    path("query", QueryDatasetView.as_view(), name="query_dataset"),
+    path("profile", ProfileDatasetView.as_view(), name="profile_dataset"),
+    path("combine", CombineDatasetsView.as_view(), name="combine_datasets"),
 ]
 
 # router = DefaultRouter()
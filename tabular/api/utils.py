@@ -0,0 +1,649 @@
+import contextlib
+import copy
+import csv
+import hashlib
+import itertools
+import math
+import os
+import shutil
+import tempfile
+from statistics import NormalDist
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+from django.conf import settings
+from django.db import transaction
+
+from ..models import ColumnStatistics, DataSet, DataSetSegment
+from .readers import schema_columns, schema_kinds, write_part
+from .sketches import ColumnSummary, Reservoir, TDigest
+from .uploadhandler import HEADER_SCAN_RECORDS, CSVProfiler, merge_types
+
+QUARTILES = [0.25, 0.5, 0.75]
+# Bytes read from older datasets to detect a parse plan they were stored without.
+PLAN_SAMPLE_BYTES = 1024 * 1024
+# Most common values kept per column so modes can be updated on append.
+STORED_FREQUENCIES = 1000
+
+
+def cache_key(dataset):
+    """
+    Name of a dataset's derived files: its version, so datasets with
+    identical contents share them, or its id for files stored before hashing.
+    """
+    return dataset.version or dataset.content_hash or f"id-{dataset.id}"
+
+
+def sidecar_path(dataset):
+    """
+    Directory of the Arrow IPC sidecar holding the parsed columns of a
+    dataset: one ``part-NNNNN.arrow`` file for the upload and one for each
+    appended segment.
+    """
+    return os.path.join(settings.TABULAR_CACHE_DIR, "sidecars", cache_key(dataset))
+
+
+def sidecar_parts(path):
+    return [
+        os.path.join(path, name)
+        for name in sorted(os.listdir(path))
+        if name.startswith("part-")
+    ]
+
+
+def part_name(index):
+    return f"part-{index:05d}.arrow"
+
+
+def get_parse_plan(dataset):
+    """Returns the dataset's parse plan, detecting and saving it on first use."""
+    if dataset.parse_plan is None:
+        profiler = CSVProfiler()
+        with open(dataset.file.path, "rb") as f:
+            profiler.feed(f.read(PLAN_SAMPLE_BYTES))
+        dataset.parse_plan = profiler.finish()["parse_plan"]
+        dataset.save(update_fields=["parse_plan"])
+    return dataset.parse_plan
+
+
+def build_sidecar(dataset):
+    """
+    Parses the uploaded file and any appended segments once and stores them
+    as uncompressed Arrow IPC files, one per source file.
+
+    Each file is read with its reader (a CSV with its parse plan) and
+    converted chunk by chunk with column types fixed up front -- from the
+    schema inferred at upload, or a scan of the file for older datasets and
+    formats whose types are only known once read -- so every part holds one
+    record batch per chunk and neither writing nor reading it needs more
+    than a chunk's worth of memory. A schema found by the scan is saved on
+    the dataset, with its row count.
+    """
+    path = sidecar_path(dataset)
+    plan = get_parse_plan(dataset) if dataset.format == "csv" else None
+    kinds = schema_kinds(dataset.schema) if dataset.schema else None
+    sources = [(dataset.file.path, dataset.format, plan)] + [
+        (segment.file.path, "csv", segment.parse_plan)
+        for segment in dataset.segments.all()
+    ]
+    with _building(path) as tmp_path:
+        for index, (source, fmt, source_plan) in enumerate(sources):
+            kinds = write_part(
+                source,
+                fmt,
+                source_plan,
+                kinds,
+                os.path.join(tmp_path, part_name(index)),
+            )
+        if not dataset.schema and dataset.format != "csv":
+            dataset.schema = schema_columns(kinds)
+            dataset.row_count = sum(
+                pa.ipc.open_file(pa.memory_map(part)).read_all().num_rows
+                for part in sidecar_parts(tmp_path)
+            )
+            dataset.save(update_fields=["schema", "row_count"])
+    return path
+
+
+@contextlib.contextmanager
+def _building(path):
+    """
+    Yields a temporary directory that replaces ``path`` once the block
+    succeeds, so readers never see a partially written sidecar.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = tempfile.mkdtemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        yield tmp_path
+    except BaseException:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+    shutil.rmtree(path, ignore_errors=True)
+    try:
+        os.rename(tmp_path, path)
+    except OSError:
+        # Another request built the same version first.
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+
+def sample_path(dataset):
+    """Location of the reservoir sample used for approximate statistics."""
+    return os.path.join(
+        settings.TABULAR_CACHE_DIR, "samples", f"{cache_key(dataset)}.arrow"
+    )
+
+
+def shares_content(dataset):
+    """Other datasets with the same contents (version) as ``dataset``."""
+    if not dataset.version:
+        return DataSet.objects.none()
+    return DataSet.objects.filter(version=dataset.version).exclude(id=dataset.id)
+
+
+def blob_in_use(content_hash):
+    """Whether a dataset or appended segment is still stored under ``content_hash``."""
+    return bool(content_hash) and (
+        DataSet.objects.filter(content_hash=content_hash).exists()
+        or DataSetSegment.objects.filter(content_hash=content_hash).exists()
+    )
+
+
+def release_caches(dataset):
+    """Removes the sidecar and sample of ``dataset``'s version unless still in use."""
+    if dataset.version and DataSet.objects.filter(version=dataset.version).exists():
+        return
+    shutil.rmtree(sidecar_path(dataset), ignore_errors=True)
+    try:
+        os.remove(sample_path(dataset))
+    except FileNotFoundError:
+        pass
+
+
+def release_files(dataset, segments=()):
+    """
+    Removes the stored files and derived caches a dataset held before it was
+    deleted or its file replaced, unless another dataset still uses them.
+    ``dataset`` is the instance as it was, ``segments`` its appended segments.
+    """
+    release_caches(dataset)
+    for item in [dataset, *segments]:
+        if item.file and not blob_in_use(item.content_hash):
+            item.file.storage.delete(item.file.name)
+
+
+def ensure_sidecar(dataset):
+    """Returns the sidecar directory, building it first if missing or stale."""
+    path = sidecar_path(dataset)
+    if not os.path.isdir(path) or os.path.getmtime(path) < os.path.getmtime(
+        dataset.file.path
+    ):
+        build_sidecar(dataset)
+    return path
+
+
+def sidecar_schema(dataset):
+    with pa.memory_map(sidecar_parts(ensure_sidecar(dataset))[0]) as source:
+        return pa.ipc.open_file(source).schema
+
+
+def read_sidecar(dataset, columns=None):
+    """Memory-maps every part of the dataset's sidecar into one Arrow table."""
+    tables = []
+    for part in sidecar_parts(ensure_sidecar(dataset)):
+        table = pa.ipc.open_file(pa.memory_map(part)).read_all()
+        tables.append(table.select(columns) if columns is not None else table)
+    return pa.concat_tables(tables)
+
+
+def iter_batches(dataset, columns=None, parts=None):
+    """
+    Yields the dataset as DataFrames, one sidecar record batch at a time,
+    optionally only from the given part files.
+    """
+    for part in parts or sidecar_parts(ensure_sidecar(dataset)):
+        with pa.memory_map(part) as source:
+            reader = pa.ipc.open_file(source)
+            for i in range(reader.num_record_batches):
+                batch = reader.get_batch(i)
+                if columns is not None:
+                    batch = batch.select(columns)
+                yield batch.to_pandas()
+
+
+def query_dataset(dataset, columns=None, filters=None, sort=None, offset=0, limit=None):
+    """
+    Scans the memory-mapped sidecar for the matching rows and returns the
+    output schema with an iterator of Arrow record batches.
+
+    ``filters`` uses pyarrow's disjunctive normal form, e.g.
+    ``[[("Cost ($)", ">", 1)], [("Project name", "==", "IE-Learn")]]``, and is
+    evaluated batch by batch during the scan; only the projected ``columns``
+    (plus any filter and sort columns) are read. ``sort`` is a list of
+    ``(column, "ascending" | "descending")`` pairs. A sorted query needs a
+    limit, with ``offset + limit`` at most ``TABULAR_SORT_MAX_ROWS``: only
+    the best ``offset + limit`` rows are kept while scanning.
+    """
+    source = ds.dataset(sidecar_parts(ensure_sidecar(dataset)), format="arrow")
+    columns = list(columns or source.schema.names)
+    sort = list(sort or [])
+    for column in columns + [key for key, _ in sort]:
+        if column not in source.schema.names:
+            raise ValueError(f"Unknown column: {column}")
+    expression = pq.filters_to_expression(filters) if filters else None
+    if sort:
+        if limit is None:
+            raise ValueError("A sorted query needs a limit")
+        if offset + limit > settings.TABULAR_SORT_MAX_ROWS:
+            raise ValueError(
+                f"offset + limit may be at most {settings.TABULAR_SORT_MAX_ROWS} "
+                "when sorting"
+            )
+    scanned = columns + [key for key, _ in sort if key not in columns]
+    scanner = source.scanner(columns=scanned, filter=expression)
+    schema = pa.schema([source.schema.field(column) for column in columns])
+
+    if not sort:
+        return schema, _slice_batches(scanner.to_batches(), offset, limit)
+    table = None
+    for batch in scanner.to_batches():
+        part = pa.Table.from_batches([batch])
+        table = part if table is None else pa.concat_tables([table, part])
+        if table.num_rows > offset + limit:
+            table = table.take(
+                pc.select_k_unstable(table, k=offset + limit, sort_keys=sort)
+            )
+    if table is None:
+        table = scanner.projected_schema.empty_table()
+    table = table.sort_by(sort).slice(offset, limit).select(columns)
+    return schema, iter(table.to_batches())
+
+
+def _slice_batches(batches, offset, limit):
+    for batch in batches:
+        if offset >= batch.num_rows:
+            offset -= batch.num_rows
+            continue
+        batch = batch.slice(offset)
+        offset = 0
+        if limit is not None:
+            if limit <= 0:
+                return
+            batch = batch.slice(0, limit)
+            limit -= batch.num_rows
+        if batch.num_rows:
+            yield batch
+
+
+def to_python(value):
+    """Converts numpy/pandas scalars into JSON-serialisable Python values."""
+    if value is None or (pd.api.types.is_scalar(value) and pd.isna(value)):
+        return None
+    if isinstance(value, pd.Timestamp):
+        return value.isoformat()
+    if hasattr(value, "item"):
+        return value.item()
+    return value
+
+
+def compute_statistics(dataset, exact_quantiles=None):
+    """
+    Summarises every column of the dataset and stores it as ColumnStatistics.
+
+    Counts, means, extremes and modes are merged chunk by chunk from the
+    sidecar. Quartiles come from a t-digest unless ``exact_quantiles`` is set
+    (default ``TABULAR_EXACT_QUANTILES``) and the column fits in the memory
+    budget, in which case they are computed exactly from the memory-mapped
+    column.
+    """
+    if exact_quantiles is None:
+        exact_quantiles = settings.TABULAR_EXACT_QUANTILES
+    schema = sidecar_schema(dataset)
+    summaries = {field.name: ColumnSummary(is_numeric(field)) for field in schema}
+    reservoir = Reservoir(settings.TABULAR_SAMPLE_SIZE)
+    for frame in iter_batches(dataset):
+        reservoir.update(frame)
+        for column, summary in summaries.items():
+            summary.update(frame[column])
+    write_sample(dataset, reservoir, schema)
+    table = read_sidecar(dataset) if exact_quantiles else None
+    rows = statistics_rows(dataset, schema, summaries, table)
+    with transaction.atomic():
+        ColumnStatistics.objects.filter(dataset=dataset).delete()
+        ColumnStatistics.objects.bulk_create(rows)
+    return rows
+
+
+def is_numeric(field):
+    return pa.types.is_integer(field.type) or pa.types.is_floating(field.type)
+
+
+def statistics_rows(dataset, schema, summaries, table=None):
+    """
+    ColumnStatistics for the given column summaries. Quartiles are exact for
+    columns of ``table`` that fit in the memory budget, estimated otherwise.
+    """
+    rows = []
+    for position, (column, summary) in enumerate(summaries.items()):
+        top = summary.frequencies.nlargest(STORED_FREQUENCIES)
+        stats = ColumnStatistics(
+            dataset=dataset,
+            position=position,
+            column=column,
+            dtype=summary.dtype or str(schema.field(column).type),
+            count=summary.count,
+            null_count=summary.null_count,
+            mode=to_python(summary.mode),
+            frequencies=[[to_python(v), int(c)] for v, c in top.items()],
+        )
+        if summary.numeric and summary.count:
+            stats.mean = summary.mean
+            stats.min, stats.max = summary.min, summary.max
+            stats.sketch = summary.digest.to_dict()
+            exact = (
+                table is not None
+                and summary.count * 8 <= settings.TABULAR_MEMORY_BUDGET
+            )
+            if exact:
+                quartiles = pc.quantile(table.column(column), q=QUARTILES)
+                quartiles = quartiles.to_pylist()
+            else:
+                quartiles = summary.digest.quantile(QUARTILES).tolist()
+            stats.q1, stats.median, stats.q3 = quartiles
+            stats.exact_quantiles = exact
+        rows.append(stats)
+    return rows
+
+
+def restore_summary(stats, field):
+    """Rebuilds the ColumnSummary that stored statistics were computed from."""
+    summary = ColumnSummary(is_numeric(field))
+    summary.dtype = stats.dtype
+    summary.count, summary.null_count = stats.count, stats.null_count
+    values = [value for value, _ in stats.frequencies or []]
+    if pa.types.is_timestamp(field.type):
+        values = pd.to_datetime(values)
+    summary.frequencies = pd.Series(
+        [count for _, count in stats.frequencies or []], index=values, dtype="int64"
+    )
+    if summary.numeric and stats.count:
+        summary.total = stats.mean * stats.count
+        summary.min, summary.max = stats.min, stats.max
+        summary.digest = TDigest.from_dict(stats.sketch)
+    return summary
+
+
+def write_sample(dataset, reservoir, schema):
+    """Stores the reservoir sample, tagged with the size of the full dataset."""
+    path = sample_path(dataset)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    sample = reservoir.sample if reservoir.sample is not None else schema.empty_table()
+    if isinstance(sample, pd.DataFrame):
+        sample = pa.Table.from_pandas(sample, schema=schema, preserve_index=False)
+    sample = sample.replace_schema_metadata({"population": str(reservoir.seen)})
+    feather.write_feather(sample, path, compression="uncompressed")
+
+
+def _bounds(values):
+    return [to_python(values[0]), to_python(values[1])]
+
+
+def approximate_statistics(dataset, confidence=0.95):
+    """
+    Estimates mean, median, mode and quartiles from the upload-time sample.
+
+    Each estimate comes with bounds at the given confidence: a normal
+    interval (with finite population correction) for means and modal
+    frequencies, and a Dvoretzky-Kiefer-Wolfowitz rank band for quantiles.
+    The sample is rebuilt with a full statistics pass if it is missing.
+    """
+    path = sample_path(dataset)
+    if not os.path.exists(path):
+        compute_statistics(dataset)
+    table = feather.read_table(path, memory_map=True)
+    population = int(table.schema.metadata[b"population"])
+    sample = table.to_pandas()
+    size = len(sample)
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    exact = size >= population
+    fpc = 0 if exact else math.sqrt((population - size) / max(population - 1, 1))
+    rank_error = 0 if exact else math.sqrt(math.log(2 / (1 - confidence)) / (2 * size))
+
+    statistics = {"mean": {}, "median": {}, "mode": {}, "quartiles": {}}
+    bounds = {"mean": {}, "median": {}, "mode_frequency": {}, "quartiles": {}}
+    for column in sample.columns:
+        series = sample[column].dropna()
+        if series.empty:
+            continue
+        counts = series.value_counts()
+        top = counts[counts == counts.iloc[0]].index.min()
+        share = counts.iloc[0] / len(series)
+        margin = z * math.sqrt(share * (1 - share) / len(series)) * fpc
+        statistics["mode"][column] = to_python(top)
+        bounds["mode_frequency"][column] = _bounds(
+            [max(share - margin, 0.0), min(share + margin, 1.0)]
+        )
+        if not pd.api.types.is_numeric_dtype(series) or pd.api.types.is_bool_dtype(
+            series
+        ):
+            continue
+        mean = series.mean()
+        margin = z * series.std(ddof=1) / math.sqrt(len(series)) * fpc
+        statistics["mean"][column] = to_python(mean)
+        bounds["mean"][column] = _bounds([mean - margin, mean + margin])
+        values = series.quantile(QUARTILES)
+        low = series.quantile([max(q - rank_error, 0) for q in QUARTILES])
+        high = series.quantile([min(q + rank_error, 1) for q in QUARTILES])
+        statistics["median"][column] = to_python(values.iloc[1])
+        bounds["median"][column] = _bounds([low.iloc[1], high.iloc[1]])
+        statistics["quartiles"][column] = {
+            q: to_python(v) for q, v in zip(QUARTILES, values)
+        }
+        bounds["quartiles"][column] = {
+            q: _bounds(pair) for q, pair in zip(QUARTILES, zip(low, high))
+        }
+    statistics.update(
+        bounds=bounds,
+        confidence=confidence,
+        rank_error=rank_error,
+        sample_size=size,
+        population=population,
+    )
+    return statistics
+
+
+def prepare_dataset(dataset):
+    """
+    (Re)builds the sidecar and stored statistics after the file changed.
+
+    When another dataset already holds the same contents, its statistics
+    are copied instead; the sidecar and sample are shared through the version.
+    """
+    source = shares_content(dataset).filter(column_statistics__isnull=False).first()
+    if source is None:
+        build_sidecar(dataset)
+        compute_statistics(dataset)
+        return
+    with transaction.atomic():
+        if not dataset.schema:
+            dataset.schema, dataset.row_count = source.schema, source.row_count
+            dataset.save(update_fields=["schema", "row_count"])
+        dataset.column_statistics.all().delete()
+        copies = []
+        for stats in source.column_statistics.all():
+            stats.pk = None
+            stats.dataset = dataset
+            copies.append(stats)
+        ColumnStatistics.objects.bulk_create(copies)
+
+
+def profile_with_header(file, plan, names):
+    """
+    Profiles an uploaded CSV whose header row is the first record matching
+    ``names``, read with ``plan``'s delimiter. Returns None if there is none.
+    """
+    file.seek(0)
+    head = list(itertools.islice(file, HEADER_SCAN_RECORDS))
+    lines = [line.decode("utf-8-sig", errors="replace") for line in head]
+    records = csv.reader(lines, delimiter=plan["delimiter"])
+    header_row = next(
+        (
+            i
+            for i, record in enumerate(records)
+            if [field.strip() for field in record[: len(names)]] == names
+        ),
+        None,
+    )
+    if header_row is None:
+        return None
+    profiler = CSVProfiler(
+        plan=dict(
+            plan,
+            skiprows=header_row,
+            decimal=None,
+            thousands=None,
+            date_formats={},
+            metadata={},
+        )
+    )
+    file.seek(0)
+    for chunk in file.chunks():
+        profiler.feed(chunk)
+    profile = profiler.finish()
+    return (
+        profile if profile["schema"] and len(profile["schema"]) == len(names) else None
+    )
+
+
+def append_segment(dataset, file):
+    """
+    Appends the rows of an uploaded CSV ``file`` to ``dataset`` (of any
+    format) and returns the new DataSetSegment. The file must have the
+    dataset's columns; its own preamble, separators and date formats are
+    detected at upload.
+
+    The existing sidecar parts are hard-linked into the new version's
+    sidecar and only the new rows are parsed. Stored statistics are updated
+    by merging the new rows into the restored column summaries and sample,
+    so the cost is proportional to the appended rows; quartiles then come
+    from the merged t-digests. If the new rows widen a column's type (say
+    integers gaining decimals), everything is rebuilt instead.
+    """
+    if not dataset.schema:
+        raise ValueError("Upload the dataset again before appending rows to it")
+    names = [column["name"] for column in dataset.schema]
+    profile = getattr(file, "profile", None) or {}
+    if profile.get("format", "csv") != "csv":
+        raise ValueError("Rows can only be appended from a CSV file")
+    if dataset.format == "csv":
+        dataset_plan = get_parse_plan(dataset)
+    else:
+        dataset_plan = {"delimiter": ",", "date_formats": {}}
+    if [column["name"] for column in profile.get("schema") or []] != names:
+        # Header detection can misfire on a few rows below a long preamble;
+        # look for the dataset's own header instead.
+        profile = profile_with_header(file, dataset_plan, names)
+    if profile is None:
+        raise ValueError("The appended file must have the same columns as the dataset")
+    schema = [
+        {"name": old["name"], "type": merge_types(old["type"], new["type"])}
+        for old, new in zip(dataset.schema, profile["schema"])
+    ]
+    plan = profile["parse_plan"]
+    plan["date_formats"] = {
+        **dataset_plan["date_formats"],
+        **plan["date_formats"],
+    }
+
+    previous = copy.copy(dataset)
+    incremental = schema_kinds(schema) == schema_kinds(dataset.schema)
+    if incremental:
+        old_parts = sidecar_parts(ensure_sidecar(dataset))
+        fields = sidecar_schema(dataset)
+        stored = {stats.column: stats for stats in dataset.column_statistics.all()}
+        incremental = (
+            os.path.exists(sample_path(dataset))
+            and list(stored) == fields.names
+            and all(
+                stats.frequencies is not None
+                and (stats.sketch is not None or stats.mean is None)
+                for stats in stored.values()
+            )
+        )
+
+    segment = DataSetSegment.objects.create(
+        dataset=dataset,
+        file=file,
+        content_hash=getattr(file, "content_hash", ""),
+        parse_plan=plan,
+        row_count=profile["row_count"],
+    )
+    dataset.schema = schema
+    dataset.row_count = (dataset.row_count or 0) + segment.row_count
+    dataset.version = hashlib.sha256(
+        f"{cache_key(previous)}:{segment.content_hash or segment.id}".encode()
+    ).hexdigest()
+    twin = shares_content(dataset).filter(column_statistics__isnull=False).exists()
+    if not incremental or twin:
+        dataset.save()
+        prepare_dataset(dataset)
+        release_caches(previous)
+        return segment
+
+    try:
+        rows = _merge_segment(dataset, previous, segment, old_parts, fields, stored)
+    except BaseException:
+        release_caches(dataset)
+        dataset.schema = previous.schema
+        dataset.row_count = previous.row_count
+        dataset.version = previous.version
+        segment.delete()
+        if not blob_in_use(segment.content_hash):
+            segment.file.storage.delete(segment.file.name)
+        raise
+    with transaction.atomic():
+        dataset.save()
+        ColumnStatistics.objects.filter(dataset=dataset).delete()
+        ColumnStatistics.objects.bulk_create(rows)
+    release_caches(previous)
+    return segment
+
+
+def _merge_segment(dataset, previous, segment, old_parts, fields, stored):
+    """
+    Builds the sidecar and sample of the dataset's new version from the
+    previous ones plus the segment, and returns the merged ColumnStatistics.
+    """
+    path = sidecar_path(dataset)
+    with _building(path) as tmp_path:
+        for part in old_parts:
+            target = os.path.join(tmp_path, os.path.basename(part))
+            try:
+                os.link(part, target)
+            except OSError:
+                shutil.copyfile(part, target)
+        new_part = part_name(len(old_parts))
+        write_part(
+            segment.file.path,
+            "csv",
+            segment.parse_plan,
+            schema_kinds(dataset.schema),
+            os.path.join(tmp_path, new_part),
+        )
+
+    summaries = {
+        field.name: restore_summary(stored[field.name], field) for field in fields
+    }
+    sample = feather.read_table(sample_path(previous))
+    reservoir = Reservoir(settings.TABULAR_SAMPLE_SIZE)
+    reservoir.seen = int(sample.schema.metadata[b"population"])
+    reservoir.sample = sample.to_pandas()
+    for frame in iter_batches(dataset, parts=[os.path.join(path, new_part)]):
+        reservoir.update(frame)
+        for column, summary in summaries.items():
+            summary.update(frame[column])
+    write_sample(dataset, reservoir, fields)
+    return statistics_rows(dataset, fields, summaries)
@@ -1,28 +1,79 @@
-import pandas as pd
+import copy
 import io
+import itertools
+import json
+import logging
+import pyarrow as pa
+from django.http import FileResponse, StreamingHttpResponse
 from rest_framework import status, generics, viewsets
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
-import seaborn as sns
-import matplotlib.pyplot as plt
 from ..models import DataSet
+from .charts import (
+    AGGREGATIONS,
+    CHART_DATA_FORMATS,
+    CHART_TYPES,
+    chart_cache,
+    chart_data,
+    render_chart,
+)
+from .combine import (
+    COMBINE_MODES,
+    GROUP_AGGREGATIONS,
+    combine_datasets,
+    save_table,
+)
+from .profiling import profile_dataset
 from .serializer import DataSetSerializer
+from corporatica.uploadhandler import UploadHandlerMixin
+from .uploadhandler import DataSetUploadHandler
+from .utils import (
+    append_segment,
+    approximate_statistics,
+    compute_statistics,
+    prepare_dataset,
+    query_dataset,
+    release_files,
+)
 
+logger = logging.getLogger(__name__)
 
-class UploadFileView(generics.CreateAPIView):
+
+class IngestUploadMixin(UploadHandlerMixin):
+    """Hashes and profiles uploaded datasets as they stream in."""
+
+    upload_handler_classes = [DataSetUploadHandler]
+
+
+def apply_profile(dataset, file):
+    """Copies what the upload handler learned about ``file`` onto the dataset."""
+    profile = getattr(file, "profile", None) or {}
+    dataset.content_hash = getattr(file, "content_hash", "")
+    dataset.version = dataset.content_hash
+    dataset.format = profile.get("format", "csv")
+    dataset.parse_plan = profile.get("parse_plan")
+    dataset.row_count = profile.get("row_count")
+    dataset.schema = profile.get("schema")
+
+
+class UploadFileView(IngestUploadMixin, generics.CreateAPIView):
     permission_classes = [IsAuthenticated]
     serializer_class = DataSetSerializer
 
     @swagger_auto_schema(
         tags=["Data Management"],
-        operation_description="Upload a CSV file to create a new dataset.",
+        operation_description=(
+            "Upload a CSV, Excel (xlsx, xls, ods), JSON lines, JSON array or "
+            "Parquet file to create a new dataset. The format is detected from "
+            "the file's contents."
+        ),
         request_body=openapi.Schema(
             type=openapi.TYPE_OBJECT,
             properties={
                 "file": openapi.Schema(
-                    type=openapi.TYPE_FILE, description="CSV file to upload"
+                    type=openapi.TYPE_FILE, description="Data file to upload"
                 ),
             },
             required=["file"],
@@ -42,8 +93,15 @@ class UploadFileView(generics.CreateAPIView):
             )
 
         file = request.FILES["file"]
-        dataset = DataSet.objects.create(name=file.name, file=file)
+        dataset = DataSet(name=file.name, file=file)
+        apply_profile(dataset, file)
         dataset.save()
+        try:
+            prepare_dataset(dataset)
+        except Exception:
+            # Unparseable uploads are still stored; the analysis views report
+            # the parse error when the dataset is first analysed.
+            logger.exception("Could not prepare dataset %s", dataset.id)
         data = DataSetSerializer(dataset).data
         base_uri = request.build_absolute_uri().split("/api")[0]
         data["file"] = base_uri + data["file"]
@@ -92,7 +150,7 @@ class GetDatasetView(generics.ListAPIView):
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 
-class UpdateDatasetView(generics.UpdateAPIView):
+class UpdateDatasetView(IngestUploadMixin, generics.UpdateAPIView):
     permission_classes = [IsAuthenticated]
     serializer_class = DataSetSerializer
 
@@ -127,10 +185,68 @@ class UpdateDatasetView(generics.UpdateAPIView):
             )
         serializer = self.serializer_class(instance=data_set, data=request.data)
         serializer.is_valid(raise_exception=True)
+        previous = copy.copy(data_set)
+        segments = list(data_set.segments.all())
+        apply_profile(data_set, request.FILES.get("file"))
+        # A new file replaces the appended rows too.
+        data_set.segments.all().delete()
         serializer.save()
+        release_files(previous, segments)
+        try:
+            prepare_dataset(data_set)
+        except Exception:
+            logger.exception("Could not prepare dataset %s", data_set.id)
+            data_set.column_statistics.all().delete()
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 
+class AppendDatasetView(IngestUploadMixin, generics.CreateAPIView):
+    permission_classes = [IsAuthenticated]
+    serializer_class = DataSetSerializer
+
+    @swagger_auto_schema(
+        tags=["Data Management"],
+        operation_description=(
+            "Append the rows of a CSV file with the same columns to a dataset. "
+            "Stored statistics are updated from the new rows only."
+        ),
+        request_body=openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            properties={
+                "dataset_id": openapi.Schema(
+                    type=openapi.TYPE_INTEGER, description="ID of the dataset"
+                ),
+                "file": openapi.Schema(
+                    type=openapi.TYPE_FILE, description="CSV file with the new rows"
+                ),
+            },
+            required=["dataset_id", "file"],
+        ),
+        responses={
+            status.HTTP_200_OK: openapi.Response(
+                description="Rows appended successfully",
+                schema=DataSetSerializer,
+            ),
+            status.HTTP_400_BAD_REQUEST: "Invalid dataset_id or file",
+        },
+    )
+    def create(self, request, *args, **kwargs):
+        data_set = DataSet.objects.filter(id=request.data.get("dataset_id")).first()
+        if data_set is None:
+            return Response(
+                {"error": "Invalid dataset_id"}, status=status.HTTP_400_BAD_REQUEST
+            )
+        if "file" not in request.FILES:
+            return Response(
+                {"error": "No file provided"}, status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            append_segment(data_set, request.FILES["file"])
+        except Exception as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(self.serializer_class(data_set).data, status=status.HTTP_200_OK)
+
+
 class DeleteDatasetView(generics.DestroyAPIView):
     permission_classes = [IsAuthenticated]
     serializer_class = DataSetSerializer
@@ -160,9 +276,12 @@ class DeleteDatasetView(generics.DestroyAPIView):
             return Response(
                 {"error": "Invalid dataset_id"}, status=status.HTTP_400_BAD_REQUEST
             )
-        serializer = self.serializer_class(instance=data_set)
-        serializer.delete()
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        data = self.serializer_class(instance=data_set).data
+        previous = copy.copy(data_set)
+        segments = list(data_set.segments.all())
+        data_set.delete()
+        release_files(previous, segments)
+        return Response(data, status=status.HTTP_200_OK)
 
 
 class CalculateStatisticsView(generics.ListAPIView):
@@ -179,7 +298,21 @@ class CalculateStatisticsView(generics.ListAPIView):
                 description="ID of the dataset",
                 type=openapi.TYPE_INTEGER,
                 required=True,
-            )
+            ),
+            openapi.Parameter(
+                "approx",
+                openapi.IN_QUERY,
+                description="Estimate from the dataset's random sample and return error bounds",
+                type=openapi.TYPE_BOOLEAN,
+                default=False,
+            ),
+            openapi.Parameter(
+                "confidence",
+                openapi.IN_QUERY,
+                description="Confidence level of the bounds returned with approx=true",
+                type=openapi.TYPE_NUMBER,
+                default=0.95,
+            ),
         ],
         responses={
             status.HTTP_200_OK: openapi.Response(
@@ -194,6 +327,11 @@ class CalculateStatisticsView(generics.ListAPIView):
                             "0.50": {"column1": 10.0, "column2": 14.5},
                             "0.75": {"column1": 12.5, "column2": 16.0},
                         },
+                        "min": {"column1": 1.0, "column2": 2.0},
+                        "max": {"column1": 20.0, "column2": 30.0},
+                        "count": {"column1": 100, "column2": 98},
+                        "null_count": {"column1": 0, "column2": 2},
+                        "dtype": {"column1": "int64", "column2": "float64"},
                     }
                 },
             ),
@@ -203,27 +341,103 @@ class CalculateStatisticsView(generics.ListAPIView):
     def list(self, request, *args, **kwargs):
         try:
             dataset = DataSet.objects.get(id=request.query_params.get("dataset_id"))
-            file_path = dataset.file.path
-            df = pd.read_csv(file_path)
+            if request.query_params.get("approx", "").lower() in ("1", "true"):
+                confidence = float(request.query_params.get("confidence", 0.95))
+                if not 0 < confidence < 1:
+                    raise ValueError("confidence must be between 0 and 1")
+                statistics = approximate_statistics(dataset, confidence)
+                return Response(statistics, status=status.HTTP_200_OK)
+            columns = list(dataset.column_statistics.all())
+            if not columns:
+                columns = compute_statistics(dataset)
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
+        numeric = [c for c in columns if c.mean is not None]
         statistics = {
-            "mean": df.mean().to_dict(),
-            "median": df.median().to_dict(),
-            "mode": df.mode().iloc[0].to_dict(),
-            "quartiles": df.quantile([0.25, 0.5, 0.75]).to_dict(),
+            "mean": {c.column: c.mean for c in numeric},
+            "median": {c.column: c.median for c in numeric},
+            "mode": {c.column: c.mode for c in columns},
+            "quartiles": {
+                c.column: {0.25: c.q1, 0.5: c.median, 0.75: c.q3} for c in numeric
+            },
+            "min": {c.column: c.min for c in numeric},
+            "max": {c.column: c.max for c in numeric},
+            "count": {c.column: c.count for c in columns},
+            "null_count": {c.column: c.null_count for c in columns},
+            "dtype": {c.column: c.dtype for c in columns},
         }
         return Response(statistics, status=status.HTTP_200_OK)
 
 
+CHART_PARAMETERS = [
+    openapi.Parameter(
+        "chart_type",
+        openapi.IN_QUERY,
+        description="Kind of chart",
+        type=openapi.TYPE_STRING,
+        enum=CHART_TYPES,
+        default="bar",
+    ),
+    openapi.Parameter(
+        "x",
+        openapi.IN_QUERY,
+        description="Column to group bars by, or the x axis of line and scatter charts",
+        type=openapi.TYPE_STRING,
+    ),
+    openapi.Parameter(
+        "y",
+        openapi.IN_QUERY,
+        description="Comma-separated value columns; all numeric columns by default",
+        type=openapi.TYPE_STRING,
+    ),
+    openapi.Parameter(
+        "agg",
+        openapi.IN_QUERY,
+        description="Aggregation applied to bar values",
+        type=openapi.TYPE_STRING,
+        enum=list(AGGREGATIONS),
+        default="mean",
+    ),
+    openapi.Parameter(
+        "bins",
+        openapi.IN_QUERY,
+        description="Number of histogram bins",
+        type=openapi.TYPE_INTEGER,
+        default=30,
+    ),
+    openapi.Parameter(
+        "max_points",
+        openapi.IN_QUERY,
+        description="Maximum bars, line points or scatter points drawn per series",
+        type=openapi.TYPE_INTEGER,
+        default=1000,
+    ),
+]
+
+
+def chart_params(query_params):
+    """Reads the chart parameters of ``chart_spec`` from a request's query string."""
+    return {
+        "chart_type": query_params.get("chart_type", "bar"),
+        "x": query_params.get("x") or None,
+        "y": parse_list(query_params.get("y")),
+        "agg": query_params.get("agg", "mean"),
+        "bins": int(query_params.get("bins", 30)),
+        "max_points": int(query_params.get("max_points", 1000)),
+    }
+
+
 class PlotChartView(generics.ListAPIView):
     permission_classes = [IsAuthenticated]
     serializer_class = DataSetSerializer
 
     @swagger_auto_schema(
         tags=["Data Visualization"],
-        operation_description="Generate a bar plot from the dataset.",
+        operation_description=(
+            "Plot the dataset. Data is aggregated or downsampled server-side "
+            "before rendering, and charts are cached per file content and parameters."
+        ),
         manual_parameters=[
             openapi.Parameter(
                 "dataset_id",
@@ -231,7 +445,8 @@ class PlotChartView(generics.ListAPIView):
                 description="ID of the dataset",
                 type=openapi.TYPE_INTEGER,
                 required=True,
-            )
+            ),
+            *CHART_PARAMETERS,
         ],
         responses={
             status.HTTP_200_OK: openapi.Response(
@@ -239,7 +454,7 @@ class PlotChartView(generics.ListAPIView):
                 examples={
                     "application/json": {
                         "message": "Chart created successfully",
-                        "chart": "http://example.com/media/plot.png",
+                        "chart": "http://example.com/media/cache/charts/3f/3f9a...c1.png",
                     }
                 },
             ),
@@ -249,19 +464,411 @@ class PlotChartView(generics.ListAPIView):
     def list(self, request, *args, **kwargs):
         try:
             dataset = DataSet.objects.get(id=request.query_params.get("dataset_id"))
-            df = pd.read_csv(dataset.file.path)
+            path = render_chart(dataset, **chart_params(request.query_params))
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-        plt.figure(figsize=(10, 6))
-        sns.barplot(data=df)
-        plt.savefig("media/plot.png")
-        base_uri = request.build_absolute_uri().split("api")[0]
-        chart = base_uri + "media/plot.png"
+        chart = request.build_absolute_uri(chart_cache.url(path))
         return Response(
             {"message": "Chart created successfully", "chart": chart},
             status=status.HTTP_200_OK,
         )
+
+
+def parse_list(value):
+    """Reads a query parameter given as a JSON array or a comma-separated list."""
+    if not value:
+        return []
+    if value.lstrip().startswith("["):
+        return json.loads(value)
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+def stream_json_lines(batches):
+    for batch in batches:
+        rows = batch.to_pylist()
+        yield "".join(json.dumps(row, default=str) + "\n" for row in rows)
+
+
+def stream_arrow(schema, batches):
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        for batch in batches:
+            writer.write_batch(batch)
+            yield sink.getvalue()
+            sink.seek(0)
+            sink.truncate()
+    yield sink.getvalue()
+
+
+class QueryDatasetView(generics.ListAPIView):
+    permission_classes = [IsAuthenticated]
+    serializer_class = DataSetSerializer
+
+    @swagger_auto_schema(
+        tags=["Data Analysis"],
+        operation_description="Stream the rows of a dataset that match a projection, filters, sort and limit/offset.",
+        manual_parameters=[
+            openapi.Parameter(
+                "dataset_id",
+                openapi.IN_QUERY,
+                description="ID of the dataset",
+                type=openapi.TYPE_INTEGER,
+                required=True,
+            ),
+            openapi.Parameter(
+                "columns",
+                openapi.IN_QUERY,
+                description="Columns to return, comma-separated or as a JSON array (default: all)",
+                type=openapi.TYPE_STRING,
+            ),
+            openapi.Parameter(
+                "filters",
+                openapi.IN_QUERY,
+                description='JSON filters in disjunctive normal form, e.g. [["Cost ($)", ">", 1]]',
+                type=openapi.TYPE_STRING,
+            ),
+            openapi.Parameter(
+                "sort",
+                openapi.IN_QUERY,
+                description="Sort columns, comma-separated or as a JSON array; prefix with - for descending. Needs a limit (offset + limit at most TABULAR_SORT_MAX_ROWS)",
+                type=openapi.TYPE_STRING,
+            ),
+            openapi.Parameter(
+                "limit",
+                openapi.IN_QUERY,
+                description="Maximum number of rows to return",
+                type=openapi.TYPE_INTEGER,
+            ),
+            openapi.Parameter(
+                "offset",
+                openapi.IN_QUERY,
+                description="Number of matching rows to skip",
+                type=openapi.TYPE_INTEGER,
+                default=0,
+            ),
+            openapi.Parameter(
+                "output",
+                openapi.IN_QUERY,
+                description="jsonl (default) or arrow (Arrow IPC stream)",
+                type=openapi.TYPE_STRING,
+                enum=["jsonl", "arrow"],
+            ),
+        ],
+        responses={
+            status.HTTP_200_OK: openapi.Response(
+                description="Matching rows, one JSON object per line or an Arrow IPC stream",
+                examples={
+                    "application/x-ndjson": '{"Service description": "Gemini API", "Cost ($)": 27.5}'
+                },
+            ),
+            status.HTTP_400_BAD_REQUEST: "Invalid dataset_id or query",
+        },
+    )
+    def list(self, request, *args, **kwargs):
+        params = request.query_params
+        output = params.get("output", "jsonl")
+        try:
+            dataset = DataSet.objects.get(id=params.get("dataset_id"))
+            if output not in ("jsonl", "arrow"):
+                raise ValueError("output must be jsonl or arrow")
+            filters = json.loads(params["filters"]) if params.get("filters") else None
+            if filters and isinstance(filters[0][0], str):
+                filters = [filters]
+            sort = [
+                (key[1:], "descending") if key.startswith("-") else (key, "ascending")
+                for key in parse_list(params.get("sort"))
+            ]
+            limit = int(params["limit"]) if params.get("limit") else None
+            schema, batches = query_dataset(
+                dataset,
+                columns=parse_list(params.get("columns")) or None,
+                filters=filters,
+                sort=sort,
+                offset=int(params.get("offset", 0)),
+                limit=limit,
+            )
+            # Pull the first batch here so bad filters surface as a 400.
+            first = next(batches, None)
+        except Exception as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        batches = itertools.chain([first] if first is not None else [], batches)
+        if output == "arrow":
+            return StreamingHttpResponse(
+                stream_arrow(schema, batches),
+                content_type="application/vnd.apache.arrow.stream",
+            )
+        return StreamingHttpResponse(
+            stream_json_lines(batches), content_type="application/x-ndjson"
+        )
+
+
+class ChartDataView(generics.ListAPIView):
+    permission_classes = [IsAuthenticated]
+    serializer_class = DataSetSerializer
+
+    @swagger_auto_schema(
+        tags=["Data Visualization"],
+        operation_description=(
+            "Return the aggregated series behind a chart, for clients that draw "
+            "charts themselves. Takes the same parameters as the chart endpoint."
+        ),
+        manual_parameters=[
+            openapi.Parameter(
+                "dataset_id",
+                openapi.IN_QUERY,
+                description="ID of the dataset",
+                type=openapi.TYPE_INTEGER,
+                required=True,
+            ),
+            *CHART_PARAMETERS,
+            openapi.Parameter(
+                "output",
+                openapi.IN_QUERY,
+                description="json (default) or arrow (Arrow IPC stream in long form)",
+                type=openapi.TYPE_STRING,
+                enum=list(CHART_DATA_FORMATS),
+            ),
+        ],
+        responses={
+            status.HTTP_200_OK: openapi.Response(
+                description="Chart series",
+                examples={
+                    "application/json": {
+                        "type": "bar",
+                        "xlabel": "Service description",
+                        "ylabel": "sum",
+                        "series": [
+                            {"name": "Cost ($)", "x": ["Gemini API"], "y": [33.12]}
+                        ],
+                    }
+                },
+            ),
+            status.HTTP_400_BAD_REQUEST: "Invalid dataset_id or chart parameters",
+        },
+    )
+    def list(self, request, *args, **kwargs):
+        output = request.query_params.get("output", "json")
+        try:
+            dataset = DataSet.objects.get(id=request.query_params.get("dataset_id"))
+            path = chart_data(dataset, output, **chart_params(request.query_params))
+        except Exception as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        content_type = (
+            "application/json"
+            if output == "json"
+            else "application/vnd.apache.arrow.stream"
+        )
+        return FileResponse(open(path, "rb"), content_type=content_type)
+
+
+class ProfileDatasetView(generics.ListAPIView):
+    permission_classes = [IsAuthenticated]
+    serializer_class = DataSetSerializer
+
+    @swagger_auto_schema(
+        tags=["Data Analysis"],
+        operation_description=(
+            "Profile every column of a dataset: distinct-count estimates, top "
+            "values, histograms, a null co-occurrence matrix and Pearson/Spearman "
+            "correlations. Cached per dataset version."
+        ),
+        manual_parameters=[
+            openapi.Parameter(
+                "dataset_id",
+                openapi.IN_QUERY,
+                description="ID of the dataset",
+                type=openapi.TYPE_INTEGER,
+                required=True,
+            ),
+            openapi.Parameter(
+                "bins",
+                openapi.IN_QUERY,
+                description="Number of histogram bins for numeric columns",
+                type=openapi.TYPE_INTEGER,
+                default=20,
+            ),
+            openapi.Parameter(
+                "top_k",
+                openapi.IN_QUERY,
+                description="Number of most frequent values reported per column",
+                type=openapi.TYPE_INTEGER,
+                default=10,
+            ),
+        ],
+        responses={
+            status.HTTP_200_OK: openapi.Response(
+                description="Dataset profile",
+                examples={
+                    "application/json": {
+                        "version": "4c8cbca2...",
+                        "row_count": 12,
+                        "columns": {
+                            "Cost ($)": {
+                                "dtype": "float64",
+                                "count": 8,
+                                "null_count": 4,
+                                "distinct": 5,
+                                "top_values": [{"value": 0.02, "count": 3}],
+                                "histogram": {"edges": [0.0, 18.88, 37.75], "counts": [7, 1]},
+                            }
+                        },
+                        "nulls": {"columns": ["Cost ($)"], "matrix": [[4]]},
+                        "correlation": {
+                            "columns": ["Cost ($)"],
+                            "pearson": [[1.0]],
+                            "spearman": [[1.0]],
+                        },
+                    }
+                },
+            ),
+            status.HTTP_400_BAD_REQUEST: "Invalid dataset_id or parameters",
+        },
+    )
+    def list(self, request, *args, **kwargs):
+        try:
+            dataset = DataSet.objects.get(id=request.query_params.get("dataset_id"))
+            path = profile_dataset(
+                dataset,
+                bins=int(request.query_params.get("bins", 20)),
+                top_k=int(request.query_params.get("top_k", 10)),
+            )
+        except Exception as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return FileResponse(open(path, "rb"), content_type="application/json")
+
+
+def list_param(data, key):
+    """A list from request data given as a JSON list, repeated keys or a string."""
+    value = data.getlist(key) if hasattr(data, "getlist") else data.get(key)
+    if isinstance(value, list):
+        if len(value) == 1 and isinstance(value[0], str):
+            return parse_list(value[0])
+        return value
+    return parse_list(value) if isinstance(value, str) else []
+
+
+class CombineDatasetsView(generics.CreateAPIView):
+    permission_classes = [IsAuthenticated]
+    serializer_class = DataSetSerializer
+
+    @swagger_auto_schema(
+        tags=["Data Analysis"],
+        operation_description=(
+            "Union or join two or more datasets, optionally grouping and "
+            "aggregating the result, on the columnar engine. The result is "
+            "streamed back, or saved as a new Parquet dataset with save=true."
+        ),
+        request_body=openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            properties={
+                "dataset_ids": openapi.Schema(
+                    type=openapi.TYPE_ARRAY,
+                    items=openapi.Schema(type=openapi.TYPE_INTEGER),
+                    description="Datasets to combine, in order",
+                ),
+                "how": openapi.Schema(
+                    type=openapi.TYPE_STRING,
+                    enum=COMBINE_MODES,
+                    default="union",
+                    description=(
+                        "union stacks rows and adds a dataset_id column; the "
+                        "others are hash joins on the 'on' columns"
+                    ),
+                ),
+                "on": openapi.Schema(
+                    type=openapi.TYPE_ARRAY,
+                    items=openapi.Schema(type=openapi.TYPE_STRING),
+                    description=(
+                        "Join keys. Clashing columns of a joined dataset get a "
+                        "_<dataset id> suffix"
+                    ),
+                ),
+                "group_by": openapi.Schema(
+                    type=openapi.TYPE_ARRAY,
+                    items=openapi.Schema(type=openapi.TYPE_STRING),
+                    description="Columns to group the combined rows by",
+                ),
+                "aggregations": openapi.Schema(
+                    type=openapi.TYPE_ARRAY,
+                    items=openapi.Schema(type=openapi.TYPE_STRING),
+                    description=(
+                        "column:function pairs, with function one of "
+                        + ", ".join(GROUP_AGGREGATIONS)
+                    ),
+                ),
+                "output": openapi.Schema(
+                    type=openapi.TYPE_STRING,
+                    enum=["jsonl", "arrow"],
+                    description="jsonl (default) or arrow (Arrow IPC stream)",
+                ),
+                "save": openapi.Schema(
+                    type=openapi.TYPE_BOOLEAN,
+                    default=False,
+                    description="Store the result as a new dataset instead",
+                ),
+                "name": openapi.Schema(
+                    type=openapi.TYPE_STRING,
+                    description="Name of the saved dataset",
+                ),
+            },
+            required=["dataset_ids"],
+        ),
+        responses={
+            status.HTTP_200_OK: openapi.Response(
+                description="Combined rows, one JSON object per line or an Arrow IPC stream",
+                examples={
+                    "application/x-ndjson": '{"dataset_id": 3, "Cost ($)_sum": 37.75}'
+                },
+            ),
+            status.HTTP_201_CREATED: openapi.Response(
+                description="Saved dataset", schema=DataSetSerializer
+            ),
+            status.HTTP_400_BAD_REQUEST: "Invalid dataset_ids or parameters",
+        },
+    )
+    def create(self, request, *args, **kwargs):
+        data = request.data
+        output = data.get("output", "jsonl")
+        save = str(data.get("save", "")).lower() in ("1", "true", "yes")
+        try:
+            ids = [int(value) for value in list_param(data, "dataset_ids")]
+            found = DataSet.objects.in_bulk(ids)
+            missing = [value for value in ids if value not in found]
+            if missing:
+                raise ValueError(f"Invalid dataset_id: {missing[0]}")
+            if output not in ("jsonl", "arrow"):
+                raise ValueError("output must be jsonl or arrow")
+            table = combine_datasets(
+                [found[value] for value in ids],
+                how=data.get("how", "union"),
+                on=list_param(data, "on"),
+                group_by=list_param(data, "group_by"),
+                aggregations=list_param(data, "aggregations"),
+            )
+            if save:
+                dataset = save_table(table, data.get("name") or "combined")
+        except Exception as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        if save:
+            return Response(
+                DataSetSerializer(dataset, context={"request": request}).data,
+                status=status.HTTP_201_CREATED,
+            )
+        if output == "arrow":
+            return StreamingHttpResponse(
+                stream_arrow(table.schema, iter(table.to_batches())),
+                content_type="application/vnd.apache.arrow.stream",
+            )
+        return StreamingHttpResponse(
+            stream_json_lines(iter(table.to_batches())),
+            content_type="application/x-ndjson",
+        )
+
+
 # class DataSetViewSet(viewsets.ModelViewSet):
 #     queryset = DataSet.objects.all()
 #     serializer_class = DataSetSerializer
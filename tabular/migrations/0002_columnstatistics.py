@@ -0,0 +1,52 @@
+# Generated by Django 4.2 on 2026-10-18 05:59
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tabular", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ColumnStatistics",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("position", models.PositiveIntegerField()),
+                ("column", models.CharField(max_length=255)),
+                ("dtype", models.CharField(max_length=64)),
+                ("count", models.BigIntegerField()),
+                ("null_count", models.BigIntegerField()),
+                ("mean", models.FloatField(blank=True, null=True)),
+                ("median", models.FloatField(blank=True, null=True)),
+                ("mode", models.JSONField(blank=True, null=True)),
+                ("q1", models.FloatField(blank=True, null=True)),
+                ("q3", models.FloatField(blank=True, null=True)),
+                ("min", models.FloatField(blank=True, null=True)),
+                ("max", models.FloatField(blank=True, null=True)),
+                (
+                    "dataset",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="column_statistics",
+                        to="tabular.dataset",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["dataset", "position"],
+                "unique_together": {("dataset", "column")},
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2 on 2026-10-18 06:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tabular", "0002_columnstatistics"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="columnstatistics",
+            name="exact_quantiles",
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddField(
+            model_name="columnstatistics",
+            name="sketch",
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
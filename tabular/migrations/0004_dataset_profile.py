@@ -0,0 +1,33 @@
+# Generated by Django 4.2 on 2026-10-18 06:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tabular", "0003_column_statistics_sketch"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="dataset",
+            name="content_hash",
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name="dataset",
+            name="header_row",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="dataset",
+            name="row_count",
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="dataset",
+            name="schema",
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2 on 2026-10-18 06:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tabular", "0004_dataset_profile"),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name="dataset",
+            name="header_row",
+        ),
+        migrations.AddField(
+            model_name="dataset",
+            name="parse_plan",
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
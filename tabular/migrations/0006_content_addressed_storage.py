@@ -0,0 +1,22 @@
+# Generated by Django 4.2 on 2026-10-18 06:08
+
+import corporatica.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tabular", "0005_dataset_parse_plan"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="dataset",
+            name="file",
+            field=models.FileField(
+                storage=corporatica.storage.ContentAddressedStorage(),
+                upload_to=corporatica.storage.ContentAddressedPath("uploads"),
+            ),
+        ),
+    ]
@@ -0,0 +1,81 @@
+# Generated by Django 4.2 on 2026-10-18 06:16
+
+import corporatica.storage
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def copy_content_hash(apps, schema_editor):
+    DataSet = apps.get_model("tabular", "DataSet")
+    DataSet.objects.update(version=models.F("content_hash"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tabular", "0006_content_addressed_storage"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="columnstatistics",
+            name="frequencies",
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="dataset",
+            name="version",
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.RunPython(copy_content_hash, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name="DataSetSegment",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(
+                        auto_now_add=True, verbose_name="Created Date/Time"
+                    ),
+                ),
+                (
+                    "updated_at",
+                    models.DateTimeField(
+                        auto_now=True, verbose_name="Update Date/Time"
+                    ),
+                ),
+                (
+                    "file",
+                    models.FileField(
+                        storage=corporatica.storage.ContentAddressedStorage(),
+                        upload_to=corporatica.storage.ContentAddressedPath("uploads"),
+                    ),
+                ),
+                (
+                    "content_hash",
+                    models.CharField(blank=True, db_index=True, max_length=64),
+                ),
+                ("parse_plan", models.JSONField(blank=True, null=True)),
+                ("row_count", models.BigIntegerField(blank=True, null=True)),
+                (
+                    "dataset",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="segments",
+                        to="tabular.dataset",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["dataset", "id"],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-18 06:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tabular", "0007_dataset_segments"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="dataset",
+            name="format",
+            field=models.CharField(default="csv", max_length=16),
+        ),
+    ]
@@ -1,10 +1,102 @@
 from django.db import models
+from corporatica.storage import ContentAddressedPath, ContentAddressedStorage
 from user.models import TimestampedModel
 
 
 class DataSet(TimestampedModel):
+    """
+    An uploaded table: a CSV, Excel (xlsx, xls, ods), JSON (lines or array)
+    or Parquet file.
+
+    :format: the file's format, detected from its contents at upload.
+    :content_hash: SHA-256 of the file, computed while it was uploaded. Files
+        are stored under this hash, so identical uploads share one blob and
+        one set of derived caches.
+    :parse_plan: how to read a CSV file -- delimiter, preamble lines to skip
+        (``skiprows``), decimal and thousands separators, per-column date
+        formats and the key/value metadata found in the preamble.
+    :row_count: number of data rows below the header, appended rows included.
+    :schema: inferred columns, as a list of ``{"name": ..., "type": ...}``;
+        for formats other than CSV it is filled in when the file is first
+        converted.
+    :version: identifies the full contents -- the file plus any appended
+        segments. Equal to ``content_hash`` until rows are appended; derived
+        caches are keyed by it.
+    """
+
     name = models.CharField(max_length=255)
-    file = models.FileField(upload_to="uploads/")
+    file = models.FileField(
+        upload_to=ContentAddressedPath("uploads"), storage=ContentAddressedStorage()
+    )
+    format = models.CharField(max_length=16, default="csv")
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True)
+    parse_plan = models.JSONField(null=True, blank=True)
+    row_count = models.BigIntegerField(null=True, blank=True)
+    schema = models.JSONField(null=True, blank=True)
+    version = models.CharField(max_length=64, blank=True, db_index=True)
 
     def __str__(self):
         return self.name
+
+
+class DataSetSegment(TimestampedModel):
+    """
+    Rows appended to a dataset after its initial upload, stored as their own
+    content-addressed file with the same columns as the dataset.
+
+    :parse_plan: how to read this file, detected when it was appended.
+    :row_count: number of data rows in this file.
+    """
+
+    dataset = models.ForeignKey(
+        DataSet, on_delete=models.CASCADE, related_name="segments"
+    )
+    file = models.FileField(
+        upload_to=ContentAddressedPath("uploads"), storage=ContentAddressedStorage()
+    )
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True)
+    parse_plan = models.JSONField(null=True, blank=True)
+    row_count = models.BigIntegerField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["dataset", "id"]
+
+    def __str__(self):
+        return f"{self.dataset}: {self.file.name}"
+
+
+class ColumnStatistics(models.Model):
+    """
+    Per-column summary of a dataset, computed once when its file changes.
+
+    Numeric fields are left empty for non-numeric columns. ``sketch`` holds
+    the column's serialised t-digest and ``frequencies`` its most common
+    values as ``[value, count]`` pairs, so appended rows can be merged in
+    without rescanning the file.
+    """
+
+    dataset = models.ForeignKey(
+        DataSet, on_delete=models.CASCADE, related_name="column_statistics"
+    )
+    position = models.PositiveIntegerField()
+    column = models.CharField(max_length=255)
+    dtype = models.CharField(max_length=64)
+    count = models.BigIntegerField()
+    null_count = models.BigIntegerField()
+    mean = models.FloatField(null=True, blank=True)
+    median = models.FloatField(null=True, blank=True)
+    mode = models.JSONField(null=True, blank=True)
+    q1 = models.FloatField(null=True, blank=True)
+    q3 = models.FloatField(null=True, blank=True)
+    min = models.FloatField(null=True, blank=True)
+    max = models.FloatField(null=True, blank=True)
+    exact_quantiles = models.BooleanField(default=True)
+    sketch = models.JSONField(null=True, blank=True)
+    frequencies = models.JSONField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["dataset", "position"]
+        unique_together = ["dataset", "column"]
+
+    def __str__(self):
+        return f"{self.dataset}: {self.column}"
@@ -1,3 +1,462 @@
-from django.test import TestCase
+import os
+import shutil
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework.test import APIRequestFactory, force_authenticate
+from user.models import User
+
+from .api.profiling import Comoments, build_profile
+from .api.sketches import ColumnSummary, HyperLogLog, Reservoir, TDigest
+from .api.uploadhandler import CSVProfiler, DataSetUploadHandler
+from .api.utils import (
+    QUARTILES,
+    approximate_statistics,
+    build_sidecar,
+    compute_statistics,
+    sidecar_parts,
+    sidecar_path,
+)
+from .api.views import AppendDatasetView, UpdateDatasetView, UploadFileView
+from .models import DataSet, DataSetSegment
+
+BILLING_CSV = os.path.join(
+    settings.BASE_DIR,
+    "uploads",
+    "My_Billing_Account_Cost_table_2024-10-01__2024-10-31.csv",
+)
+BILLING_NUMERIC = ["Usage amount", "Unrounded Cost ($)", "Cost ($)"]
+
+
+def read_billing():
+    """The billing export's table, as pandas reads it below its preamble."""
+    return pd.read_csv(BILLING_CSV, skiprows=8, thousands=",")
+
+
+def rank_errors(values, estimates, quantiles):
+    """How far each estimate's rank among ``values`` is from its quantile."""
+    values = np.sort(values)
+    ranks = np.searchsorted(values, estimates) / len(values)
+    return np.abs(ranks - np.asarray(quantiles))
+
+
+class DatasetTestCase(TestCase):
+    """Uploads datasets through the API into a throwaway media directory."""
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        media_settings = override_settings(
+            MEDIA_ROOT=media,
+            TABULAR_CACHE_DIR=os.path.join(media, "cache", "tabular"),
+        )
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        self.user = User.objects.create(username="analyst")
+        self.factory = APIRequestFactory()
+
+    def call(self, view, method, data=None, format=None):
+        request = getattr(self.factory, method)("/api/tabular/", data, format=format)
+        force_authenticate(request, user=self.user)
+        return view.as_view()(request)
+
+    def upload(self, content, name="data.csv"):
+        response = self.call(
+            UploadFileView,
+            "post",
+            {"file": SimpleUploadedFile(name, content)},
+            "multipart",
+        )
+        self.assertEqual(response.status_code, 201, response.data)
+        return DataSet.objects.get(id=response.data["data"]["id"])
+
+    def append(self, dataset, content, name="rows.csv"):
+        return self.call(
+            AppendDatasetView,
+            "post",
+            {"dataset_id": dataset.id, "file": SimpleUploadedFile(name, content)},
+            "multipart",
+        )
+
+    def upload_billing(self):
+        with open(BILLING_CSV, "rb") as f:
+            return self.upload(f.read(), os.path.basename(BILLING_CSV))
+
+
+class TDigestTests(SimpleTestCase):
+    quantiles = [0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.99]
+
+    def test_quantiles_match_numpy(self):
+        values = np.random.default_rng(0).lognormal(size=100_000)
+        digest = TDigest()
+        digest.update(values)
+        estimates = digest.quantile(self.quantiles)
+        self.assertLess(rank_errors(values, estimates, self.quantiles).max(), 0.005)
+        self.assertEqual(digest.quantile(0), values.min())
+        self.assertEqual(digest.quantile(1), values.max())
+
+    def test_merged_chunks_match_numpy(self):
+        values = np.random.default_rng(1).normal(size=200_000)
+        digest = TDigest()
+        for chunk in np.array_split(values, 200):
+            part = TDigest()
+            part.update(chunk)
+            digest.merge(TDigest.from_dict(part.to_dict()))
+        self.assertEqual(digest.count, len(values))
+        self.assertLessEqual(len(digest.means), digest.compression)
+        estimates = digest.quantile(self.quantiles)
+        self.assertLess(rank_errors(values, estimates, self.quantiles).max(), 0.005)
+        np.testing.assert_allclose(
+            estimates, np.quantile(values, self.quantiles), atol=0.02
+        )
+
+    def test_skips_missing_values(self):
+        digest = TDigest()
+        digest.update([np.nan, 1.0, 2.0, 3.0, np.nan])
+        self.assertEqual(digest.count, 3)
+        self.assertTrue(np.isnan(TDigest().quantile(0.5)))
+
+
+class ColumnSummaryTests(SimpleTestCase):
+    def test_chunks_match_whole_column(self):
+        rng = np.random.default_rng(2)
+        series = pd.Series(rng.integers(0, 50, 10_000), dtype="float64")
+        series[rng.choice(len(series), 300, replace=False)] = np.nan
+        summary = ColumnSummary(numeric=True)
+        for start in range(0, len(series), 999):
+            summary.update(series[start : start + 999])
+        self.assertEqual(summary.count, series.count())
+        self.assertEqual(summary.null_count, series.isna().sum())
+        self.assertAlmostEqual(summary.mean, series.mean())
+        self.assertEqual((summary.min, summary.max), (series.min(), series.max()))
+        self.assertEqual(summary.mode, series.mode().min())
+
+    def test_text_column(self):
+        summary = ColumnSummary(numeric=False)
+        summary.update(pd.Series(["b", "a", None]))
+        summary.update(pd.Series(["a", "b", "c"]))
+        self.assertEqual((summary.count, summary.null_count), (5, 1))
+        self.assertEqual(summary.mode, "a")
+        self.assertIsNone(summary.mean)
+
+
+class ReservoirTests(SimpleTestCase):
+    def test_sample_is_bounded(self):
+        reservoir = Reservoir(100, seed=0)
+        for start in range(0, 1000, 37):
+            reservoir.update(pd.DataFrame({"row": range(start, min(start + 37, 1000))}))
+        self.assertEqual(reservoir.seen, 1000)
+        self.assertEqual(len(reservoir.sample), 100)
+        self.assertTrue(reservoir.sample["row"].is_unique)
+
+    def test_rows_are_equally_likely(self):
+        rows, capacity, trials = 100, 10, 2000
+        kept = np.zeros(rows)
+        for seed in range(trials):
+            reservoir = Reservoir(capacity, seed=seed)
+            for start in range(0, rows, 7):
+                reservoir.update(
+                    pd.DataFrame({"row": range(start, min(start + 7, rows))})
+                )
+            kept[reservoir.sample["row"].to_numpy()] += 1
+        # Each row is kept in 200 trials on average, with a deviation of ~13.
+        expected = trials * capacity / rows
+        self.assertLess(np.abs(kept - expected).max(), 70)
+        self.assertLess(abs(kept[: rows // 2].sum() - kept[rows // 2 :].sum()), 600)
+
+
+class HyperLogLogTests(SimpleTestCase):
+    def test_small_cardinality(self):
+        sketch = HyperLogLog()
+        sketch.update(pd.Series(np.tile(np.arange(100), 50)))
+        self.assertEqual(round(sketch.estimate), 100)
+
+    def test_large_cardinality(self):
+        values = pd.Series(np.random.default_rng(4).integers(0, 1 << 40, 300_000))
+        sketch = HyperLogLog()
+        sketch.update(values)
+        distinct = values.nunique()
+        # Four standard errors (0.8% each) at the default precision.
+        self.assertLess(abs(sketch.estimate - distinct) / distinct, 0.035)
+
+    def test_merge_equals_single_pass(self):
+        values = pd.Series([f"customer-{n}" for n in range(50_000)] + [None] * 10)
+        single = HyperLogLog()
+        single.update(values)
+        merged = HyperLogLog()
+        for start in range(0, len(values), 7_000):
+            part = HyperLogLog()
+            part.update(values[start : start + 7_000])
+            merged.merge(part)
+        np.testing.assert_array_equal(merged.registers, single.registers)
+        self.assertEqual(merged.estimate, single.estimate)
+
+
+class ComomentsTests(SimpleTestCase):
+    def test_pearson_matches_numpy(self):
+        rng = np.random.default_rng(5)
+        x = rng.normal(1000, 5, 5_000)
+        values = np.column_stack(
+            [x, 3 * x + rng.normal(0, 10, 5_000), rng.normal(size=5_000)]
+        )
+        values[rng.random(values.shape) < 0.1] = np.nan
+        moments = Comoments(np.nanmean(values, axis=0))
+        for chunk in np.array_split(values, 13):
+            moments.update(chunk)
+        correlation = moments.correlation()
+        for i in range(3):
+            for j in range(3):
+                both = ~np.isnan(values[:, i]) & ~np.isnan(values[:, j])
+                expected = np.corrcoef(values[both, i], values[both, j])[0, 1]
+                self.assertAlmostEqual(correlation[i, j], expected)
+
+
+class ProfileTests(DatasetTestCase):
+    def test_profile(self):
+        rng = np.random.default_rng(6)
+        frame = pd.DataFrame(
+            {
+                "price": rng.normal(50, 10, 2_000).round(2),
+                "flag": 7,
+                "code": rng.choice(["a", "b", "c", "d"], 2_000),
+            }
+        )
+        frame["cost"] = (frame["price"] * 0.8 + rng.normal(0, 2, 2_000)).round(2)
+        frame.loc[::10, "cost"] = np.nan
+        dataset = self.upload(frame.to_csv(index=False).encode())
+        profile = build_profile(dataset, bins=20)
+
+        self.assertEqual(profile["row_count"], len(frame))
+        columns = profile["columns"]
+        self.assertEqual(columns["code"]["distinct"], 4)
+        self.assertEqual(columns["flag"]["distinct"], 1)
+        self.assertEqual(columns["cost"]["null_count"], 200)
+        price = columns["price"]["histogram"]
+        self.assertEqual(len(price["counts"]), 20)
+        self.assertEqual(sum(price["counts"]), len(frame))
+        self.assertEqual(
+            price["counts"],
+            np.histogram(frame["price"], bins=price["edges"])[0].tolist(),
+        )
+        # A constant column gets one bin, not twenty empty ones.
+        self.assertEqual(
+            columns["flag"]["histogram"], {"edges": [7.0, 7.0], "counts": [len(frame)]}
+        )
+
+        correlation = profile["correlation"]
+        self.assertEqual(correlation["columns"], ["price", "flag", "cost"])
+        both = frame["cost"].notna()
+        expected = np.corrcoef(frame["price"][both], frame["cost"][both])[0, 1]
+        self.assertAlmostEqual(correlation["pearson"][0][2], expected)
+        self.assertAlmostEqual(correlation["pearson"][2][0], expected)
+        self.assertIsNone(correlation["pearson"][0][1])
+        nulls = dict(zip(profile["nulls"]["columns"], profile["nulls"]["matrix"]))
+        self.assertEqual(nulls["cost"][3], 200)
+
+
+class UploadHandlerTests(SimpleTestCase):
+    def receive(self, content, name="data.csv"):
+        handler = DataSetUploadHandler()
+        handler.new_file("file", name, "text/csv", len(content))
+        handler.receive_data_chunk(content, 0)
+        return handler.file_complete(len(content))
+
+    def test_profiles_csv(self):
+        file = self.receive(b"id,amount\n1,2.5\n2,3\n")
+        self.assertEqual(file.profile["row_count"], 2)
+        self.assertEqual(
+            file.profile["schema"],
+            [{"name": "id", "type": "integer"}, {"name": "amount", "type": "float"}],
+        )
+
+    def test_logs_profiler_failures(self):
+        logger = "tabular.api.uploadhandler"
+        for method in ("feed", "finish"):
+            with mock.patch.object(CSVProfiler, method, side_effect=ValueError):
+                with self.assertLogs(logger, "ERROR") as logs:
+                    file = self.receive(b"id\n1\n", name="broken.csv")
+            self.assertEqual(file.profile, {"format": "csv"})
+            self.assertIn("broken.csv", logs.output[0])
+
+
+class StatisticsTests(DatasetTestCase):
+    def test_exact_statistics(self):
+        dataset = self.upload_billing()
+        expected = read_billing()
+        stored = {stats.column: stats for stats in dataset.column_statistics.all()}
+        self.assertEqual(list(stored), list(expected.columns))
+        for column in BILLING_NUMERIC:
+            values = expected[column]
+            stats = stored[column]
+            self.assertTrue(stats.exact_quantiles)
+            self.assertEqual(stats.count, values.count())
+            self.assertEqual(stats.null_count, values.isna().sum())
+            self.assertAlmostEqual(stats.mean, values.mean())
+            self.assertEqual((stats.min, stats.max), (values.min(), values.max()))
+            self.assertEqual(stats.mode, values.mode().min())
+            np.testing.assert_allclose(
+                [stats.q1, stats.median, stats.q3], values.quantile(QUARTILES)
+            )
+        self.assertEqual(stored["Project name"].mode, "IE-Learn")
+        self.assertEqual(stored["Credit type"].count, 0)
+
+    def test_approximate_statistics(self):
+        dataset = self.upload_billing()
+        expected = read_billing()
+        statistics = approximate_statistics(dataset)
+        # The sample holds every row, so the estimates are exact.
+        self.assertEqual(statistics["population"], len(expected))
+        self.assertEqual(statistics["sample_size"], len(expected))
+        self.assertEqual(statistics["rank_error"], 0)
+        for column in BILLING_NUMERIC:
+            mean = statistics["mean"][column]
+            self.assertAlmostEqual(mean, expected[column].mean())
+            self.assertEqual(statistics["bounds"]["mean"][column], [mean, mean])
+            self.assertAlmostEqual(
+                statistics["median"][column], expected[column].median()
+            )
+
+    def test_budgeted_run_matches_one_pass(self):
+        rng = np.random.default_rng(3)
+        frame = pd.DataFrame(
+            {
+                "amount": rng.lognormal(size=30_000).round(4),
+                "units": rng.integers(0, 40, 30_000),
+                "region": rng.choice(["north", "south", "east"], 30_000),
+            }
+        )
+        dataset = self.upload(frame.to_csv(index=False).encode())
+        one_pass = {stats.column: stats for stats in compute_statistics(dataset)}
+
+        with override_settings(TABULAR_MEMORY_BUDGET=100_000):
+            build_sidecar(dataset)
+            with pa.memory_map(sidecar_parts(sidecar_path(dataset))[0]) as source:
+                self.assertGreater(pa.ipc.open_file(source).num_record_batches, 10)
+            budgeted = {stats.column: stats for stats in compute_statistics(dataset)}
+
+        for column in frame.columns:
+            whole, chunked = one_pass[column], budgeted[column]
+            self.assertEqual(chunked.count, whole.count)
+            self.assertEqual(chunked.null_count, whole.null_count)
+            self.assertEqual(chunked.mode, whole.mode)
+        for column in ["amount", "units"]:
+            whole, chunked = one_pass[column], budgeted[column]
+            self.assertTrue(whole.exact_quantiles)
+            self.assertFalse(chunked.exact_quantiles)
+            self.assertAlmostEqual(chunked.mean, whole.mean)
+            self.assertEqual((chunked.min, chunked.max), (whole.min, whole.max))
+            estimates = [chunked.q1, chunked.median, chunked.q3]
+            exact = [whole.q1, whole.median, whole.q3]
+            if column == "units":
+                # Integer ties: estimates land between neighbouring values.
+                np.testing.assert_allclose(estimates, exact, atol=1)
+            else:
+                errors = rank_errors(frame[column], estimates, QUARTILES)
+                self.assertLess(errors.max(), 0.005)
+
+
+class AppendTests(DatasetTestCase):
+    compared = ["count", "null_count", "mean", "mode", "min", "max", "median"]
+
+    def billing_rows(self):
+        """The billing export's preamble and header with two rows changed."""
+        with open(BILLING_CSV, encoding="utf-8-sig") as f:
+            lines = f.readlines()
+        changed = lines[9].replace("967,386", "1,500,000").replace("10/02", "11/02")
+        return "".join(lines[:9] + [changed, lines[10]]).encode()
+
+    def statistics(self, dataset):
+        return {
+            stats.column: [getattr(stats, name) for name in self.compared]
+            for stats in dataset.column_statistics.all()
+        }
+
+    def test_statistics_match_full_recompute(self):
+        dataset = self.upload_billing()
+        response = self.append(dataset, self.billing_rows())
+        self.assertEqual(response.status_code, 200, response.data)
+        dataset.refresh_from_db()
+        self.assertEqual(dataset.row_count, 12)
+        self.assertEqual(dataset.segments.count(), 1)
+        # The upload's part is reused and only the new rows are parsed.
+        self.assertEqual(len(sidecar_parts(sidecar_path(dataset))), 2)
+        self.assertFalse(
+            dataset.column_statistics.get(column="Cost ($)").exact_quantiles
+        )
+        appended = self.statistics(dataset)
+        self.assertEqual(appended["Usage amount"][0], 8)
+        self.assertEqual(appended["Usage amount"][5], 22003951)
+
+        compute_statistics(dataset)
+        recomputed = self.statistics(dataset)
+        self.assertEqual(list(appended), list(recomputed))
+        for column, values in appended.items():
+            for name, value, expected in zip(self.compared, values, recomputed[column]):
+                if isinstance(expected, float):
+                    self.assertAlmostEqual(value, expected, msg=f"{column} {name}")
+                else:
+                    self.assertEqual(value, expected, f"{column} {name}")
+        self.assertEqual(approximate_statistics(dataset)["population"], 12)
+
+    def test_numeric_rows(self):
+        rng = np.random.default_rng(7)
+        frame = pd.DataFrame(
+            {
+                "value": rng.normal(size=6_000).round(3),
+                "group": rng.integers(0, 9, 6_000),
+            }
+        )
+        dataset = self.upload(frame[:4_000].to_csv(index=False).encode())
+        response = self.append(dataset, frame[4_000:].to_csv(index=False).encode())
+        self.assertEqual(response.status_code, 200, response.data)
+        appended = self.statistics(dataset)
+        for column in frame.columns:
+            count, nulls, mean, mode, low, high, median = appended[column]
+            values = frame[column]
+            self.assertEqual([count, nulls], [len(values), 0])
+            self.assertEqual([low, high], [values.min(), values.max()])
+            self.assertEqual(mode, values.mode().min())
+            self.assertAlmostEqual(mean, values.mean())
+        # Merged t-digest medians; the integer column's lie between ties.
+        self.assertLess(
+            rank_errors(frame["value"], [appended["value"][6]], [0.5]), 0.01
+        )
+        self.assertLessEqual(abs(appended["group"][6] - frame["group"].median()), 1)
+
+    def test_mismatched_columns_are_rejected(self):
+        dataset = self.upload_billing()
+        before = self.statistics(dataset)
+        response = self.append(dataset, b"a,b\n1,2\n")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("same columns", response.data["error"])
+        dataset.refresh_from_db()
+        self.assertEqual(dataset.row_count, 10)
+        self.assertFalse(DataSetSegment.objects.exists())
+        self.assertEqual(self.statistics(dataset), before)
+
+    def test_update_clears_segments(self):
+        dataset = self.upload_billing()
+        self.assertEqual(self.append(dataset, self.billing_rows()).status_code, 200)
+        response = self.call(
+            UpdateDatasetView,
+            "put",
+            {
+                "dataset_id": dataset.id,
+                "name": "replaced.csv",
+                "file": SimpleUploadedFile("replaced.csv", b"id,amount\n1,5\n2,7\n"),
+            },
+            "multipart",
+        )
+        self.assertEqual(response.status_code, 200, response.data)
+        dataset.refresh_from_db()
+        self.assertFalse(DataSetSegment.objects.exists())
+        self.assertEqual(dataset.row_count, 2)
+        self.assertEqual(dataset.version, dataset.content_hash)
+        self.assertEqual(len(sidecar_parts(sidecar_path(dataset))), 1)
+        self.assertEqual(dataset.column_statistics.get(column="amount").mean, 6)
@@ -5,9 +5,9 @@ from sklearn.manifold import TSNE
 from nltk.corpus import stopwords
 from gensim.summarization import summarize
 from textblob import TextBlob
-import matplotlib.pyplot as plt
-import seaborn as sns
 import io
+from corporatica.rendering import render_scatter
+from corporatica.workers import render
 import numpy as np
 from sklearn.metrics.pairwise import cosine_similarity
 
@@ -43,12 +43,10 @@ def tsne_visualization(texts):
     tsne = TSNE(n_components=2)
     tsne_results = tsne.fit_transform(X)
 
-    plt.figure(figsize=(8, 6))
-    sns.scatterplot(x=tsne_results[:, 0], y=tsne_results[:, 1])
-    buf = io.BytesIO()
-    plt.savefig(buf, format="png")
-    buf.seek(0)
-    return buf
+    png = render(
+        render_scatter, tsne_results[:, 0], tsne_results[:, 1], figsize=(8, 6)
+    )
+    return io.BytesIO(png)
 
 def search_texts(query, texts):
     """Search for relevant texts based on the query."""
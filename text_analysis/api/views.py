@@ -7,7 +7,6 @@ from rake_nltk import Rake
 from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
 from textblob import TextBlob
 from sklearn.manifold import MDS
-import matplotlib.pyplot as plt
 import whoosh.index as index
 from whoosh.fields import Schema, TEXT
 from whoosh.qparser import QueryParser
@@ -19,6 +18,8 @@ from rest_framework import status
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 from .serializer import TextInputSerializer
+from corporatica.rendering import render_scatter
+from corporatica.workers import render
 
 # Initialize models and components
 sia = SentimentIntensityAnalyzer()
@@ -188,9 +189,9 @@ class MDSVisualizer(generics.CreateAPIView):
         vectors = np.random.rand(len(text), 100)  # Fake 100-dimensional vectors
         mds = MDS(n_components=2)
         mds_results = mds.fit_transform(vectors)
-        plt.scatter(mds_results[:, 0], mds_results[:, 1])
-        plt.title("MDS Visualization")
-        plt.savefig("mds_plot.png")
+        png = render(render_scatter, mds_results[:, 0], mds_results[:, 1], title="MDS Visualization")
+        with open("mds_plot.png", "wb") as output:
+            output.write(png)
         return JsonResponse({"message": "MDS visualization generated"})
 
 # SEARCH VIEW (using Whoosh)